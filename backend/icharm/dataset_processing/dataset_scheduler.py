@@ -0,0 +1,182 @@
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NETWORK_SLOTS = 2
+DEFAULT_CPU_WORKERS = 2
+DEFAULT_DB_CONNECTIONS = 2
+
+
+class SchedulerError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ResourceSlots:
+    """
+    Budgets shared by the running datasets, each stage of a dataset holds the
+    matching slot: downloads `network`, conversions `cpu`, ingests `db`. A stage
+    needing several takes them in that order (so two stages can't deadlock)
+    """
+
+    network: AbstractContextManager = field(default_factory=nullcontext)
+    cpu: AbstractContextManager = field(default_factory=nullcontext)
+    db: AbstractContextManager = field(default_factory=nullcontext)
+
+
+@dataclass
+class DatasetJob:
+    name: str
+    details: dict[str, Any]
+    priority: int = 0  # Higher starts first among the datasets ready to run
+    after: list[str] = field(default_factory=list)  # Names that must finish first
+
+
+class DatasetScheduler:
+    """
+    Runs datasets concurrently, each in its own process (netCDF / HDF5 can't
+    be used from several threads). A dataset starts once everything it comes
+    `after` is done, by priority then in the given order. When one fails the
+    datasets depending on it are skipped and the others carry on
+    """
+
+    def __init__(
+        self,
+        network_slots: int = DEFAULT_NETWORK_SLOTS,
+        cpu_workers: int = DEFAULT_CPU_WORKERS,
+        db_connections: int = DEFAULT_DB_CONNECTIONS,
+    ) -> None:
+        if min(network_slots, cpu_workers, db_connections) < 1:
+            raise ValueError("Every resource budget must be at least 1")
+        self.network_slots = network_slots
+        self.cpu_workers = cpu_workers
+        self.db_connections = db_connections
+        return
+
+    @staticmethod
+    def resolve_after(
+        jobs: list[DatasetJob], aliases: dict[str, str], unscheduled: set[str]
+    ) -> None:
+        """
+        Rewrite the `after` names of the jobs in place: `aliases` (other names
+        of a job) become the job name, and the datasets in `unscheduled` (known
+        but not run this time) are dropped as already done. Anything else is
+        left for check_jobs to reject
+        """
+        for job in jobs:
+            after = []
+            for name in job.after:
+                name = aliases.get(name, name)
+                if name in unscheduled:
+                    logger.warning(
+                        f"{job.name} comes after {name}, which isn't processed "
+                        "in this run, treating it as done"
+                    )
+                elif name not in after:
+                    after.append(name)
+            job.after = after
+        return
+
+    @staticmethod
+    def check_jobs(jobs: list[DatasetJob]) -> None:
+        """Raises ValueError on duplicate names, unknown or circular dependencies"""
+        names = [job.name for job in jobs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate dataset names: {duplicates}")
+
+        after_by_name = {job.name: job.after for job in jobs}
+        for job in jobs:
+            unknown = [name for name in job.after if name not in after_by_name]
+            if unknown:
+                raise ValueError(f"{job.name} comes after unknown datasets {unknown}")
+
+        # Remove the datasets with nothing left to wait on until none are left
+        remaining = dict(after_by_name)
+        while remaining:
+            ready = [
+                name
+                for name, after in remaining.items()
+                if not any(a in remaining for a in after)
+            ]
+            if not ready:
+                raise ValueError(f"Circular dependencies between {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+        return
+
+    def run(
+        self,
+        jobs: list[DatasetJob],
+        target: Callable[..., None],
+        *args,
+    ) -> None:
+        """
+        Calls `target(job.details, slots, *args)` for every job, `target` and
+        `args` have to be picklable (a module level function)
+        """
+        self.check_jobs(jobs)
+        # Jobs waiting on a slot hold a process, enough that every slot is used
+        max_jobs = self.network_slots + self.cpu_workers + self.db_connections
+        context = multiprocessing.get_context("spawn")
+
+        pending = {job.name: (idx, job) for idx, job in enumerate(jobs)}
+        done: set[str] = set()
+        failures: dict[str, Exception] = {}
+        skipped: list[str] = []
+        running: dict[Future, str] = {}
+        with context.Manager() as manager:
+            slots = ResourceSlots(
+                network=manager.BoundedSemaphore(self.network_slots),
+                cpu=manager.BoundedSemaphore(self.cpu_workers),
+                db=manager.BoundedSemaphore(self.db_connections),
+            )
+            with ProcessPoolExecutor(
+                max_workers=max_jobs, mp_context=context
+            ) as executor:
+                while pending or running:
+                    # Skip everything behind a failure
+                    for name, (_, job) in list(pending.items()):
+                        if any(a in failures or a in skipped for a in job.after):
+                            logger.error(f"Skipping {name}, a dataset it needs failed")
+                            skipped.append(name)
+                            del pending[name]
+
+                    ready = sorted(
+                        (
+                            (-job.priority, idx, name)
+                            for name, (idx, job) in pending.items()
+                            if all(a in done for a in job.after)
+                        )
+                    )
+                    for _, _, name in ready[: max_jobs - len(running)]:
+                        _, job = pending.pop(name)
+                        logger.info(f"Starting {name}")
+                        future = executor.submit(target, job.details, slots, *args)
+                        running[future] = name
+
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        try:
+                            future.result()
+                        except Exception as e:
+                            logger.error(f"{name} failed: {e}")
+                            failures[name] = e
+                        else:
+                            logger.info(f"Finished {name}")
+                            done.add(name)
+
+        if failures or skipped:
+            raise SchedulerError(
+                f"{len(failures)} datasets failed {sorted(failures)}, "
+                f"{len(skipped)} skipped {sorted(skipped)}"
+            )
+        return
@@ -6,6 +6,12 @@ import requests
 import shutil
 from typing import Any, Dict
 
+from icharm.dataset_processing.zarr_profiles import (
+    DEFAULT_PROFILE,
+    ZarrConverter,
+    ZarrProfile,
+)
+
 
 def _prepare_for_zarr(ds: xr.Dataset) -> xr.Dataset:
     """
@@ -68,6 +74,12 @@ def main():
         print(f"Zarr path: {local_zarr_path}")
         print(f"Source URL: {source_url}")
 
+        # Chunk layout(s) of the store, see zarr_profiles.PROFILES
+        zarr_profile = row.get("zarrProfile")
+        if pandas.isna(zarr_profile):
+            zarr_profile = DEFAULT_PROFILE
+        converter = ZarrConverter(ZarrProfile(name=zarr_profile))
+
         # Skip if Zarr already exists
         if local_zarr_path.exists():
             print("Zarr store already exists, skipping...")
@@ -94,7 +106,7 @@ def main():
         try:
             with _open_dataset(temp_nc_file, decode_times=True) as ds:
                 _prepare_for_zarr(ds)
-                ds.to_zarr(local_zarr_path, mode="w", consolidated=True)
+                converter.write(ds, local_zarr_path)
             print(f"Zarr store created: {local_zarr_path}")
         except Exception as e:
             print(f"Failed to convert {temp_nc_file} to Zarr: {e}")
@@ -102,7 +114,7 @@ def main():
             try:
                 with _open_dataset(temp_nc_file, decode_times=False) as ds:
                     _prepare_for_zarr(ds)
-                    ds.to_zarr(local_zarr_path, mode="w", consolidated=True)
+                    converter.write(ds, local_zarr_path)
                 print(f"Zarr store created with decode_times=False: {local_zarr_path}")
             except Exception as e2:
                 print(f"Failed again: {e2}")
@@ -1,20 +1,42 @@
 from datetime import datetime
+import itertools
 import os
+import time
 import pandas
 import logging
 import xarray as xr
 from pathlib import Path
 import shutil
-from typing import Any, Dict
-
+from typing import Any, Dict, Iterator
+
+from icharm.dataset_processing.dataset_scheduler import (
+    DEFAULT_CPU_WORKERS,
+    DEFAULT_DB_CONNECTIONS,
+    DEFAULT_NETWORK_SLOTS,
+    DatasetJob,
+    DatasetScheduler,
+    ResourceSlots,
+)
 from icharm.dataset_processing.downloaders.downloaders import Downloaders
 from icharm.dataset_processing.downloaders.ftp_globber import FtpGlobber
+from icharm.dataset_processing.downloaders.parallel_downloader import DownloadResult
 from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_by_year import (
     NetCDFtoDbYearlyFiles,
 )
 from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_simple import NetCDFtoDbSimple
+from icharm.dataset_processing.zarr_profiles import (
+    DEFAULT_PROFILE,
+    ZarrConverter,
+    ZarrProfile,
+)
 from icharm.utils.logger import setup_logging
 
+# Directory listings of the FTP servers, kept between runs
+FTP_LISTING_CACHE_NAME = ".ftp_listing_cache.json"
+
+# Files downloaded ahead of the ingest when the two are pipelined
+PIPELINE_MAX_PENDING = 16
+
 
 class DownloadAndProcess:
     def __init__(
@@ -23,52 +45,113 @@ class DownloadAndProcess:
         database_password: str,
         database_hostname: str,
         database_port: int = 5432,
+        slots: ResourceSlots | None = None,
     ):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.database_username = database_username
         self.database_password = database_password
         self.database_hostname = database_hostname
         self.database_port = database_port
+        # Shared with the other datasets processed at the same time
+        self.slots = slots if slots is not None else ResourceSlots()
         return
 
-    def process_metadata_file(self, metadata_file: Path, datasets_root_dir: Path):
+    def process_metadata_file(
+        self,
+        metadata_file: Path,
+        datasets_root_dir: Path,
+        network_slots: int = DEFAULT_NETWORK_SLOTS,
+        cpu_workers: int = DEFAULT_CPU_WORKERS,
+        db_connections: int = DEFAULT_DB_CONNECTIONS,
+    ):
         """
         args:
         - metadata_file: CSV metadata file path
         - datasets_root_dir: Where to store all the downloaded datasets
+        - network_slots: Datasets downloading at the same time
+        - cpu_workers: Zarr conversions running at the same time
+        - db_connections: Postgres ingests running at the same time
+
+        The datasets run concurrently within those budgets. The optional
+        processPriority column (higher first) and processAfter column
+        (";"-separated datasetShortName / datasetName that must finish first)
+        order them. Datasets in processAfter that aren't processed in this
+        run (toProcess false, cloud) count as done.
         """
         # Read the CSV
         df = pandas.read_csv(metadata_file)
         df = df.where(pandas.notna(df), None)
         df = df.astype("object").where(pandas.notna(df), None)
 
+        jobs = []
+        # Either name of a dataset can be used in processAfter
+        aliases: dict[str, str] = {}
+        unscheduled: set[str] = set()
         for _, row in df.iterrows():
             dataset_details = row.to_dict()
-
-            # Levels can sometimes come out as float.nan change it to None
-            dataset_details.get("levelVariable")
+            name = dataset_details.get("datasetShortName") or dataset_details.get(
+                "datasetName"
+            )
+            names = {
+                dataset_details.get("datasetShortName"),
+                dataset_details.get("datasetName"),
+            } - {None}
 
             to_process = bool(dataset_details.get("toProcess", False))
             if not to_process:
+                unscheduled |= names
                 continue
 
             storage_type = dataset_details.get("storageType").lower()
-            # Find out how we want to process the dataset
-
-            if storage_type == "local_zarr":
-                self.logger.info("Processing zarr dataset")
-                self._process_zarr(row)
-            elif storage_type == "local_postgres_netcdf":
-                self.logger.info("Processing Postgres NetCDF dataset")
-                self._process_netcdf_to_db(dataset_details, datasets_root_dir)
-            elif storage_type == "cloud_netcdf":
+            if storage_type == "cloud_netcdf":
                 self.logger.info("Skipping Cloud NetCDF dataset")
+                unscheduled |= names
                 continue
-            else:
+            elif storage_type not in ("local_zarr", "local_postgres_netcdf"):
                 raise Exception(f"Unknown storage type {storage_type}")
 
+            aliases.update({alias: name for alias in names})
+            after = dataset_details.get("processAfter") or ""
+            jobs.append(
+                DatasetJob(
+                    name=name,
+                    details=dataset_details,
+                    priority=int(dataset_details.get("processPriority") or 0),
+                    after=[a.strip() for a in after.split(";") if a.strip()],
+                )
+            )
+        # A dataset that isn't processed in this run doesn't hold the others up
+        DatasetScheduler.resolve_after(jobs, aliases, unscheduled - set(aliases))
+
+        scheduler = DatasetScheduler(
+            network_slots=network_slots,
+            cpu_workers=cpu_workers,
+            db_connections=db_connections,
+        )
+        connection_kwargs = dict(
+            database_username=self.database_username,
+            database_password=self.database_password,
+            database_hostname=self.database_hostname,
+            database_port=self.database_port,
+        )
+        scheduler.run(jobs, _process_dataset, connection_kwargs, datasets_root_dir)
+
         self.logger.info("All datasets processed.")
 
+    def process_dataset(self, dataset_details: dict[str, Any], datasets_root_dir: Path):
+        storage_type = dataset_details.get("storageType").lower()
+        # Find out how we want to process the dataset
+
+        if storage_type == "local_zarr":
+            self.logger.info("Processing zarr dataset")
+            self._process_zarr(dataset_details)
+        elif storage_type == "local_postgres_netcdf":
+            self.logger.info("Processing Postgres NetCDF dataset")
+            self._process_netcdf_to_db(dataset_details, datasets_root_dir)
+        else:
+            raise Exception(f"Unknown storage type {storage_type}")
+        return
+
     def _prepare_for_zarr(self, ds: xr.Dataset) -> xr.Dataset:
         """
         Xarray can persist stale chunk metadata from the original NetCDF file
@@ -126,8 +209,20 @@ class DownloadAndProcess:
         self.logger.info(f"Zarr path: {local_zarr_path}")
         self.logger.info(f"Source URL: {source_url}")
 
-        # Skip if Zarr already exists
-        if local_zarr_path.exists():
+        # Chunk layout(s) of the store, see zarr_profiles.PROFILES
+        profile = ZarrProfile(name=row.get("zarrProfile") or DEFAULT_PROFILE)
+        converter = ZarrConverter(profile)
+
+        # Skip if every store of the profile already exists, otherwise only
+        # the missing ones are written (ie: the .series.zarr of a dual profile)
+        missing = {
+            layout: store_path
+            for layout, store_path in ZarrConverter.store_paths(
+                local_zarr_path, profile
+            ).items()
+            if not store_path.exists()
+        }
+        if not missing:
             self.logger.info("Zarr store already exists, skipping...")
             return
 
@@ -137,32 +232,36 @@ class DownloadAndProcess:
         # Download NetCDF file to temporary location
         temp_nc_file = local_zarr_path.with_suffix(".nc")
         self.logger.info(f"Downloading to temporary file: {temp_nc_file}")
-        Downloaders.wget_download_file(url=source_url, output_file=temp_nc_file)
+        with self.slots.network:
+            Downloaders.wget_download_file(url=source_url, output_file=temp_nc_file)
 
         # Open NetCDF and convert to consolidated Zarr
         self.logger.info("Opening NetCDF and converting to Zarr...")
 
-        # Need to try a bunch of different combinations to decode the file (order matters)
-        successfully_decoded = False
-        engines = ["h5netcdf", "netcdf4", "h5netcdf", "netcdf4"]
-        decode_times = [True, True, False, False]
-        for engine, decode_time in zip(engines, decode_times):
-            if successfully_decoded:
-                break
-            try:
-                with self._open_dataset(
-                    temp_nc_file, engine=engine, decode_times=decode_time
-                ) as ds:
-                    self._prepare_for_zarr(ds)
-                    ds.to_zarr(local_zarr_path, mode="w", consolidated=True)
-                self.logger.info(
-                    f"Zarr store created with engine={engine} decode_times={decode_time}: {local_zarr_path}"
-                )
-                successfully_decoded = True
-            except Exception as e:
-                self.logger.info(f"Failed to convert {temp_nc_file} to Zarr: {e}")
-                if local_zarr_path.exists():
-                    shutil.rmtree(local_zarr_path)
+        with self.slots.cpu:
+            # Need to try a bunch of different combinations to decode the file (order matters)
+            successfully_decoded = False
+            engines = ["h5netcdf", "netcdf4", "h5netcdf", "netcdf4"]
+            decode_times = [True, True, False, False]
+            for engine, decode_time in zip(engines, decode_times):
+                if successfully_decoded:
+                    break
+                try:
+                    with self._open_dataset(
+                        temp_nc_file, engine=engine, decode_times=decode_time
+                    ) as ds:
+                        self._prepare_for_zarr(ds)
+                        converter.write(ds, local_zarr_path, layouts=tuple(missing))
+                    self.logger.info(
+                        f"Zarr store created with engine={engine} decode_times={decode_time} "
+                        f"profile={profile.name}: {', '.join(map(str, missing.values()))}"
+                    )
+                    successfully_decoded = True
+                except Exception as e:
+                    self.logger.info(f"Failed to convert {temp_nc_file} to Zarr: {e}")
+                    for store_path in missing.values():
+                        if store_path.exists():
+                            shutil.rmtree(store_path)
         return
 
     def _process_netcdf_to_db(
@@ -178,27 +277,42 @@ class DownloadAndProcess:
         dataset_download_location = datasets_root_dir / dataset_short_name
 
         self.logger.info(f"Processing dataset: {dataset_short_name}")
+        postgres_processor = dataset_details.get("postgresProcessor", "simple")
 
         if data_location.startswith("s3://"):
             # Download the dataset
             self.logger.info("Downloading all files from S3")
-            Downloaders.s3_download(data_location, dataset_download_location)
+            with self.slots.network:
+                Downloaders.s3_download(data_location, dataset_download_location)
 
         elif data_location.startswith("ftp://"):
             # First get all the urls if globbing
             self.logger.info("Getting FTP URLs to download")
-            urls = FtpGlobber.get_urls_from_glob(data_location)
+            with self.slots.network:
+                urls = FtpGlobber.get_urls_from_glob(
+                    data_location,
+                    cache_path=datasets_root_dir / FTP_LISTING_CACHE_NAME,
+                )
+
+            # The simple ingest loads the files one by one, it starts on the
+            # first one while the rest are still downloading
+            if len(urls) > 0 and postgres_processor == "simple":
+                with self.slots.network, self.slots.db:
+                    self._pipeline_ftp_to_db(
+                        urls, dataset_download_location, dataset_details
+                    )
+                return
 
             # Download the URLs
             if len(urls) > 0:
                 # Download the dataset
                 self.logger.info(f"Downloading all FTP files: {len(urls)} files")
-                Downloaders.wget_download_files(
-                    urls, dataset_download_location, quiet=True
-                )
+                with self.slots.network:
+                    Downloaders.download_files(
+                        urls, dataset_download_location, quiet=True
+                    )
 
         # Insert into DB
-        postgres_processor = dataset_details.get("postgresProcessor", "simple")
         if postgres_processor == "simple":
             netcdf_to_db = NetCDFtoDbSimple(
                 folder_root=dataset_download_location,
@@ -224,15 +338,106 @@ class DownloadAndProcess:
 
         # Run it
         self.logger.info(f"Importing into DB: {dataset_short_name}")
-        netcdf_to_db.export_data_to_postgres(
+        with self.slots.db:
+            netcdf_to_db.export_data_to_postgres(
+                database_name=dataset_short_name,
+                user=self.database_username,
+                password=self.database_password,
+                host=self.database_hostname,
+                port=self.database_port,
+            )
+        return
+
+    def _pipeline_ftp_to_db(
+        self, urls: list[str], download_location: Path, dataset_details: dict
+    ) -> None:
+        """
+        Download and ingest (simple processor) at the same time: every file is
+        loaded as soon as it has landed, while at most PIPELINE_MAX_PENDING
+        more download ahead of it. The database is only replaced once every
+        file is in, a failed download leaves the current data as it was
+        """
+        dataset_short_name = dataset_details["datasetShortName"]
+
+        # Same order as the files of a folder ingest (sorted, .nc only)
+        urls = sorted(
+            (u for u in urls if u.endswith(".nc")), key=lambda u: u.rpartition("/")[2]
+        )
+        self.logger.info(f"Downloading and importing {len(urls)} FTP files")
+        downloads = Downloaders.iter_download_files(
+            urls, download_location, max_pending=PIPELINE_MAX_PENDING
+        )
+        stats = {"files": 0, "bytes": 0, "waited": 0.0, "downloaded_at": 0.0}
+        started_at = time.perf_counter()
+        files = self._timed_downloads(downloads, stats, started_at)
+
+        # The metadata is read from the folder, the first file has to be there
+        first_file = next(files, None)
+        if first_file is None:
+            return
+        netcdf_to_db = NetCDFtoDbSimple(
+            folder_root=download_location,
+            level_variable_name=dataset_details.get("levelVariable", None),
+            variable_of_interest_name=dataset_details.get("keyVariable"),
+        )
+        netcdf_to_db.export_stream_to_postgres(
+            itertools.chain([first_file], files),
             database_name=dataset_short_name,
             user=self.database_username,
             password=self.database_password,
             host=self.database_hostname,
             port=self.database_port,
         )
+
+        wall_seconds = time.perf_counter() - started_at
+        download_seconds = max(stats["downloaded_at"], 1e-9)
+        ingest_seconds = wall_seconds - stats["waited"]
+        self.logger.info(
+            f"{dataset_short_name}: downloaded {stats['files']} files "
+            f"({stats['bytes'] / 2**20:.1f} MB) in {download_seconds:.1f}s "
+            f"({stats['bytes'] / 2**20 / download_seconds:.1f} MB/s), "
+            f"ingest busy {ingest_seconds:.1f}s "
+            f"({stats['files'] / max(ingest_seconds, 1e-9):.2f} files/s), "
+            f"waited {stats['waited']:.1f}s on downloads, wall {wall_seconds:.1f}s"
+        )
         return
 
+    @staticmethod
+    def _timed_downloads(
+        downloads: Iterator[DownloadResult], stats: dict, started_at: float
+    ) -> Iterator[Path]:
+        """
+        Paths of the downloads, counting the time their consumer waits on them.
+        downloaded_at is when the last file was complete in the download
+        workers, not when the consumer got it
+        """
+        while True:
+            wait_start = time.perf_counter()
+            result = next(downloads, None)
+            now = time.perf_counter()
+            if result is None:
+                return
+            stats["waited"] += now - wait_start
+            stats["downloaded_at"] = max(
+                stats["downloaded_at"], result.completed_at - started_at
+            )
+            stats["files"] += 1
+            stats["bytes"] += result.size
+            yield result.path
+
+
+def _process_dataset(
+    dataset_details: dict[str, Any],
+    slots: ResourceSlots,
+    connection_kwargs: dict[str, Any],
+    datasets_root_dir: Path,
+) -> None:
+    """One dataset, in a process of the DatasetScheduler"""
+    setup_logging()
+    download_and_process = DownloadAndProcess(**connection_kwargs, slots=slots)
+    download_and_process.process_dataset(dataset_details, datasets_root_dir)
+    return
+
 
 # Path to CSV describing datasets
 def main():
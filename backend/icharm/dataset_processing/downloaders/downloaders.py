@@ -2,13 +2,69 @@ import logging
 import os
 import subprocess
 from pathlib import Path
+from typing import Iterator
 
 from tqdm import tqdm
 
+from icharm.dataset_processing.downloaders.parallel_downloader import (
+    DEFAULT_PER_HOST,
+    DEFAULT_WORKERS,
+    DownloadResult,
+    ParallelDownloader,
+)
+
 logger = logging.getLogger(__name__)
 
 
 class Downloaders:
+    @staticmethod
+    def download_files(
+        urls: list[str],
+        dest: str | Path,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        per_host: int = DEFAULT_PER_HOST,
+        quiet: bool = False,
+    ) -> list[Path]:
+        """
+        Download the URLs into `dest` in parallel: partial files are resumed,
+        sizes verified and completed files recorded in the folder's manifest
+        (so a rerun only fetches what's missing)
+        """
+        if os.getenv("IS_DEBUG", "FALSE").upper() == "TRUE":
+            # If Debug, don't download everything!
+            logger.info("IS_DEBUG = TRUE, only downloading the first files")
+            urls = urls[:6]
+
+        downloader = ParallelDownloader(
+            dest, workers=workers, per_host=per_host, quiet=quiet
+        )
+        results = downloader.download(urls)
+        return [result.path for result in results]
+
+    @staticmethod
+    def iter_download_files(
+        urls: list[str],
+        dest: str | Path,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        per_host: int = DEFAULT_PER_HOST,
+        max_pending: int | None = None,
+    ) -> Iterator[DownloadResult]:
+        """
+        download_files() yielding each file (in `urls` order) as soon as it's
+        downloaded, at most `max_pending` ahead of the consumer
+        """
+        if os.getenv("IS_DEBUG", "FALSE").upper() == "TRUE":
+            # If Debug, don't download everything!
+            logger.info("IS_DEBUG = TRUE, only downloading the first files")
+            urls = urls[:6]
+
+        downloader = ParallelDownloader(
+            dest, workers=workers, per_host=per_host, quiet=True
+        )
+        return downloader.iter_download(urls, max_pending=max_pending)
+
     @staticmethod
     def wget_download_files(
         urls: list[str], dest: str | Path, *, quiet: bool = False
@@ -1,28 +1,72 @@
 import fnmatch
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from ftplib import FTP, error_perm
+from pathlib import Path
 from urllib.parse import urlparse, unquote
 
+# Directories listed at the same time (one FTP connection each)
+DEFAULT_LIST_WORKERS = 4
+
+# How long a cached directory listing is trusted
+DEFAULT_CACHE_TTL_SECONDS = 6 * 60 * 60
+
 
 @dataclass(frozen=True)
 class FtpGlob:
     host: str
+    port: int | None
     segments: list[str]  # path segments, may include globs like "*", "foo*"
     raw_url: str
 
 
+@dataclass(frozen=True)
+class FtpFile:
+    url: str
+    size: int | None  # Only known when the server supports MLSD
+    modify: str | None  # YYYYMMDDHHMMSS (UTC), only known with MLSD
+
+
 class FtpGlobber:
     @staticmethod
-    def get_urls_from_glob(globed_url: str) -> list[str]:
+    def get_urls_from_glob(
+        globed_url: str,
+        workers: int = DEFAULT_LIST_WORKERS,
+        cache_path: str | Path | None = None,
+    ) -> list[str]:
         """
         Easy entrypoint to getting download links
         """
-        ftp_globber = FtpGlobber(globed_url=globed_url)
+        ftp_globber = FtpGlobber(
+            globed_url=globed_url, workers=workers, cache_path=cache_path
+        )
         results = ftp_globber.expand_ftp_glob()
         return results
 
-    def __init__(self, globed_url: str):
+    def __init__(
+        self,
+        globed_url: str,
+        workers: int = DEFAULT_LIST_WORKERS,
+        cache_path: str | Path | None = None,
+        cache_ttl_seconds: float = DEFAULT_CACHE_TTL_SECONDS,
+    ):
         self.globed_url = globed_url
+        self.workers = workers
+        self.cache_path = Path(cache_path) if cache_path is not None else None
+        self.cache_ttl_seconds = cache_ttl_seconds
+
+        # One FTP connection per listing thread, opened on first use
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[FTP] = []
+        self._use_mlsd: bool | None = None
+
+        # "host:port/path" -> {"listed_at": ..., "entries": {name: facts}}
+        self._listings: dict[str, dict] = {}
         return
 
     def _parse_ftp_glob(self, url: str) -> FtpGlob:
@@ -44,25 +88,131 @@ class FtpGlobber:
             raise ValueError(f"Missing path in URL: {url}")
 
         segments = [s for s in path.split("/") if s]
-        return FtpGlob(host=host, segments=segments, raw_url=url)
+        return FtpGlob(host=host, port=p.port, segments=segments, raw_url=url)
 
-    def _ftp_listdir(self, ftp: FTP, path: str) -> list[str]:
+    ##############################
+    # Connections
+    ##############################
+    def _connection(self, spec: FtpGlob) -> FTP:
+        ftp = getattr(self._local, "ftp", None)
+        if ftp is None:
+            ftp = FTP()
+            ftp.connect(spec.host, spec.port or 21)
+            ftp.login()
+            self._local.ftp = ftp
+            with self._lock:
+                self._connections.append(ftp)
+                if self._use_mlsd is None:
+                    self._use_mlsd = self._supports_mlsd(ftp)
+        return ftp
+
+    def _supports_mlsd(self, ftp: FTP) -> bool:
+        try:
+            return "MLST" in ftp.sendcmd("FEAT").upper()
+        except error_perm:
+            return False
+
+    def _close_connections(self) -> None:
+        for ftp in self._connections:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+        self._connections = []
+        self._local = threading.local()
+        return
+
+    ##############################
+    # Listing cache
+    ##############################
+    def _load_cache(self) -> None:
+        if self.cache_path is not None and self.cache_path.exists():
+            with open(self.cache_path, "r") as f:
+                self._listings = json.load(f)
+        return
+
+    def _save_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        # Drop the expired listings so the file doesn't grow forever
+        now = time.time()
+        listings = {
+            key: listing
+            for key, listing in self._listings.items()
+            if now - listing["listed_at"] < self.cache_ttl_seconds
+        }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Replaced in one go, other processes may be reading / writing it too
+        tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump(listings, f)
+        tmp_path.replace(self.cache_path)
+        return
+
+    ##############################
+    # Listing
+    ##############################
+    def _ftp_listdir(self, spec: FtpGlob, path: str) -> dict[str, dict]:
         """
-        Return a list of names in the directory `path` (not full paths).
+        Names in the directory `path` (not full paths) with their MLSD facts
+        (type / size / modify, empty when the server only supports NLST)
         """
+        key = f"{spec.host}:{spec.port or 21}{path}"
+        with self._lock:
+            listing = self._listings.get(key)
+        if (
+            listing is not None
+            and time.time() - listing["listed_at"] < self.cache_ttl_seconds
+        ):
+            return listing["entries"]
+
+        ftp = self._connection(spec)
         try:
-            ftp.cwd(path)
-            return ftp.nlst()
+            if self._use_mlsd:
+                entries = {
+                    name: facts
+                    for name, facts in ftp.mlsd(path)
+                    if facts.get("type") not in ("cdir", "pdir")
+                }
+            else:
+                ftp.cwd(path)
+                entries = {name: {} for name in ftp.nlst()}
         except error_perm:
             # Directory doesn't exist / not accessible
-            return []
+            entries = {}
+
+        with self._lock:
+            self._listings[key] = {"listed_at": time.time(), "entries": entries}
+        return entries
+
+    def _list_all(
+        self,
+        spec: FtpGlob,
+        paths: list[str],
+        executor: ThreadPoolExecutor | None,
+    ) -> list[dict[str, dict]]:
+        """
+        Listings of `paths`, `workers` directories at a time. The executor is
+        shared by every level so its threads keep their FTP connections
+        """
+        if executor is None or len(paths) <= 1:
+            return [self._ftp_listdir(spec, path) for path in paths]
+        return list(executor.map(lambda p: self._ftp_listdir(spec, p), paths))
 
     def expand_ftp_glob(self) -> list[str]:
         """
         Expand an FTP glob URL into a list of concrete ftp:// file URLs.
         Supports globs in intermediate path segments and in the filename segment.
         """
+        return [ftp_file.url for ftp_file in self.expand_ftp_glob_files()]
+
+    def expand_ftp_glob_files(self) -> list[FtpFile]:
+        """
+        expand_ftp_glob() with the size / mtime of the files (from MLSD). Every
+        level of the tree is listed concurrently, listings are cached
+        """
         spec = self._parse_ftp_glob(self.globed_url)
+        netloc = spec.host if spec.port is None else f"{spec.host}:{spec.port}"
 
         # Everything except the last segment is "directories"; last is "filename pattern"
         *dir_segments, file_pat = spec.segments
@@ -70,49 +220,56 @@ class FtpGlobber:
         # We'll build candidate directories as paths like "Projects/20CRv3/sfc_paramsSI"
         candidate_dirs: list[str] = [""]  # relative to FTP root
 
-        with FTP(spec.host) as ftp:
-            ftp.login()
-
-            # TODO: This section is a bit messy. There's probably a better way to do this.
+        self._load_cache()
+        executor = (
+            ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        )
+        try:
             for seg in dir_segments:
-                next_dirs: list[str] = []
                 has_glob = any(ch in seg for ch in "*?[]")
+                if not has_glob:
+                    # No need to list, a missing directory lists as empty later
+                    candidate_dirs = [
+                        f"{base}/{seg}" if base else seg for base in candidate_dirs
+                    ]
+                    continue
 
-                for base in candidate_dirs:
-                    # list directory at current base
-                    list_path = base or "/"
-                    if not list_path.startswith("/"):
-                        list_path = "/" + list_path
-                    names = self._ftp_listdir(ftp, list_path)
-
-                    if not names:
-                        continue
-
-                    if has_glob:
-                        matched = [n for n in names if fnmatch.fnmatch(n, seg)]
-                    else:
-                        matched = [seg] if seg in names else []
-
-                    for m in matched:
-                        new_base = f"{base}/{m}" if base else m
-                        next_dirs.append(new_base)
+                listings = self._list_all(
+                    spec, ["/" + base for base in candidate_dirs], executor
+                )
+                next_dirs: list[str] = []
+                for base, entries in zip(candidate_dirs, listings):
+                    for name, facts in entries.items():
+                        # Files are skipped when MLSD tells, anything else
+                        # (symlinks, NLST names) is listed at the next level
+                        if facts.get("type") != "file" and fnmatch.fnmatch(name, seg):
+                            next_dirs.append(f"{base}/{name}" if base else name)
 
                 candidate_dirs = next_dirs
                 if not candidate_dirs:
-                    break
-
-            if not candidate_dirs:
-                return []
+                    return []
 
             # Now list files in each candidate dir and match file pattern
-            results: list[str] = []
-            for d in candidate_dirs:
-                if not d.startswith("/"):
-                    d = "/" + d
-                names = self._ftp_listdir(ftp, d)
-                for n in names:
-                    if fnmatch.fnmatch(n, file_pat):
-                        # Build full ftp url
-                        results.append(f"ftp://{spec.host}/{d}/{n}")
-
-            return sorted(set(results))
+            dirs = ["/" + d for d in candidate_dirs]
+            results: dict[str, FtpFile] = {}
+            for d, entries in zip(dirs, self._list_all(spec, dirs, executor)):
+                for name, facts in entries.items():
+                    if facts.get("type") == "dir" or not fnmatch.fnmatch(
+                        name, file_pat
+                    ):
+                        continue
+                    # Build full ftp url
+                    url = f"ftp://{netloc}/{d}/{name}"
+                    size = facts.get("size")
+                    results[url] = FtpFile(
+                        url=url,
+                        size=int(size) if size is not None else None,
+                        modify=facts.get("modify"),
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self._close_connections()
+            self._save_cache()
+
+        return [results[url] for url in sorted(results)]
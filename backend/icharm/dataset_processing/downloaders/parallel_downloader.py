@@ -0,0 +1,330 @@
+import ftplib
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib.parse import unquote, urlparse
+
+import requests
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# Completed downloads of a destination folder, one JSON object per line
+MANIFEST_NAME = ".download_manifest.jsonl"
+
+# Suffix of a file while it's downloading, renamed once verified
+PART_SUFFIX = ".part"
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 4
+
+# Read / write size of the downloads
+CHUNK_BYTES = 64 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class DownloadResult:
+    url: str
+    path: Path
+    size: int
+    sha256: str
+    skipped: bool  # Already complete in the manifest
+    # time.perf_counter() in the download worker when the file was complete
+    completed_at: float = field(default_factory=time.perf_counter)
+
+
+class ParallelDownloader:
+    """
+    Downloads URLs (http(s):// and ftp://) into a folder on a pool of threads,
+    with at most `per_host` connections to the same host. Partial files are
+    resumed (HTTP Range / FTP REST), verified against the size announced by the
+    server (and `checksums` when given) and retried with exponential backoff.
+    Completed files are recorded in a manifest so a rerun skips them
+    """
+
+    def __init__(
+        self,
+        dest: str | Path,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        per_host: int = DEFAULT_PER_HOST,
+        retries: int = 5,
+        backoff_seconds: float = 1.0,
+        timeout_seconds: float = 60.0,
+        checksums: dict[str, str] | None = None,
+        quiet: bool = False,
+    ) -> None:
+        if workers < 1 or per_host < 1:
+            raise ValueError("workers and per_host must be at least 1")
+        self.dest_path = Path(dest)
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.checksums = checksums or {}
+        self.quiet = quiet
+
+        self.manifest_path = self.dest_path / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        return
+
+    ##############################
+    # Manifest
+    ##############################
+    def load_manifest(self) -> dict[str, dict]:
+        """Manifest entries by URL, the last entry of a URL wins"""
+        entries = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["url"]] = entry
+        return entries
+
+    def _record(self, result: DownloadResult) -> None:
+        entry = {
+            "url": result.url,
+            "file": result.path.name,
+            "size": result.size,
+            "sha256": result.sha256,
+            "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self._lock:
+            with open(self.manifest_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        return
+
+    ##############################
+    # Downloads
+    ##############################
+    def download(self, urls: list[str]) -> list[DownloadResult]:
+        """
+        Download every URL, in parallel. Raises DownloadError listing the URLs
+        that still failed after their retries (once the others are done)
+        """
+        self.dest_path.mkdir(parents=True, exist_ok=True)
+        manifest = self.load_manifest()
+
+        results: dict[str, DownloadResult] = {}
+        failures: dict[str, Exception] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(
+                    self._download_with_retries, url, manifest.get(url)
+                ): url
+                for url in urls
+            }
+            for future in tqdm(
+                as_completed(futures), total=len(futures), disable=self.quiet
+            ):
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    logger.error(f"Download failed {url}: {e}")
+                    failures[url] = e
+
+        if failures:
+            raise DownloadError(
+                f"{len(failures)} of {len(urls)} downloads failed: {sorted(failures)}"
+            )
+        return [results[url] for url in urls]
+
+    def iter_download(
+        self, urls: Iterable[str], max_pending: int | None = None
+    ) -> Iterator[DownloadResult]:
+        """
+        download() for a consumer that starts on the files while the rest are
+        still downloading. Results come in the order of `urls`, at most
+        `max_pending` (default twice the workers) downloads run or wait ahead
+        of the consumer so a slow consumer holds the network back. Raises
+        DownloadError for the first URL that failed after its retries
+        """
+        max_pending = max_pending or 2 * self.workers
+        self.dest_path.mkdir(parents=True, exist_ok=True)
+        manifest = self.load_manifest()
+
+        url_iter = iter(urls)
+        pending: deque[tuple[str, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while True:
+                    while len(pending) < max_pending:
+                        url = next(url_iter, None)
+                        if url is None:
+                            break
+                        future = executor.submit(
+                            self._download_with_retries, url, manifest.get(url)
+                        )
+                        pending.append((url, future))
+                    if not pending:
+                        break
+
+                    url, future = pending.popleft()
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        raise DownloadError(f"Download failed {url}: {e}") from e
+                    yield result
+            finally:
+                # Stopped early, don't start what's still queued
+                for _, future in pending:
+                    future.cancel()
+        return
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _download_with_retries(
+        self, url: str, manifest_entry: dict | None
+    ) -> DownloadResult:
+        path = self.dest_path / Path(unquote(urlparse(url).path)).name
+        if (
+            manifest_entry is not None
+            and path.exists()
+            and path.stat().st_size == manifest_entry["size"]
+        ):
+            return DownloadResult(
+                url,
+                path,
+                manifest_entry["size"],
+                manifest_entry["sha256"],
+                skipped=True,
+            )
+
+        # A file from before the manifest (or an unverified one) is resumed,
+        # which also checks its size against the server
+        part_path = path.with_name(path.name + PART_SUFFIX)
+        if path.exists():
+            path.replace(part_path)
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self._host_slot(urlparse(url).hostname or ""):
+                    result = self._download(url, path, part_path)
+                self._record(result)
+                return result
+            except (
+                DownloadError,
+                OSError,
+                requests.RequestException,
+                *ftplib.all_errors,
+            ) as e:
+                if attempt == self.retries:
+                    raise
+                wait_seconds = self.backoff_seconds * 2**attempt
+                logger.info(f"Retrying {url} in {wait_seconds:.1f}s ({e})")
+                time.sleep(wait_seconds)
+        raise DownloadError(f"No attempt made for {url}")
+
+    def _download(self, url: str, path: Path, part_path: Path) -> DownloadResult:
+        scheme = urlparse(url).scheme
+        if scheme in ("http", "https"):
+            expected_size = self._fetch_http(url, part_path)
+        elif scheme == "ftp":
+            expected_size = self._fetch_ftp(url, part_path)
+        else:
+            raise ValueError(f"Unsupported URL scheme: {url}")
+
+        size = part_path.stat().st_size
+        if expected_size is not None and size != expected_size:
+            raise DownloadError(f"{url}: got {size} bytes, expected {expected_size}")
+
+        sha256 = self._sha256(part_path)
+        expected_sha256 = self.checksums.get(url)
+        if expected_sha256 is not None and sha256 != expected_sha256.lower():
+            # Corrupt, start over on the next attempt
+            part_path.unlink()
+            raise DownloadError(
+                f"{url}: sha256 {sha256} doesn't match {expected_sha256}"
+            )
+
+        part_path.replace(path)
+        return DownloadResult(url, path, size, sha256, skipped=False)
+
+    def _fetch_http(self, url: str, part_path: Path) -> int | None:
+        """Download (or resume) into `part_path`, returns the full size when known"""
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+        with requests.get(
+            url, headers=headers, stream=True, timeout=self.timeout_seconds
+        ) as response:
+            if response.status_code == 416:
+                # Nothing left to download when the partial file is complete
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                if total.isdigit() and int(total) == offset:
+                    return offset
+                part_path.unlink()
+                raise DownloadError(f"{url}: partial file doesn't match the server")
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                expected_size = int(total) if total.isdigit() else None
+                mode = "ab"
+            else:
+                # The server ignored the range, start over
+                content_length = response.headers.get("Content-Length")
+                expected_size = int(content_length) if content_length else None
+                mode = "wb"
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_BYTES):
+                    f.write(chunk)
+        return expected_size
+
+    def _fetch_ftp(self, url: str, part_path: Path) -> int | None:
+        """Download (or resume) into `part_path`, returns the full size when known"""
+        parsed = urlparse(url)
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        with ftplib.FTP(timeout=self.timeout_seconds) as ftp:
+            ftp.connect(parsed.hostname, parsed.port or 21)
+            ftp.login(
+                unquote(parsed.username or "anonymous"), unquote(parsed.password or "")
+            )
+            ftp.voidcmd("TYPE I")
+            remote_path = unquote(parsed.path)
+            try:
+                expected_size = ftp.size(remote_path)
+            except ftplib.error_perm:
+                # SIZE isn't supported everywhere
+                expected_size = None
+
+            if expected_size is not None and offset == expected_size:
+                return expected_size
+            if expected_size is not None and offset > expected_size:
+                offset = 0
+
+            with open(part_path, "ab" if offset > 0 else "wb") as f:
+                ftp.retrbinary(
+                    f"RETR {remote_path}",
+                    f.write,
+                    blocksize=CHUNK_BYTES,
+                    rest=offset or None,
+                )
+        return expected_size
+
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_BYTES):
+                digest.update(chunk)
+        return digest.hexdigest()
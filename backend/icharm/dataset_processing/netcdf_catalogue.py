@@ -0,0 +1,274 @@
+import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import numpy
+from netCDF4 import Dataset
+
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import decode_times
+
+DEFAULT_CATALOGUE_NAME = ".netcdf_catalogue.sqlite"
+
+
+def grid_hash(latitudes: numpy.ndarray, longitudes: numpy.ndarray) -> str:
+    """sha256 of the lat / lon axes, files with the same hash share lat / lon indexes"""
+    digest = hashlib.sha256()
+    digest.update(numpy.asarray(latitudes, dtype=numpy.float64).tobytes())
+    digest.update(b"|")
+    digest.update(numpy.asarray(longitudes, dtype=numpy.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _scan_file(
+    file: Path,
+    time_variable_name: str,
+    latitude_variable_name: str,
+    longitude_variable_name: str,
+) -> tuple[str, list[str]]:
+    """Grid hash and ISO timestamps of a file"""
+    with Dataset(file, "r") as nc:
+        times_dt = decode_times(nc.variables[time_variable_name])
+        file_grid_hash = grid_hash(
+            nc.variables[latitude_variable_name][:],
+            nc.variables[longitude_variable_name][:],
+        )
+    return file_grid_hash, [t.isoformat() for t in times_dt]
+
+
+class NetCDFCatalogue:
+    """
+    SQLite catalogue of a folder of netCDF files: every timestamp with the file
+    and in-file index it's stored at, plus the size / mtime of the files (to
+    only rescan the ones that changed) and the hash of their lat / lon grid.
+    Lookups binary search the timestamps, kept as sorted ISO strings
+    """
+
+    def __init__(
+        self,
+        folder_path: Path,
+        time_variable_name: str,
+        latitude_variable_name: str,
+        longitude_variable_name: str,
+        catalogue_path: str | Path | None = None,
+        workers: int = 1,
+    ) -> None:
+        self.folder_path = folder_path
+        self.time_variable_name = time_variable_name
+        self.latitude_variable_name = latitude_variable_name
+        self.longitude_variable_name = longitude_variable_name
+        if catalogue_path is None:
+            catalogue_path = folder_path / DEFAULT_CATALOGUE_NAME
+        self.catalogue_path = Path(catalogue_path)
+        self.workers = workers
+
+        # Sorted lookup arrays, loaded on the first lookup
+        self._timestamps: numpy.ndarray | None = None
+        self._file_ids = numpy.empty(0, dtype=numpy.int64)
+        self._time_indexes = numpy.empty(0, dtype=numpy.int64)
+        self._paths: dict[int, Path] = {}
+
+        self._create_tables()
+        return
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.catalogue_path)
+
+    def _create_tables(self) -> None:
+        self.catalogue_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS catalogue_info (
+                    name             TEXT NOT NULL PRIMARY KEY,
+                    value            TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS file (
+                    file_id          INTEGER PRIMARY KEY,
+                    relative_path    TEXT NOT NULL UNIQUE,
+                    size             INTEGER NOT NULL,
+                    mtime_ns         INTEGER NOT NULL,
+                    grid_hash        TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS file_time (
+                    timestamp        TEXT NOT NULL,
+                    file_id          INTEGER NOT NULL,
+                    time_index       INTEGER NOT NULL,
+                    PRIMARY KEY (file_id, time_index)
+                );
+                CREATE INDEX IF NOT EXISTS file_time_timestamp_idx
+                    ON file_time (timestamp);
+                """
+            )
+
+            # A catalogue of other variables is rebuilt from scratch
+            info = {
+                "time_variable_name": self.time_variable_name,
+                "latitude_variable_name": self.latitude_variable_name,
+                "longitude_variable_name": self.longitude_variable_name,
+            }
+            stored = dict(conn.execute("SELECT name, value FROM catalogue_info"))
+            if stored != info:
+                conn.execute("DELETE FROM file_time")
+                conn.execute("DELETE FROM file")
+                conn.execute("DELETE FROM catalogue_info")
+                conn.executemany(
+                    "INSERT INTO catalogue_info (name, value) VALUES (?, ?)",
+                    info.items(),
+                )
+        return
+
+    def _scan_files(self, files: list[Path]) -> list[tuple[str, list[str]]]:
+        """Grid hash and timestamps of every file, on `workers` processes"""
+        names = (
+            self.time_variable_name,
+            self.latitude_variable_name,
+            self.longitude_variable_name,
+        )
+        if self.workers <= 1 or len(files) <= 1:
+            return [_scan_file(file, *names) for file in files]
+
+        chunksize = max(1, len(files) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return list(
+                executor.map(
+                    _scan_file,
+                    files,
+                    *[[name] * len(files) for name in names],
+                    chunksize=chunksize,
+                )
+            )
+
+    def update(self, files: list[Path] | None = None) -> int:
+        """
+        Bring the catalogue in line with the folder (or `files`): new files and
+        files whose size / mtime changed are decoded, removed files dropped.
+        Returns the number of files decoded
+        """
+        if files is None:
+            files = sorted(self.folder_path.rglob("*.nc"))
+        stats = {
+            file.relative_to(self.folder_path).as_posix(): file.stat() for file in files
+        }
+
+        with closing(self._connect()) as conn, conn:
+            known = {
+                relative_path: (size, mtime_ns, file_id)
+                for relative_path, size, mtime_ns, file_id in conn.execute(
+                    "SELECT relative_path, size, mtime_ns, file_id FROM file"
+                )
+            }
+            changed = [
+                relative_path
+                for relative_path, stat in stats.items()
+                if known.get(relative_path, (None, None))[:2]
+                != (stat.st_size, stat.st_mtime_ns)
+            ]
+            removed = [p for p in known if p not in stats]
+            stale_file_ids = [
+                (known[relative_path][2],)
+                for relative_path in removed + changed
+                if relative_path in known
+            ]
+            print(
+                f"Catalogue: {len(changed)} new or changed files, {len(removed)} removed"
+            )
+
+            scans = self._scan_files([self.folder_path / p for p in changed])
+
+            conn.executemany("DELETE FROM file_time WHERE file_id = ?", stale_file_ids)
+            conn.executemany("DELETE FROM file WHERE file_id = ?", stale_file_ids)
+            for relative_path, (file_grid_hash, timestamps) in zip(changed, scans):
+                stat = stats[relative_path]
+                file_id = conn.execute(
+                    """
+                    INSERT INTO file (relative_path, size, mtime_ns, grid_hash)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (relative_path, stat.st_size, stat.st_mtime_ns, file_grid_hash),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO file_time (timestamp, file_id, time_index) VALUES (?, ?, ?)",
+                    [(t, file_id, idx) for idx, t in enumerate(timestamps)],
+                )
+
+        grid_hashes = self.grid_hashes()
+        if len(grid_hashes) > 1:
+            print(
+                f"WARNING: {len(grid_hashes)} different lat / lon grids in "
+                f"{self.folder_path}, lat / lon indexes differ between files"
+            )
+
+        # The lookup arrays are reloaded on the next lookup
+        self._timestamps = None
+        return len(changed)
+
+    def grid_hashes(self) -> set[str]:
+        with closing(self._connect()) as conn:
+            return {r[0] for r in conn.execute("SELECT DISTINCT grid_hash FROM file")}
+
+    def files_by_month_day(self) -> dict[str, dict[str, Path]]:
+        """
+        Files of every MMDD by year ({"0131": {"2000": path}}), from the
+        timestamps the files hold
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT DISTINCT
+                    substr(timestamp, 6, 2) || substr(timestamp, 9, 2),
+                    substr(timestamp, 1, 4),
+                    relative_path
+                FROM file_time
+                JOIN file USING (file_id)
+                ORDER BY 1, 2, 3
+                """
+            ).fetchall()
+        month_day_files: dict[str, dict[str, Path]] = {}
+        for month_day, year, relative_path in rows:
+            month_day_files.setdefault(month_day, {})[year] = (
+                self.folder_path / relative_path
+            )
+        return month_day_files
+
+    def _load_lookup(self) -> None:
+        with closing(self._connect()) as conn:
+            self._paths = {
+                file_id: self.folder_path / relative_path
+                for file_id, relative_path in conn.execute(
+                    "SELECT file_id, relative_path FROM file"
+                )
+            }
+            rows = conn.execute(
+                """
+                SELECT timestamp, file_id, time_index
+                FROM file_time
+                ORDER BY timestamp, file_id, time_index
+                """
+            ).fetchall()
+        self._timestamps = numpy.array([r[0] for r in rows], dtype=str)
+        self._file_ids = numpy.array([r[1] for r in rows], dtype=numpy.int64)
+        self._time_indexes = numpy.array([r[2] for r in rows], dtype=numpy.int64)
+        return
+
+    def lookup(
+        self, date_lower_bound: datetime, date_upper_bound: datetime
+    ) -> list[tuple[Path, int]]:
+        """File and in-file index of every timestamp in [lower, upper], in time order"""
+        if self._timestamps is None:
+            self._load_lookup()
+
+        start = numpy.searchsorted(
+            self._timestamps, date_lower_bound.isoformat(), side="left"
+        )
+        end = numpy.searchsorted(
+            self._timestamps, date_upper_bound.isoformat(), side="right"
+        )
+        return [
+            (self._paths[int(file_id)], int(time_index))
+            for file_id, time_index in zip(
+                self._file_ids[start:end], self._time_indexes[start:end]
+            )
+        ]
@@ -1,11 +1,13 @@
-import pickle
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy
 from datetime import datetime
-from netCDF4 import Dataset, num2date
+from netCDF4 import Dataset
 from tqdm import tqdm
-from typing import Any
 
+from icharm.dataset_processing.netcdf_catalogue import NetCDFCatalogue
 from icharm.utils.benchmark import benchmark
 
 TIME_VAR_CANDIDATES = ["time"]
@@ -13,6 +15,30 @@ LAT_VAR_CANDIDATES = ["lat", "latitude"]
 LON_VAR_CANDIDATES = ["lon", "longitude"]
 
 
+def _read_points(
+    path: Path,
+    variable_name: str,
+    time_indexes: list[int],
+    points: list[tuple[int, int]],
+) -> numpy.ndarray:
+    """
+    Values (n_time_indexes, n_points) of a file, with one hyperslab read per
+    point spanning the requested time indexes. Masked values are NaN
+    """
+    first, last = min(time_indexes), max(time_indexes)
+    offsets = numpy.asarray(time_indexes) - first
+    values = numpy.empty((len(time_indexes), len(points)), dtype=numpy.float64)
+    with Dataset(path, "r") as nc:
+        variable = nc[variable_name]
+        for point_idx, (lat_idx, lon_idx) in enumerate(points):
+            data = variable[slice(first, last + 1), lat_idx, lon_idx]
+            data = numpy.ma.filled(
+                numpy.ma.asarray(data, dtype=numpy.float64), numpy.nan
+            )
+            values[:, point_idx] = data[offsets]
+    return values
+
+
 class NetCDFIndexer:
     def __init__(
         self,
@@ -21,6 +47,8 @@ class NetCDFIndexer:
         latitude_variable_name: str | None = None,
         longitude_variable_name: str | None = None,
         variable_of_interest_name: str | None = None,
+        catalogue_path: str | Path | None = None,
+        workers: int = 1,
     ) -> None:
         if isinstance(folder_root, str):
             folder_path = Path(folder_root)
@@ -33,12 +61,13 @@ class NetCDFIndexer:
         self.longitude_variable_name = longitude_variable_name
         self.latitude_variable_name = latitude_variable_name
         self.variable_of_interest_name = variable_of_interest_name
+        self.catalogue_path = catalogue_path
+        self.workers = workers
 
-        # Values to fill in later
-        self.longitudes: dict[float, int] = {}
-        self.latitudes: dict[float, int] = {}
-        self.timestamps: dict[str, Any] = {}
-        self.times_to_filename: dict[datetime, tuple[str, int]] = {}
+        # Values to fill in later, the array index is the lat_idx / lon_idx
+        self.longitudes: numpy.ndarray = numpy.empty(0)
+        self.latitudes: numpy.ndarray = numpy.empty(0)
+        self.catalogue: NetCDFCatalogue | None = None
         return
 
     def _guess_varible_name(self, nc: Dataset, candidates: list[str]) -> str:
@@ -83,42 +112,15 @@ class NetCDFIndexer:
                     )
 
             # Now get all lot/lon variable values based off index
-            raw_longitudes = nc.variables[self.longitude_variable_name][:]
-            longitudes = {}
-            for idx, value in enumerate(list(raw_longitudes)):
-                longitudes[float(value)] = idx
-            self.longitudes = longitudes
-
-            raw_latitudes = nc.variables[self.latitude_variable_name][:]
-            latitudes = {}
-            for idx, value in enumerate(list(raw_latitudes)):
-                latitudes[float(value)] = idx
-            self.latitudes = latitudes
+            self.longitudes = numpy.asarray(
+                nc.variables[self.longitude_variable_name][:], dtype=numpy.float64
+            )
+            self.latitudes = numpy.asarray(
+                nc.variables[self.latitude_variable_name][:], dtype=numpy.float64
+            )
 
         return
 
-    def _associate_dates_with_files(
-        self, files: list[Path]
-    ) -> dict[str, tuple[str, int]]:
-        times_to_filename = {}
-        for file in tqdm(files):
-            filename_path = str(file)
-            with Dataset(file, "r") as nc:
-                # Get all dates in the current file (there can be more than 1)
-                time_variable = nc.variables[self.time_variable_name]
-                # time_values = nc.variables[self.time_variable_name][:]
-                times_dt = num2date(
-                    times=time_variable[:],
-                    units=time_variable.units,
-                    calendar=getattr(time_variable, "calendar", "standard"),
-                )
-                # it's possible there are multiple dates per file. If there are
-                # get the idx so we know which index to grab from the file.
-                for idx, time_dt in enumerate(times_dt):
-                    # iso_formatted_time = time_dt.isoformat()
-                    times_to_filename[time_dt] = (filename_path, idx)
-        return times_to_filename
-
     def create_index(self):
         # Data should be organized under the folder
         files = sorted(self.folder_path.rglob("*.nc"))
@@ -138,49 +140,68 @@ class NetCDFIndexer:
         print(f"  lon:      {self.longitude_variable_name}")
         print(f"  interest: {self.variable_of_interest_name}")
 
-        # Scan each file to get the dates in all of them
-        self.times_to_filename = self._associate_dates_with_files(files)
+        # Decode the dates of the files that are new or changed since the
+        # catalogue was last updated
+        self.catalogue = NetCDFCatalogue(
+            folder_path=self.folder_path,
+            time_variable_name=self.time_variable_name,
+            latitude_variable_name=self.latitude_variable_name,
+            longitude_variable_name=self.longitude_variable_name,
+            catalogue_path=self.catalogue_path,
+            workers=self.workers,
+        )
+        self.catalogue.update(files)
 
         return
 
-    def save(self, path: str | Path | None = None) -> None:
+    def get_points_data(
+        self,
+        points: list[tuple[int, int]],
+        date_lower_bound: datetime,
+        date_upper_bound: datetime,
+    ) -> numpy.ndarray:
         """
-        Pickle this indexer to disk.
-        Default: store next to the folder_root as '.netcdf_index.pkl'.
+        Values (n_timestamps, n_points) of the (lat_idx, lon_idx) points for
+        every timestamp in range, in time order. Each file is opened once for
+        all its timestamps and points, the files are spread over `workers`
+        processes (HDF5 isn't thread safe)
         """
-        if path is None:
-            path = self.folder_path / ".netcdf_index.pkl"
-        else:
-            path = Path(path)
-
-        path.parent.mkdir(parents=True, exist_ok=True)
-
-        with path.open("wb") as f:
-            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.catalogue is None:
+            raise RuntimeError("create_index() must be called before reading data")
+
+        # Get all the dates that need to be loaded, grouped by file
+        data_files_to_load = self.catalogue.lookup(date_lower_bound, date_upper_bound)
+        rows_by_file: dict[Path, list[int]] = {}
+        for row, (path, _) in enumerate(data_files_to_load):
+            rows_by_file.setdefault(path, []).append(row)
+
+        paths = list(rows_by_file.keys())
+        time_indexes = [
+            [data_files_to_load[row][1] for row in rows_by_file[path]] for path in paths
+        ]
+        read_args = (
+            paths,
+            [self.variable_of_interest_name] * len(paths),
+            time_indexes,
+            [points] * len(paths),
+        )
 
-        print(f"Saved NetCDFIndexer to {path}")
-
-    @classmethod
-    def load(cls, path: str | Path):
-        """
-        Load a previously pickled NetCDFIndexer.
-        """
-        path = Path(path)
-        with path.open("rb") as f:
-            obj = pickle.load(f)
-        if not isinstance(obj, cls):
-            raise TypeError(f"Pickle at {path} is not a {cls.__name__} instance")
-        return obj
-
-    def load_grid_data(self, lat_idx, lon_idx, filename_and_index: tuple[str, int]):
-        path = Path(filename_and_index[0])
-        time_idx = filename_and_index[1]
-        results_data = []
-        with Dataset(path, "r") as nc:
-            variable = nc[self.variable_of_interest_name]
-            val = float(variable[time_idx, lat_idx, lon_idx])
-            results_data.append(val)
-        return results_data
+        # Load it
+        values = numpy.full((len(data_files_to_load), len(points)), numpy.nan)
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                chunksize = max(1, len(paths) // (self.workers * 4))
+                file_values = executor.map(
+                    _read_points, *read_args, chunksize=chunksize
+                )
+                for path, curr_values in zip(
+                    paths, tqdm(file_values, total=len(paths))
+                ):
+                    values[rows_by_file[path]] = curr_values
+        else:
+            for path, *args in tqdm(zip(*read_args), total=len(paths)):
+                values[rows_by_file[path]] = _read_points(path, *args)
+        return values
 
     @benchmark
     def get_grid_data(
@@ -190,20 +211,10 @@ class NetCDFIndexer:
         date_lower_bound: datetime,
         date_upper_bound: datetime,
     ):
-        # Get all the dates that need to be loaded
-        data_files_to_load = []
-        for curr_timestamp in self.times_to_filename:
-            # curr_timestamp = datetime.datetime(timestamp_str
-            if date_lower_bound <= curr_timestamp <= date_upper_bound:
-                data_files_to_load.append(self.times_to_filename[curr_timestamp])
-
-        # Load it
-        all_data = []
-        for data_file_to_load in tqdm(data_files_to_load):
-            curr_data = self.load_grid_data(lat_idx, lon_idx, data_file_to_load)
-            all_data.append(curr_data)
-
-        return all_data
+        values = self.get_points_data(
+            [(lat_idx, lon_idx)], date_lower_bound, date_upper_bound
+        )
+        return [[float(value)] for value in values[:, 0]]
 
 
 def main():
@@ -211,16 +222,9 @@ def main():
         "/home/mrsharky/dev/sdsu/ICharm.AI-Project/backend/datasets/cmorph/daily"
     )
 
-    cache_path = Path(data_path) / Path(".netcdf_index.pkl")
-
-    if cache_path.exists():
-        print(f"Loading existing index from {cache_path}")
-        netcdf_indexer = NetCDFIndexer.load(cache_path)
-    else:
-        print("No existing index found; building a new one...")
-        netcdf_indexer = NetCDFIndexer(data_path)
-        netcdf_indexer.create_index()
-        netcdf_indexer.save(cache_path)
+    # Only the files added or changed since the last run are decoded
+    netcdf_indexer = NetCDFIndexer(data_path, workers=os.cpu_count() or 1)
+    netcdf_indexer.create_index()
 
     # Grab a LOT of data
     date_lower_bound = datetime(2000, 1, 1)
@@ -0,0 +1,181 @@
+# !/usr/bin/env python3
+"""
+Benchmark of the grid_data COPY formats: pandas to_csv + CSV COPY against the
+NumPy binary COPY writer, over a year of CMORPH sized (480 x 1440) daily grids.
+Grids are synthetic unless a folder of NetCDF files is given. Without database
+arguments only the encoding is timed.
+"""
+
+import argparse
+import io
+from pathlib import Path
+from typing import Iterator
+
+import numpy
+import pandas
+from netCDF4 import Dataset
+
+from icharm.dataset_processing.netcdf_to_db.pg_binary_copy import PgBinaryCopy
+from icharm.dataset_processing.postgres_common import PostgresCommon
+from icharm.utils.benchmark import benchmark
+
+# CMORPH 0.25 degree grid, 60S - 60N
+CMORPH_SHAPE = (480, 1440)
+
+BENCHMARK_TABLE = "benchmark_grid_data"
+
+
+def synthetic_grids(days: int, nan_fraction: float) -> Iterator[numpy.ndarray]:
+    rng = numpy.random.default_rng(0)
+    for _ in range(days):
+        grid = rng.gamma(0.5, 2.0, size=CMORPH_SHAPE).astype(numpy.float32)
+        grid[rng.random(CMORPH_SHAPE) < nan_fraction] = numpy.nan
+        yield grid
+
+
+def netcdf_grids(
+    folder: Path, variable_name: str, days: int
+) -> Iterator[numpy.ndarray]:
+    count = 0
+    for file in sorted(folder.rglob("*.nc")):
+        with Dataset(file) as nc:
+            variable = nc[variable_name]
+            for time_idx in range(variable.shape[0]):
+                data = variable[time_idx]
+                if numpy.ma.isMaskedArray(data):
+                    data = data.astype(numpy.float32).filled(numpy.nan)
+                yield numpy.asarray(data, dtype=numpy.float32).reshape(
+                    variable.shape[-2], variable.shape[-1]
+                )
+                count += 1
+                if count >= days:
+                    return
+
+
+def encode_csv(gridbox_ids: numpy.ndarray, time_id: int, grid: numpy.ndarray):
+    """Same encoding as NetCDFtoDbBase._copy_gridbox_data_csv"""
+    df_griddata = pandas.DataFrame(grid.reshape(-1, 1), columns=["value_0"])
+    df_griddata.insert(0, "gridbox_id", gridbox_ids)
+    df_griddata.insert(1, "timestamp_id", time_id)
+    csv_buffer = io.StringIO()
+    df_griddata.to_csv(csv_buffer, index=False)
+    csv_buffer.seek(0)
+    return csv_buffer
+
+
+def encode_binary(gridbox_ids: numpy.ndarray, time_id: int, grid: numpy.ndarray):
+    """Same encoding as NetCDFtoDbBase._copy_gridbox_data_binary"""
+    chunks = PgBinaryCopy.iter_chunks(
+        [gridbox_ids, time_id, grid.reshape(-1)], ["int4", "int4", "float4"]
+    )
+    return io.BytesIO(b"".join(chunks))
+
+
+COPY_SQL = {
+    "csv": f"""
+        COPY {BENCHMARK_TABLE} (gridbox_id, timestamp_id, value_0)
+        FROM STDIN WITH (FORMAT csv, HEADER true, NULL '')
+        """,
+    "binary": f"""
+        COPY {BENCHMARK_TABLE} (gridbox_id, timestamp_id, value_0)
+        FROM STDIN WITH (FORMAT binary)
+        """,
+}
+
+ENCODERS = {"csv": encode_csv, "binary": encode_binary}
+
+
+def run(copy_format: str, grids: list[numpy.ndarray], conn=None) -> int:
+    gridbox_ids = numpy.arange(grids[0].size, dtype=numpy.int32)
+    encode = ENCODERS[copy_format]
+    payload_bytes = 0
+
+    cur = conn.cursor() if conn is not None else None
+    if cur is not None:
+        cur.execute(f"TRUNCATE {BENCHMARK_TABLE};")
+
+    for time_id, grid in enumerate(grids):
+        buffer = encode(gridbox_ids, time_id, grid)
+        payload_bytes += buffer.seek(0, io.SEEK_END)
+        buffer.seek(0)
+        if cur is not None:
+            cur.copy_expert(COPY_SQL[copy_format], buffer)
+
+    if cur is not None:
+        cur.close()
+    return payload_bytes
+
+
+@benchmark
+def run_csv(grids: list[numpy.ndarray], conn=None) -> int:
+    return run("csv", grids, conn)
+
+
+@benchmark
+def run_binary(grids: list[numpy.ndarray], conn=None) -> int:
+    return run("binary", grids, conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--nan_fraction", type=float, default=0.1)
+    parser.add_argument(
+        "-f", "--folder_root", default=None, help="Folder with CMORPH NetCDF files"
+    )
+    parser.add_argument("-i", "--variable_of_interest_name", default="cmorph")
+
+    # Optional database to COPY into
+    parser.add_argument("--db_host", default="localhost")
+    parser.add_argument("--db_port", type=int, default=5432)
+    parser.add_argument("--db_name", default=None)
+    parser.add_argument("--db_user", default=None)
+    parser.add_argument("--db_password", default=None)
+    args = parser.parse_args(argv)
+
+    if args.folder_root:
+        grids = list(
+            netcdf_grids(
+                Path(args.folder_root), args.variable_of_interest_name, args.days
+            )
+        )
+    else:
+        grids = list(synthetic_grids(args.days, args.nan_fraction))
+    print(f"{len(grids)} grids of {grids[0].shape}, {len(grids) * grids[0].size} rows")
+
+    conn = None
+    if args.db_name:
+        conn = PostgresCommon.create_connection(
+            user=args.db_user,
+            password=args.db_password,
+            database_name=args.db_name,
+            host=args.db_host,
+            port=args.db_port,
+        )
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                CREATE UNLOGGED TABLE IF NOT EXISTS {BENCHMARK_TABLE} (
+                    gridbox_id         INTEGER NOT NULL,
+                    timestamp_id       INTEGER NOT NULL,
+                    value_0            REAL
+                );
+                """
+            )
+
+    try:
+        csv_bytes = run_csv(grids, conn)
+        binary_bytes = run_binary(grids, conn)
+    finally:
+        if conn is not None:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {BENCHMARK_TABLE};")
+            conn.close()
+
+    print(f"CSV payload: {csv_bytes / 1024**2:.1f} MB")
+    print(f"Binary payload: {binary_bytes / 1024**2:.1f} MB")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# !/usr/bin/env python3
+"""
+Benchmark of the get_timeseries() point read: calls it for a sample of
+gridboxes in every given database, so a database built before a change can be
+compared with one built after it. Returns the per call latencies and checks
+that every database returns the same series.
+"""
+
+import argparse
+import hashlib
+import time
+
+import numpy
+
+from icharm.dataset_processing.postgres_common import PostgresCommon
+from icharm.utils.benchmark import benchmark
+
+TIMESERIES_SQL = """
+    SELECT timestamp_id, timestamp_value, value
+    FROM get_timeseries(%s, %s)
+    ORDER BY timestamp_id;
+"""
+
+
+def sample_gridbox_ids(conn, samples: int, seed: int) -> list[int]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT gridbox_id FROM gridbox ORDER BY gridbox_id;")
+        gridbox_ids = [r[0] for r in cur.fetchall()]
+    rng = numpy.random.default_rng(seed)
+    picks = rng.choice(
+        len(gridbox_ids), size=min(samples, len(gridbox_ids)), replace=False
+    )
+    return [gridbox_ids[i] for i in picks]
+
+
+@benchmark
+def run(conn, gridbox_ids: list[int], level_id: int) -> tuple[list[float], str]:
+    """Latency of every call (seconds) and a digest of all the returned rows"""
+    latencies = []
+    digest = hashlib.md5()
+    with conn.cursor() as cur:
+        for gridbox_id in gridbox_ids:
+            start = time.perf_counter()
+            cur.execute(TIMESERIES_SQL, (gridbox_id, level_id))
+            rows = cur.fetchall()
+            latencies.append(time.perf_counter() - start)
+            digest.update(repr(rows).encode())
+    return latencies, digest.hexdigest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db_name", nargs="+", required=True)
+    parser.add_argument("--db_host", default="localhost")
+    parser.add_argument("--db_port", type=int, default=5432)
+    parser.add_argument("--db_user", default=None)
+    parser.add_argument("--db_password", default=None)
+    parser.add_argument("--level_id", type=int, default=1)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--warmup", type=int, default=5, help="Calls before timing, to warm the cache"
+    )
+    args = parser.parse_args(argv)
+
+    digests = {}
+    for database_name in args.db_name:
+        conn = PostgresCommon.create_connection(
+            user=args.db_user,
+            password=args.db_password,
+            database_name=database_name,
+            host=args.db_host,
+            port=args.db_port,
+        )
+        try:
+            gridbox_ids = sample_gridbox_ids(conn, args.samples, args.seed)
+            print(f"{database_name}, {len(gridbox_ids)} gridboxes")
+            run(conn, gridbox_ids[: args.warmup], args.level_id)
+            latencies, digests[database_name] = run(conn, gridbox_ids, args.level_id)
+        finally:
+            conn.close()
+
+        latencies_ms = numpy.array(latencies) * 1000
+        print(
+            f"\tmean {latencies_ms.mean():.2f} ms"
+            f" / p50 {numpy.percentile(latencies_ms, 50):.2f} ms"
+            f" / p95 {numpy.percentile(latencies_ms, 95):.2f} ms"
+        )
+
+    if len(set(digests.values())) > 1:
+        print(f"Databases returned different series: {digests}")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import hashlib
+from pathlib import Path
+
+# Phases of an ingest run, only a run still loading can be resumed
+RUN_LOADING = "loading"
+RUN_FINALIZING = "finalizing"
+RUN_DONE = "done"
+
+
+class IngestCheckpoint:
+    """
+    Control tables of the ingest runs of a database. Every group of grid_data
+    timestamps (a file, an MMDD, ...) is committed in the same transaction as
+    its ingest_checkpoint row, so a run that died can continue after the last
+    committed group. The tables are never dropped by an ingest, which keeps the
+    per-group timings as a throughput history across runs:
+
+        SELECT run_id, SUM(n_timestamps) / SUM(seconds) AS timestamps_per_second
+        FROM ingest_checkpoint GROUP BY run_id ORDER BY run_id;
+    """
+
+    @staticmethod
+    def create_tables(cur) -> None:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_run (
+                run_id           INTEGER NOT NULL,
+                file_list_hash   CHAR(64) NOT NULL,
+                status           VARCHAR(20) NOT NULL,
+                started_at       TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                finished_at      TIMESTAMP WITHOUT TIME ZONE NULL,
+                PRIMARY KEY (run_id)
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+                run_id           INTEGER NOT NULL,
+                group_key        VARCHAR(1000) NOT NULL,
+                n_timestamps     INTEGER NOT NULL,
+                committed_at     TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                seconds          DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (run_id, group_key)
+            );
+            """
+        )
+        return
+
+    @staticmethod
+    def file_list_hash(folder_path: Path, files: list[Path]) -> str:
+        """sha256 of the relative path and size of every file, in order"""
+        digest = hashlib.sha256()
+        for file in files:
+            relative = file.relative_to(folder_path).as_posix()
+            digest.update(f"{relative}\t{file.stat().st_size}\n".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def start_run(cur, file_list_hash: str) -> int:
+        cur.execute(
+            """
+            INSERT INTO ingest_run (run_id, file_list_hash, status, started_at)
+            SELECT COALESCE(MAX(run_id) + 1, 1), %s, %s, NOW()
+            FROM ingest_run
+            RETURNING run_id;
+            """,
+            (file_list_hash, RUN_LOADING),
+        )
+        return cur.fetchone()[0]
+
+    @staticmethod
+    def set_status(cur, run_id: int, status: str) -> None:
+        cur.execute(
+            """
+            UPDATE ingest_run
+            SET status = %s
+                , finished_at = CASE WHEN %s = %s THEN NOW() END
+            WHERE run_id = %s;
+            """,
+            (status, status, RUN_DONE, run_id),
+        )
+        return
+
+    @staticmethod
+    def resumable_run(cur, file_list_hash: str) -> tuple[int, set[str]] | None:
+        """
+        The last run and its committed groups when it can be continued, None
+        when there is nothing to resume (no run yet or the last one finished)
+        """
+        cur.execute(
+            """
+            SELECT run_id, file_list_hash, status
+            FROM ingest_run
+            ORDER BY run_id DESC
+            LIMIT 1;
+            """
+        )
+        row = cur.fetchone()
+        if row is None or row[2] == RUN_DONE:
+            return None
+
+        run_id, run_file_list_hash, status = row
+        if status != RUN_LOADING:
+            raise ValueError(
+                f"Run {run_id} died while {status}, it can't be resumed: "
+                "run the ingest again without --resume"
+            )
+        if run_file_list_hash != file_list_hash:
+            raise ValueError(
+                f"The files changed since run {run_id} started, it can't be "
+                "resumed: run the ingest again without --resume"
+            )
+
+        cur.execute(
+            "SELECT group_key FROM ingest_checkpoint WHERE run_id = %s;", (run_id,)
+        )
+        completed_groups = {r[0] for r in cur.fetchall()}
+
+        # grid_data is UNLOGGED while loading, a server crash empties it
+        cur.execute("SELECT EXISTS (SELECT 1 FROM grid_data);")
+        if completed_groups and not cur.fetchone()[0]:
+            raise ValueError(
+                f"grid_data of run {run_id} was lost (unlogged table after a "
+                "server crash): run the ingest again without --resume"
+            )
+        return run_id, completed_groups
+
+    @staticmethod
+    def record(
+        cur, run_id: int, group_key: str, n_timestamps: int, seconds: float
+    ) -> None:
+        cur.execute(
+            """
+            INSERT INTO ingest_checkpoint
+                (run_id, group_key, n_timestamps, committed_at, seconds)
+            VALUES (%s, %s, %s, NOW(), %s);
+            """,
+            (run_id, group_key, n_timestamps, seconds),
+        )
+        return
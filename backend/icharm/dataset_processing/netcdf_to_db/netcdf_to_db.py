@@ -5,10 +5,15 @@ Program for parsing NetCDF files into a database
 
 import argparse
 import os
+from pathlib import Path
 
+from icharm.dataset_processing.netcdf_to_db.infer_cadence import infer_cadence
 from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_by_year import (
     NetCDFtoDbYearlyFiles,
 )
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import (
+    DEFAULT_READ_BLOCK_MB,
+)
 from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_simple import NetCDFtoDbSimple
 
 
@@ -38,6 +43,50 @@ def main(argv=None):
         "-i", "--variable_of_interest_name", required=False, default=None
     )
 
+    # Ingest related
+    common.add_argument(
+        "--copy_format",
+        choices=["binary", "csv"],
+        default="binary",
+        help="Format used to COPY grid_data rows into Postgres",
+    )
+    common.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes loading grid_data in parallel, each with its own connection",
+    )
+    common.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        help="Range partitions of grid_data (0 for a single table)",
+    )
+    common.add_argument(
+        "--append",
+        action="store_true",
+        help="Only load timestamps that aren't in the database yet",
+    )
+    common.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last ingest run after its last committed group",
+    )
+    common.add_argument(
+        "--point_layout",
+        choices=["none", "cluster", "series"],
+        default="none",
+        help="Gridbox-major layout for point series reads: cluster grid_data "
+        "or add the grid_series table of per-gridbox arrays",
+    )
+    common.add_argument(
+        "--read_block_mb",
+        type=int,
+        default=DEFAULT_READ_BLOCK_MB,
+        help="Size of the buffer each timestamp is streamed through, in latitude "
+        "bands aligned to the file chunking",
+    )
+
     parser = argparse.ArgumentParser(description=__doc__)
 
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -56,7 +105,9 @@ def main(argv=None):
     # group_by_year mode
     # ------------------------
     group_by_year = subparsers.add_parser(
-        name="group_by_year", help="Group data by year"
+        name="group_by_year",
+        parents=[common],
+        help="Group data by year",
     )
     group_by_year.add_argument(
         "-min_y", "--year_min", type=int, required=True, default=None
@@ -67,6 +118,15 @@ def main(argv=None):
 
     args = parser.parse_args(argv)
 
+    # Appending to year columns is only done per (year, MMDD) file
+    if args.append and args.command == "group_by_year":
+        cadence = infer_cadence(sorted(Path(args.folder_root).rglob("*.nc")))
+        if cadence.cadence != "year_month_day":
+            parser.error(
+                f"--append needs year_month_day files for group_by_year, "
+                f"{args.folder_root} has {cadence.cadence} files"
+            )
+
     # Dispatch based on subcommand
     if args.command == "simple":
         netcdf_to_db = NetCDFtoDbSimple(
@@ -76,6 +136,11 @@ def main(argv=None):
             longitude_variable_name=args.longitude_variable_name,
             level_variable_name=args.level_variable_name,
             variable_of_interest_name=args.variable_of_interest_name,
+            copy_format=args.copy_format,
+            workers=args.workers,
+            partitions=args.partitions,
+            point_layout=args.point_layout,
+            read_block_mb=args.read_block_mb,
         )
     elif args.command == "group_by_year":
         min_year = args.year_min
@@ -88,18 +153,27 @@ def main(argv=None):
             variable_of_interest_name=args.variable_of_interest_name,
             years=[str(i) for i in range(min_year, max_year)],
             level_variable_name="year",
+            copy_format=args.copy_format,
+            workers=args.workers,
+            partitions=args.partitions,
+            point_layout=args.point_layout,
+            read_block_mb=args.read_block_mb,
         )
     else:
         raise ValueError(f"Unknown command: {args.command}")
 
     # netcdf_to_db.export_data_to_csv("/home/mrsharky/dev/sdsu/ICharm.AI-Project/backend/datasets/cmorph/daily/")
-    netcdf_to_db.export_data_to_postgres(
+    connection = dict(
         database_name=args.db_name,
         user=args.db_user,
         password=args.db_password,
         host=args.db_host,
         port=args.db_port,
     )
+    if args.append:
+        netcdf_to_db.append_data_to_postgres(**connection)
+    else:
+        netcdf_to_db.export_data_to_postgres(**connection, resume=args.resume)
 
     return
 
@@ -1,17 +1,25 @@
 import io
 import logging
 import os
+import re
+import time
 
 import numpy
 import pandas
-import itertools
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-from datetime import datetime
-from netCDF4 import Dataset
-from typing import Any
+from datetime import datetime, timedelta
+from netCDF4 import Dataset, default_fillvals, num2date
+from typing import Any, Iterable
 
+from icharm.dataset_processing.netcdf_to_db.ingest_checkpoint import (
+    RUN_DONE,
+    RUN_FINALIZING,
+    IngestCheckpoint,
+)
+from icharm.dataset_processing.netcdf_to_db.pg_binary_copy import PgBinaryCopy
 from icharm.dataset_processing.postgres_common import PostgresCommon
 
 TIME_VAR_CANDIDATES = ["time"]
@@ -19,15 +27,104 @@ LAT_VAR_CANDIDATES = ["lat", "latitude"]
 LON_VAR_CANDIDATES = ["lon", "longitude"]
 LEVEL_VAR_CANDIDATES = ["level", "depth"]
 
+# How grid_data rows are sent to Postgres
+COPY_FORMATS = ("binary", "csv")
+
+# Extra layout for point time series reads:
+# - none: grid_data stays in insertion (timestamp-major) order
+# - cluster: grid_data is rewritten in (gridbox_id, timestamp_id) order
+# - series: grid_series companion table, one REAL[] per gridbox and value column
+POINT_LAYOUTS = ("none", "cluster", "series")
+
+# Gridboxes aggregated into grid_series per statement
+GRID_SERIES_BATCH_SIZE = 20_000
+
+# Database a streamed ingest loads into, it replaces the real one at the end
+STAGING_DATABASE_SUFFIX = "_staging"
+
+# Size of the float32 block buffer grid_data timestamps are streamed through
+DEFAULT_READ_BLOCK_MB = 64
+
+# Partitions indexed at the same time, independent of the ingest workers
+MAX_INDEX_BUILD_CONNECTIONS = os.cpu_count() or 1
+
+# Attributes netCDF4 needs to apply itself (unpacking / valid range masking)
+AUTO_MASK_ATTRIBUTES = (
+    "scale_factor",
+    "add_offset",
+    "valid_min",
+    "valid_max",
+    "valid_range",
+)
+
+
+def _decode_time_months_since(times: numpy.ndarray, units: str) -> list[datetime]:
+    """
+    Decode time values when units are 'months since <reference_date>'.
+    netCDF4.num2date does not support 'months since' with the standard calendar.
+    """
+    # Parse "months since 2005-01-01 00:00:00" or similar
+    match = re.match(
+        r"months\s+since\s+(\d{4})-(\d{2})-(\d{2})(?:\s+(\d{2}):(\d{2}):(\d{2}))?",
+        units,
+        re.IGNORECASE,
+    )
+    if not match:
+        raise ValueError(f"Cannot parse 'months since' reference from units: {units}")
+    y, m, d = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    hh = int(match.group(4) or 0)
+    mm = int(match.group(5) or 0)
+    ss = int(match.group(6) or 0)
+    ref = datetime(y, m, d, hh, mm, ss)
+
+    result = []
+    for val in numpy.atleast_1d(times):
+        v = float(val)
+        months_int = int(v)
+        frac = v - months_int
+        dt = ref
+        # Add whole months
+        for _ in range(months_int):
+            if dt.month == 12:
+                dt = dt.replace(month=1, year=dt.year + 1)
+            else:
+                dt = dt.replace(month=dt.month + 1)
+        # Fractional month: approximate as fraction of 30 days
+        if frac != 0:
+            dt = dt + timedelta(days=frac * 30)
+        result.append(dt)
+    return result
+
+
+def decode_times(time_variable) -> list:
+    """Datetimes of a netCDF time variable"""
+    units = time_variable.units or ""
+    if "months since" in units.lower():
+        # num2date does not support "months since" with standard calendar
+        return _decode_time_months_since(time_variable[:], units)
+    return num2date(
+        times=time_variable[:],
+        units=time_variable.units,
+        calendar=getattr(time_variable, "calendar", "standard"),
+    )
+
+
+def _file_timestamps(file: Path, time_variable_name: str) -> list[str]:
+    """ISO timestamps of every time step of a file"""
+    with Dataset(file, "r") as nc:
+        times_dt = decode_times(nc.variables[time_variable_name])
+    return [t.isoformat() for t in times_dt]
+
 
 class NetCDFtoDbBase:
-    longitudes: dict[int, float] = {}
-    latitudes: dict[int, float] = {}
+    # Coordinate axes, the array index is the lat_id / lon_id
+    longitudes: numpy.ndarray = numpy.empty(0)
+    latitudes: numpy.ndarray = numpy.empty(0)
     timestamps: dict[str, Any] = {}
     levels: dict[Any, Any] = {}
     times_to_filename: dict[datetime, tuple[str, int]] = {}
-    gridboxes: dict[int, tuple[int, int]] = {}
-    gridbox_ids: list[int] = []
+    # gridbox_id = lat_id * n_lon + lon_id
+    gridbox_ids: numpy.ndarray = numpy.empty(0, dtype=numpy.int32)
     all_variable_locations: dict[str, int] = {}
 
     def __init__(
@@ -38,6 +135,11 @@ class NetCDFtoDbBase:
         longitude_variable_name: str | None = None,
         level_variable_name: str | None = None,
         variable_of_interest_name: str | None = None,
+        copy_format: str = "binary",
+        workers: int = 1,
+        partitions: int = 0,
+        point_layout: str = "none",
+        read_block_mb: int = DEFAULT_READ_BLOCK_MB,
     ) -> None:
         if isinstance(folder_root, str):
             folder_path = Path(folder_root)
@@ -52,6 +154,34 @@ class NetCDFtoDbBase:
         self.level_variable_name = level_variable_name
         self.variable_of_interest_name = variable_of_interest_name
 
+        if copy_format not in COPY_FORMATS:
+            raise ValueError(f"copy_format must be one of {COPY_FORMATS}")
+        self.copy_format = copy_format
+
+        # Number of processes loading grid_data, each with its own connection
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.connection_kwargs: dict[str, Any] = {}
+
+        # Number of range partitions of grid_data, 0 keeps it a single table
+        if partitions < 0:
+            raise ValueError("partitions can't be negative")
+        self.partitions = partitions
+
+        if point_layout not in POINT_LAYOUTS:
+            raise ValueError(f"point_layout must be one of {POINT_LAYOUTS}")
+        self.point_layout = point_layout
+
+        # Upper bound of the values buffer a timestamp is streamed through
+        if read_block_mb < 1:
+            raise ValueError("read_block_mb must be at least 1")
+        self.read_block_mb = read_block_mb
+
+        # Checkpointing of the current export run, see _run_group
+        self.run_id: int | None = None
+        self.completed_groups: set[str] = set()
+
         # Setup logging
         self.logger = logging.getLogger(self.__class__.__name__)
         return
@@ -119,28 +249,20 @@ class NetCDFtoDbBase:
                     )
 
             # Now get all lot/lon variable values based off index
-            raw_longitudes = nc.variables[self.longitude_variable_name][:]
-            longitudes = {}
-            for idx, value in enumerate(list(raw_longitudes)):
-                longitudes[idx] = float(value)
-            self.longitudes = longitudes
-
-            raw_latitudes = nc.variables[self.latitude_variable_name][:]
-            latitudes = {}
-            for idx, value in enumerate(list(raw_latitudes)):
-                latitudes[idx] = float(value)
-            self.latitudes = latitudes
+            self.longitudes = numpy.asarray(
+                nc.variables[self.longitude_variable_name][:], dtype=numpy.float64
+            ).reshape(-1)
+            self.latitudes = numpy.asarray(
+                nc.variables[self.latitude_variable_name][:], dtype=numpy.float64
+            ).reshape(-1)
 
             self._set_metadata_levels_from_netcdf(nc)
 
-            # Then create grid box ids based off of this
-            gridboxes: dict[int, tuple[int, int]] = {}
-            for gridbox_id, (lat_idx, lon_idx) in enumerate(
-                itertools.product(latitudes.keys(), longitudes.keys())
-            ):
-                gridboxes[gridbox_id] = (lat_idx, lon_idx)
-            self.gridboxes = gridboxes
-            self.gridbox_ids = list(self.gridboxes.keys())
+            # Then create grid box ids based off of this, lat major like the
+            # flattened (lat, lon) grids written to grid_data
+            self.gridbox_ids = numpy.arange(
+                len(self.latitudes) * len(self.longitudes), dtype=numpy.int32
+            )
 
             # Create a lookup of which features are where
             variable = nc[self.variable_of_interest_name]
@@ -252,18 +374,28 @@ class NetCDFtoDbBase:
                 """
                 cur.execute(create_level_table_sql)
 
-            # Generate grid_data table
+            # Generate grid_data table (grid_series is derived from it)
+            cur.execute("DROP TABLE IF EXISTS grid_series")
             cur.execute("DROP TABLE IF EXISTS grid_data")
+
+            # Partitioned tables can't be unlogged, their partitions are instead
+            if self.partitions > 0:
+                create_table = "CREATE TABLE"
+                partition_by = f"PARTITION BY RANGE ({self._partition_column()})"
+            else:
+                create_table = "CREATE UNLOGGED TABLE"
+                partition_by = ""
+
             if len(self.levels.keys()) == 0:
-                create_grid_data_table_sql = """
+                create_grid_data_table_sql = f"""
                     -- Table is unlogged for now, will add log back in later
-                    CREATE UNLOGGED TABLE grid_data (
+                    {create_table} grid_data (
                         gridbox_id		   INTEGER NOT NULL,
                         timestamp_id       INTEGER NOT NULL,
                         value_0            REAL
                         -- We will add keys back in after insertion is done
                         --PRIMARY KEY (gridbox_id, timestamp_id)
-                    );
+                    ) {partition_by};
                     -- We will add the indexes later (after insertion is completed)
                     --CREATE INDEX IF NOT EXISTS grid_data_gridbox_idx ON grid_data (gridbox_id);
                     --CREATE INDEX IF NOT EXISTS grid_data_ts_idx      ON grid_data (timestamp_id);
@@ -277,22 +409,164 @@ class NetCDFtoDbBase:
                 values_str = ",\n".join(values)
                 create_grid_data_table_sql = f"""
                     -- Table is unlogged for now, will add log back in later
-                    CREATE UNLOGGED TABLE grid_data (
+                    {create_table} grid_data (
                         gridbox_id		   INTEGER NOT NULL,
                         timestamp_id       INTEGER NOT NULL,
                         {values_str}
                         -- We will add keys back in after insertion is done
                         --PRIMARY KEY (gridbox_id, timestamp_id)
-                    );
+                    ) {partition_by};
                     -- We will add the indexes later (after insertion is completed)
                     --CREATE INDEX IF NOT EXISTS grid_data_gridbox_idx ON grid_data (gridbox_id);
                     --CREATE INDEX IF NOT EXISTS grid_data_ts_idx      ON grid_data (timestamp_id);
                     """
 
             cur.execute(create_grid_data_table_sql)
+            if self.partitions > 0:
+                self._create_grid_data_partitions(cur)
             conn.commit()
         return
 
+    ##############################
+    # grid_data partitions
+    ##############################
+    def _partition_column(self) -> str:
+        """grid_data is range partitioned on this column"""
+        return "timestamp_id"
+
+    def _partition_key_count(self) -> int:
+        """Number of distinct values of the partition column"""
+        files = sorted(self.folder_path.rglob("*.nc"))
+        return sum(self._time_steps_per_file(files))
+
+    def _time_steps_per_file(self, files: list[Path]) -> list[int]:
+        time_steps = []
+        for file in files:
+            with Dataset(file, "r") as nc:
+                time_steps.append(len(nc.variables[self.time_variable_name]))
+        return time_steps
+
+    def _timestamps_per_file(self, files: list[Path]) -> list[list[str]]:
+        """
+        ISO timestamps of every file, decoded in one pass up front so the ingest
+        loop only streams grid_data. The files are spread over `workers`
+        processes (HDF5 isn't thread safe)
+        """
+        if self.workers <= 1 or len(files) <= 1:
+            return [_file_timestamps(file, self.time_variable_name) for file in files]
+
+        chunksize = max(1, len(files) // (self.workers * 4))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            return list(
+                executor.map(
+                    _file_timestamps,
+                    files,
+                    [self.time_variable_name] * len(files),
+                    chunksize=chunksize,
+                )
+            )
+
+    def _partition_bounds(self) -> list[tuple[int, int]]:
+        """[start, end) ranges of equal width covering the partition key"""
+        key_count = max(self._partition_key_count(), 1)
+        width = -(-key_count // self.partitions)
+        return [(start, start + width) for start in range(0, key_count, width)]
+
+    def _create_grid_data_partitions(self, cur):
+        """
+        Partitions are created unlogged (like the monolithic table) and
+        switched to logged one by one once their indexes are built
+        """
+        bounds = self._partition_bounds()
+        self.logger.info(
+            f"Partitioning grid_data on {self._partition_column()} "
+            f"into {len(bounds)} partitions"
+        )
+        for idx, (start, end) in enumerate(bounds):
+            cur.execute(
+                f"""
+                CREATE UNLOGGED TABLE grid_data_p{idx:04d}
+                PARTITION OF grid_data FOR VALUES FROM ({start}) TO ({end});
+                """
+            )
+        return
+
+    def _extend_grid_data_partitions(self, cur, key_end: int) -> None:
+        """
+        Add partitions (same width as the last one) until [0, key_end) of the
+        partition column is covered. New partitions are attached to the
+        existing table, so they get its keys and indexes and nothing is rebuilt.
+        Only applies to grid_data partitioned on timestamp_id.
+        """
+        cur.execute("SELECT pg_get_partkeydef('grid_data'::regclass)")
+        if cur.fetchone()[0] != "RANGE (timestamp_id)":
+            return
+
+        cur.execute(
+            """
+            SELECT
+                MAX((regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \\((\\d+)\\)'))[1]::INTEGER)
+                , MAX((regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\((\\d+)\\)'))[1]::INTEGER)
+                , COUNT(*)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'grid_data'::regclass
+            """
+        )
+        last_start, end, n_partitions = cur.fetchone()
+        if n_partitions == 0:
+            return
+
+        width = end - last_start
+        while end < key_end:
+            partition_name = f"grid_data_p{n_partitions:04d}"
+            self.logger.info(
+                f"Adding partition {partition_name} [{end}, {end + width})"
+            )
+            cur.execute(
+                f"""
+                CREATE TABLE {partition_name}
+                PARTITION OF grid_data FOR VALUES FROM ({end}) TO ({end + width});
+                """
+            )
+            end += width
+            n_partitions += 1
+        return
+
+    @staticmethod
+    def _grid_data_partition_names(cur) -> list[str]:
+        cur.execute(
+            """
+            SELECT inhrelid::regclass::text
+            FROM pg_inherits
+            WHERE inhparent = 'grid_data'::regclass
+            ORDER BY 1
+            """
+        )
+        return [row[0] for row in cur.fetchall()]
+
+    def _finalize_grid_data_partition(self, partition_name: str) -> None:
+        """Keys, indexes and logging for one partition, on its own connection"""
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+        try:
+            with conn.cursor() as cur:
+                statements = [
+                    f"ALTER TABLE {partition_name} ADD PRIMARY KEY (gridbox_id, timestamp_id);",
+                    f"CREATE INDEX {partition_name}_ts_idx ON {partition_name} (timestamp_id);",
+                ]
+                # Cheapest while the partition is still unlogged
+                if self.point_layout == "cluster":
+                    statements.append(
+                        f"CLUSTER {partition_name} USING {partition_name}_pkey;"
+                    )
+                statements.append(f"ALTER TABLE {partition_name} SET LOGGED;")
+                for statement in statements:
+                    print(statement)
+                    cur.execute(statement)
+        finally:
+            conn.close()
+        return
+
     def _update_grid_box_table(self, conn) -> None:
         """
         Need to add logging back in and keys.
@@ -303,18 +577,206 @@ class NetCDFtoDbBase:
 
         """
         self.logger.info("Updating grid box table for usage: Adding Indexes, etc...")
+        if self.partitions > 0:
+            self._update_partitioned_grid_data_table(conn)
+        else:
+            # No separate gridbox_id index, the primary key prefix covers it
+            statements = [
+                "ALTER TABLE grid_data ADD PRIMARY KEY (gridbox_id, timestamp_id);",
+                "CREATE INDEX grid_data_ts_idx      ON grid_data (timestamp_id);",
+            ]
+            # Cheapest while the table is still unlogged
+            if self.point_layout == "cluster":
+                statements.append("CLUSTER grid_data USING grid_data_pkey;")
+            statements.append("ALTER TABLE grid_data SET LOGGED;")
+
+            with conn.cursor() as cur:
+                for statement in statements:
+                    print(statement)
+                    cur.execute(statement)
+
+        if self.point_layout == "series":
+            self._build_grid_series(conn)
+        return
+
+    def _update_partitioned_grid_data_table(self, conn) -> None:
+        """
+        Every partition is indexed and set logged concurrently (one connection
+        each, up to MAX_INDEX_BUILD_CONNECTIONS). Adding the key/index to the
+        parent afterwards only attaches the partition indexes that already exist.
+        """
+        with conn.cursor() as cur:
+            partition_names = self._grid_data_partition_names(cur)
+
+        connections = max(1, min(len(partition_names), MAX_INDEX_BUILD_CONNECTIONS))
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            # list() so errors from the partitions are raised here
+            list(executor.map(self._finalize_grid_data_partition, partition_names))
+
         with conn.cursor() as cur:
             statements = [
                 "ALTER TABLE grid_data ADD PRIMARY KEY (gridbox_id, timestamp_id);",
-                "CREATE INDEX grid_data_gridbox_idx ON grid_data (gridbox_id);",
                 "CREATE INDEX grid_data_ts_idx      ON grid_data (timestamp_id);",
-                "ALTER TABLE grid_data SET LOGGED;",
             ]
             for statement in statements:
                 print(statement)
                 cur.execute(statement)
         return
 
+    ##############################
+    # grid_series
+    ##############################
+    def _value_columns(self) -> list[str]:
+        if len(self.levels.keys()) == 0:
+            return ["value_0"]
+        return [f"value_{k}" for k in self.levels.keys()]
+
+    def _build_grid_series(self, conn) -> None:
+        """
+        Companion table for point reads: one row per gridbox holding every
+        value column as a REAL[] over all timestamps. Element n is the n-th
+        timestamp_dim row in timestamp_id order (NULL where grid_data has no
+        row), so a full series is a single (toasted) row instead of one heap
+        row per timestamp. grid_data stays as is for map frames.
+        """
+        value_columns = self._value_columns()
+        columns_sql = ",\n".join(f"{c} REAL[]" for c in value_columns)
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS grid_series")
+            cur.execute(
+                f"""
+                CREATE UNLOGGED TABLE grid_series (
+                    gridbox_id     INTEGER NOT NULL,
+                    {columns_sql}
+                );
+                """
+            )
+
+        batches = self._gridbox_batches()
+        self.logger.info(f"Building grid_series in {len(batches)} batches")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # list() so errors from the batches are raised here
+            list(executor.map(self._build_grid_series_batch, batches))
+
+        with conn.cursor() as cur:
+            statements = [
+                "ALTER TABLE grid_series ADD PRIMARY KEY (gridbox_id);",
+                "ALTER TABLE grid_series SET LOGGED;",
+                "ANALYZE grid_series;",
+            ]
+            for statement in statements:
+                print(statement)
+                cur.execute(statement)
+        return
+
+    def _gridbox_batches(self) -> list[tuple[int, int]]:
+        n_gridboxes = len(self.gridbox_ids)
+        return [
+            (start, min(start + GRID_SERIES_BATCH_SIZE, n_gridboxes))
+            for start in range(0, n_gridboxes, GRID_SERIES_BATCH_SIZE)
+        ]
+
+    def _update_grid_series(
+        self, conn, value_columns: list[str], from_timestamp_id: int = 0
+    ) -> None:
+        """
+        Bring grid_series up to date after an append. With `from_timestamp_id`
+        the values of the new timestamps are appended to the arrays, otherwise
+        the given columns are rebuilt.
+        """
+        with conn.cursor() as cur:
+            for column in value_columns:
+                cur.execute(
+                    f"ALTER TABLE grid_series ADD COLUMN IF NOT EXISTS {column} REAL[];"
+                )
+
+        batches = self._gridbox_batches()
+        self.logger.info(
+            f"Updating grid_series {value_columns} in {len(batches)} batches"
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # list() so errors from the batches are raised here
+            list(
+                executor.map(
+                    lambda bounds: self._update_grid_series_batch(
+                        bounds, value_columns, from_timestamp_id
+                    ),
+                    batches,
+                )
+            )
+        return
+
+    def _update_grid_series_batch(
+        self, bounds: tuple[int, int], value_columns: list[str], from_timestamp_id: int
+    ) -> None:
+        start, end = bounds
+        aggregates_sql = ", ".join(
+            f"array_agg(gd.{c} ORDER BY t.timestamp_id) AS {c}" for c in value_columns
+        )
+        prefix = "s.{c} || " if from_timestamp_id > 0 else ""
+        assignments_sql = ", ".join(
+            f"{c} = {prefix.format(c=c)}a.{c}" for c in value_columns
+        )
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET synchronous_commit TO OFF;")
+                cur.execute(
+                    f"""
+                    UPDATE grid_series s
+                    SET {assignments_sql}
+                    FROM (
+                        SELECT
+                            g.gridbox_id
+                            , {aggregates_sql}
+                        FROM gridbox g
+                        CROSS JOIN timestamp_dim t
+                        LEFT JOIN grid_data gd
+                            ON gd.gridbox_id = g.gridbox_id
+                            AND gd.timestamp_id = t.timestamp_id
+                        WHERE g.gridbox_id >= %s AND g.gridbox_id < %s
+                          AND t.timestamp_id >= %s
+                        GROUP BY g.gridbox_id
+                    ) a
+                    WHERE s.gridbox_id = a.gridbox_id
+                    """,
+                    (start, end, from_timestamp_id),
+                )
+        finally:
+            conn.close()
+        return
+
+    def _build_grid_series_batch(self, bounds: tuple[int, int]) -> None:
+        """Aggregate the gridboxes in [start, end) on its own connection"""
+        start, end = bounds
+        value_columns = self._value_columns()
+        aggregates_sql = ", ".join(
+            f"array_agg(gd.{c} ORDER BY t.timestamp_id)" for c in value_columns
+        )
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET synchronous_commit TO OFF;")
+                cur.execute(
+                    f"""
+                    INSERT INTO grid_series (gridbox_id, {", ".join(value_columns)})
+                    SELECT
+                        g.gridbox_id
+                        , {aggregates_sql}
+                    FROM gridbox g
+                    CROSS JOIN timestamp_dim t
+                    LEFT JOIN grid_data gd
+                        ON gd.gridbox_id = g.gridbox_id
+                        AND gd.timestamp_id = t.timestamp_id
+                    WHERE g.gridbox_id >= %s AND g.gridbox_id < %s
+                    GROUP BY g.gridbox_id
+                    """,
+                    (start, end),
+                )
+        finally:
+            conn.close()
+        return
+
     def _create_sql_functions(self, conn):
         raise NotImplementedError
 
@@ -334,8 +796,9 @@ class NetCDFtoDbBase:
         """
         Notes:
             - Trying to do INSERT INTO statements is terribly slow
-            - It's much faster to insert CSV data into the Postgres
-            - So, we use streams to write the CSV data to and then insert it
+            - lat / lon / gridbox are written straight from the NumPy axes with
+              a binary COPY, gridbox lat_id / lon_id are derived from the id
+            - Levels are few, so they still go through a CSV stream
         Args:
             conn:
 
@@ -345,46 +808,32 @@ class NetCDFtoDbBase:
         self.logger.info("Populating postgres common tables")
         with conn.cursor() as cur:
             # Insert latitudes
-            with io.StringIO() as csv_buffer_latitudes:
-                df_lat = pandas.DataFrame(
-                    [{"lat_id": idx, "lat": val} for idx, val in self.latitudes.items()]
-                )
-                df_lat.to_csv(csv_buffer_latitudes, index=False)
-                csv_buffer_latitudes.seek(0)
-                cur.copy_expert(
-                    "COPY lat (lat_id, lat) FROM STDIN WITH (FORMAT csv, HEADER true)",
-                    csv_buffer_latitudes,
-                )
+            PgBinaryCopy.copy(
+                cur,
+                table="lat",
+                column_names=["lat_id", "lat"],
+                columns=[numpy.arange(len(self.latitudes)), self.latitudes],
+                pg_types=["int2", "float4"],
+            )
 
             # Insert longitudes
-            with io.StringIO() as csv_buffer_longitudes:
-                df_lon = pandas.DataFrame(
-                    [
-                        {"lon_id": idx, "lon": val}
-                        for idx, val in self.longitudes.items()
-                    ]
-                )
-                df_lon.to_csv(csv_buffer_longitudes, index=False)
-                csv_buffer_longitudes.seek(0)
-                cur.copy_expert(
-                    "COPY lon (lon_id, lon) FROM STDIN WITH (FORMAT csv, HEADER true)",
-                    csv_buffer_longitudes,
-                )
+            PgBinaryCopy.copy(
+                cur,
+                table="lon",
+                column_names=["lon_id", "lon"],
+                columns=[numpy.arange(len(self.longitudes)), self.longitudes],
+                pg_types=["int2", "float4"],
+            )
 
             # Insert gridboxes
-            with io.StringIO() as csv_buffer_gridboxes:
-                df_gridbox = pandas.DataFrame(
-                    [
-                        {"gridbox_id": grid_idx, "lat_id": lat_idx, "lon_id": lon_idx}
-                        for grid_idx, (lat_idx, lon_idx) in self.gridboxes.items()
-                    ]
-                )
-                df_gridbox.to_csv(csv_buffer_gridboxes, index=False)
-                csv_buffer_gridboxes.seek(0)
-                cur.copy_expert(
-                    "COPY gridbox (gridbox_id, lat_id, lon_id) FROM STDIN WITH (FORMAT csv, HEADER true)",
-                    csv_buffer_gridboxes,
-                )
+            lat_ids, lon_ids = numpy.divmod(self.gridbox_ids, len(self.longitudes))
+            PgBinaryCopy.copy(
+                cur,
+                table="gridbox",
+                column_names=["gridbox_id", "lat_id", "lon_id"],
+                columns=[self.gridbox_ids, lat_ids, lon_ids],
+                pg_types=["int4", "int2", "int2"],
+            )
 
             if len(self.levels.keys()) > 0:
                 with io.StringIO() as csv_buffer_levels:
@@ -409,8 +858,8 @@ class NetCDFtoDbBase:
     def _process_multi_level_gridbox_data(
         self, data, dim_names, fill_value, time_id, cur
     ):
-        n_lat = len(self.latitudes.keys())
-        n_lon = len(self.longitudes.keys())
+        n_lat = len(self.latitudes)
+        n_lon = len(self.longitudes)
         n_levels = len(self.levels.keys())
 
         # If it's a masked array, fill masked with NaN
@@ -453,8 +902,39 @@ class NetCDFtoDbBase:
             flat_values = data_lat_lon_level.reshape(-1, n_levels)
             value_cols = [f"value_{k}" for k in list(self.levels.keys())]
 
+        if self.copy_format == "binary":
+            self._copy_gridbox_data_binary(flat_values, value_cols, time_id, cur)
+        else:
+            self._copy_gridbox_data_csv(flat_values, value_cols, time_id, cur)
+        return
+
+    def _copy_gridbox_data_binary(
+        self, flat_values, value_cols, time_id, cur, gridbox_ids=None, table="grid_data"
+    ):
+        """
+        Binary COPY straight from the NumPy arrays, skips formatting every float
+        as text (and Postgres parsing it back)
+        """
+        if gridbox_ids is None:
+            gridbox_ids = self.gridbox_ids
+        values_2d = flat_values.reshape(len(gridbox_ids), len(value_cols))
+        PgBinaryCopy.copy(
+            cur,
+            table=table,
+            column_names=["gridbox_id", "timestamp_id"] + value_cols,
+            columns=[gridbox_ids, time_id]
+            + [values_2d[:, k] for k in range(len(value_cols))],
+            pg_types=["int4", "int4"] + ["float4"] * len(value_cols),
+        )
+        return
+
+    def _copy_gridbox_data_csv(
+        self, flat_values, value_cols, time_id, cur, gridbox_ids=None, table="grid_data"
+    ):
+        if gridbox_ids is None:
+            gridbox_ids = self.gridbox_ids
         df_griddata = pandas.DataFrame(flat_values, columns=value_cols)
-        df_griddata.insert(0, "gridbox_id", self.gridbox_ids)
+        df_griddata.insert(0, "gridbox_id", gridbox_ids)
         df_griddata.insert(1, "timestamp_id", time_id)
 
         # Reshape data to gridbox_id, timestamp_id, value
@@ -464,7 +944,7 @@ class NetCDFtoDbBase:
             values_str = ",".join(value_cols)
             cur.copy_expert(
                 f"""
-                COPY grid_data (gridbox_id, timestamp_id, {values_str})
+                COPY {table} (gridbox_id, timestamp_id, {values_str})
                 FROM STDIN WITH (FORMAT csv, HEADER true, NULL '')
                 """,
                 csv_buffer_grid_date,
@@ -478,7 +958,13 @@ class NetCDFtoDbBase:
         password: str,
         host="localhost",
         port=5432,
+        resume: bool = False,
     ):
+        """
+        Full ingest. With `resume`, a previous run that died while loading
+        grid_data continues after its last committed group instead of
+        starting over (as long as the files are the same).
+        """
         # Create Database
         PostgresCommon.create_database(
             database_name=database_name,
@@ -488,15 +974,99 @@ class NetCDFtoDbBase:
             port=port,
         )
 
-        # Create the connection
-        conn = PostgresCommon.create_connection(
+        # Create the connection (kept so parallel workers can open their own)
+        self.connection_kwargs = dict(
             database_name=database_name,
             user=user,
             password=password,
             host=host,
             port=port,
         )
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+
+        files = sorted(self.folder_path.rglob("*.nc"))
+        file_list_hash = IngestCheckpoint.file_list_hash(self.folder_path, files)
+        resume_from = None
+        with conn.cursor() as cur:
+            IngestCheckpoint.create_tables(cur)
+            if resume:
+                resume_from = IngestCheckpoint.resumable_run(cur, file_list_hash)
+                if resume_from is None:
+                    self.logger.info("Nothing to resume, starting a new ingest")
+
+        if resume_from is None:
+            self._prepare_export(conn)
+
+            with conn.cursor() as cur:
+                self.run_id = IngestCheckpoint.start_run(cur, file_list_hash)
+            self.completed_groups = set()
+        else:
+            self.run_id, self.completed_groups = resume_from
+            self.logger.info(
+                f"Resuming run {self.run_id}, "
+                f"{len(self.completed_groups)} groups already loaded"
+            )
+
+        # Populate the data tables
+        self._populate_postgres_data_tables(conn)
+
+        with conn.cursor() as cur:
+            IngestCheckpoint.set_status(cur, self.run_id, RUN_FINALIZING)
 
+        self._finalize_export(conn)
+
+        with conn.cursor() as cur:
+            IngestCheckpoint.set_status(cur, self.run_id, RUN_DONE)
+        self.run_id = None
+        return
+
+    def export_stream_to_postgres(
+        self,
+        files: Iterable[Path],
+        database_name: str,
+        user: str,
+        password: str,
+        host="localhost",
+        port=5432,
+    ) -> None:
+        """
+        Full ingest of files that are still arriving (e.g. being downloaded):
+        every file is loaded as soon as `files` yields it, in that order. The
+        metadata comes from the files already in the folder, so at least the
+        first one must be there when this is called. Not checkpointed (no
+        resume) and grid_data can't be partitioned, its size isn't known.
+
+        Everything goes into a staging database that replaces `database_name`
+        once it's complete, when `files` raises (a download failed) the
+        staging database is dropped and the current data stays as it was
+        """
+        if self.partitions:
+            raise ValueError("Streamed ingests can't partition grid_data")
+
+        server_kwargs = dict(user=user, password=password, host=host, port=port)
+        staging_name = f"{database_name}{STAGING_DATABASE_SUFFIX}"
+        # Left over by a run that died
+        PostgresCommon.drop_database(staging_name, **server_kwargs)
+        PostgresCommon.create_database(database_name=staging_name, **server_kwargs)
+        self.connection_kwargs = dict(database_name=staging_name, **server_kwargs)
+
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+        try:
+            self._prepare_export(conn)
+            self._populate_postgres_data_stream(conn, files)
+            self._finalize_export(conn)
+        except BaseException:
+            conn.close()
+            self.logger.error(f"Ingest failed, dropping {staging_name}")
+            PostgresCommon.drop_database(staging_name, **server_kwargs)
+            raise
+        conn.close()
+
+        PostgresCommon.replace_database(staging_name, database_name, **server_kwargs)
+        self.connection_kwargs = dict(database_name=database_name, **server_kwargs)
+        return
+
+    def _prepare_export(self, conn) -> None:
         # Generate the required tables
         self._generate_postgres_tables(conn)
 
@@ -505,18 +1075,286 @@ class NetCDFtoDbBase:
 
         # Populate the non-data tables
         self._populate_postgres_common_tables(conn)
+        return
 
-        # Populate the data tables
-        self._populate_postgres_data_tables(conn)
-
+    def _finalize_export(self, conn) -> None:
         # Modify gridbox table to add indexes
         self._update_grid_box_table(conn)
 
         # Add the sql methods
         self._create_sql_functions(conn)
 
+        self._stamp_ingest(conn)
+        return
+
+    def _run_group(self, cur, group_key: str, method_name: str, *args) -> int:
+        """
+        Load one group of timestamps with `self.<method_name>(cur, *args)`,
+        which returns the timestamps it wrote. During an export run the group
+        is committed atomically together with its checkpoint, groups committed
+        by the run being resumed are skipped.
+        """
+        method = getattr(self, method_name)
+        if self.run_id is None:
+            return method(cur, *args)
+        if group_key in self.completed_groups:
+            return 0
+
+        start = time.perf_counter()
+        cur.execute("BEGIN;")
+        try:
+            n_timestamps = method(cur, *args)
+            IngestCheckpoint.record(
+                cur,
+                run_id=self.run_id,
+                group_key=group_key,
+                n_timestamps=n_timestamps,
+                seconds=time.perf_counter() - start,
+            )
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+        cur.execute("COMMIT;")
+        return n_timestamps
+
+    def append_data_to_postgres(
+        self,
+        database_name: str,
+        user: str,
+        password: str,
+        host="localhost",
+        port=5432,
+    ) -> int:
+        """
+        Incremental version of export_data_to_postgres for growing datasets.
+        Only time steps that aren't in timestamp_dim yet are loaded, straight
+        into the existing (keyed, indexed and logged) tables: nothing is
+        dropped or truncated and the indexes are only extended.
+
+        Returns:
+            Number of grid_data timestamps written
+        """
+        self.connection_kwargs = dict(
+            database_name=database_name,
+            user=user,
+            password=password,
+            host=host,
+            port=port,
+        )
+        conn = PostgresCommon.create_connection(**self.connection_kwargs)
+        try:
+            self._check_existing_grid(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('grid_series') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    self.point_layout = "series"
+
+            n_timestamps = self._append_postgres_data_tables(conn)
+            if n_timestamps == 0:
+                self.logger.info("No new timestamps to append")
+                return 0
+
+            self.logger.info(f"Appended {n_timestamps} timestamps")
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE grid_data;")
+                cur.execute("ANALYZE timestamp_dim;")
+
+            # The functions embed the levels/years, so they're refreshed too
+            self._create_sql_functions(conn)
+
+            self._stamp_ingest(conn)
+        finally:
+            conn.close()
+        return n_timestamps
+
+    @staticmethod
+    def _stamp_ingest(conn) -> None:
+        """
+        Record when grid_data last changed, the API keys its response caches
+        on it (appending to existing timestamps doesn't change timestamp_dim)
+        """
+        with conn.cursor() as cur:
+            cur.execute(
+                f"COMMENT ON TABLE grid_data IS 'ingested {datetime.now().isoformat()}'"
+            )
         return
 
+    ##############################
+    # Streaming grid_data reads
+    ##############################
+    def _copy_gridbox_blocks(
+        self,
+        sources: list,
+        time_id: int,
+        cur,
+        value_cols: list[str] | None = None,
+        table: str = "grid_data",
+    ) -> None:
+        """
+        Load one grid_data timestamp without materializing the whole grid:
+        bands of latitude rows are read, masked and copied through a single
+        preallocated block buffer, one COPY per band.
+
+        Args:
+            sources: One entry per group of value columns, in column order.
+                Either (variable, time_idx), read with the level axis (if the
+                dataset has levels) as its columns, or None for a column of NaN
+                (ie: a year without a file for that day).
+            time_id: grid_data timestamp_id
+            cur: Cursor to COPY with
+            value_cols: Value columns to load, defaults to all of them
+            table: Table to COPY into (with grid_data's columns)
+        """
+        if value_cols is None:
+            value_cols = self._value_columns()
+        for first_row, values_2d in self._iter_gridbox_blocks(sources, len(value_cols)):
+            gridbox_ids = self.gridbox_ids[slice(first_row, first_row + len(values_2d))]
+            if self.copy_format == "binary":
+                self._copy_gridbox_data_binary(
+                    values_2d, value_cols, time_id, cur, gridbox_ids, table
+                )
+            else:
+                self._copy_gridbox_data_csv(
+                    values_2d, value_cols, time_id, cur, gridbox_ids, table
+                )
+        return
+
+    def _iter_gridbox_blocks(self, sources: list, n_columns: int):
+        """
+        Yields (first gridbox row, (rows, n_columns) values) per latitude band.
+        The values are a view of the same buffer, consume them before the next
+        """
+        n_lat = len(self.latitudes)
+        n_lon = len(self.longitudes)
+        variables = [source[0] for source in sources if source is not None]
+        for variable in variables:
+            if not any(hasattr(variable, a) for a in AUTO_MASK_ATTRIBUTES):
+                # Fill values are masked in place in the buffer instead of
+                # netCDF4 building a masked array for every read
+                variable.set_auto_mask(False)
+
+        block_rows = self._block_rows(variables, n_columns)
+        buffer = numpy.empty((block_rows, n_lon, n_columns), dtype=numpy.float32)
+        for start in range(0, n_lat, block_rows):
+            end = min(start + block_rows, n_lat)
+            # The first rows of the buffer are contiguous, so this stays a view
+            block = buffer[slice(0, end - start)]
+            column = 0
+            for source in sources:
+                if source is None:
+                    block[..., column] = numpy.nan
+                    column += 1
+                    continue
+                variable, time_idx = source
+                column += self._read_block(
+                    variable, time_idx, start, end, block, column
+                )
+            yield start * n_lon, block.reshape(-1, n_columns)
+        return
+
+    def _block_rows(self, variables: list, n_columns: int) -> int:
+        """
+        Latitude rows per block: as many as fit read_block_mb, rounded down to
+        whole on-disk chunks so no chunk is decompressed for two blocks
+        """
+        row_bytes = (
+            len(self.longitudes) * n_columns * numpy.dtype(numpy.float32).itemsize
+        )
+        block_rows = max(1, (self.read_block_mb * 1024**2) // row_bytes)
+        for variable in variables:
+            chunking = variable.chunking()
+            if chunking == "contiguous" or chunking is None:
+                continue
+            lat_chunk = chunking[variable.dimensions.index(self.latitude_variable_name)]
+            block_rows = max(lat_chunk, block_rows // lat_chunk * lat_chunk)
+            break
+        return min(block_rows, len(self.latitudes))
+
+    def _read_block(
+        self, variable, time_idx: int, start: int, end: int, block, column: int
+    ) -> int:
+        """
+        Read latitude rows [start, end) of one time step into
+        block[..., column:], returns how many value columns were written
+        """
+        indexer = []
+        dims = []
+        for name in variable.dimensions:
+            if name == self.time_variable_name:
+                indexer.append(time_idx)
+                continue
+            indexer.append(
+                slice(start, end)
+                if name == self.latitude_variable_name
+                else slice(None)
+            )
+            dims.append(name)
+        data = variable[tuple(indexer)]
+
+        axes = [
+            dims.index(self.latitude_variable_name),
+            dims.index(self.longitude_variable_name),
+        ]
+        if len(self.levels.keys()) > 0 and self.level_variable_name in dims:
+            axes.append(dims.index(self.level_variable_name))
+        values = numpy.transpose(data, axes)
+        if values.ndim == 2:
+            values = values[..., numpy.newaxis]
+        width = values.shape[2]
+        target = block[..., slice(column, column + width)]
+
+        if numpy.ma.isMaskedArray(values):
+            # netCDF4 already masked the fill values
+            numpy.copyto(target, values.data, casting="unsafe")
+            if values.mask is not numpy.ma.nomask:
+                target[numpy.ma.getmaskarray(values)] = numpy.nan
+        else:
+            # Auto-masking is off, mask what netCDF4 would have (compared
+            # in the variable's own type, before the float32 cast)
+            numpy.copyto(target, values, casting="unsafe")
+            fill_values = self._fill_values(variable)
+            if len(fill_values) > 0:
+                target[numpy.isin(values, fill_values)] = numpy.nan
+        return width
+
+    @staticmethod
+    def _fill_values(variable) -> numpy.ndarray:
+        """
+        Values netCDF4 masks for a variable: its _FillValue and missing_value,
+        or without either the default fill value of its type (except bytes)
+        """
+        fill_values = []
+        for attribute in ("_FillValue", "missing_value"):
+            if hasattr(variable, attribute):
+                fill_values.extend(numpy.atleast_1d(getattr(variable, attribute)))
+        type_code = variable.dtype.str[1:]
+        if not fill_values and type_code not in ("i1", "u1"):
+            fill_values.append(default_fillvals[type_code])
+        return numpy.array(fill_values).astype(variable.dtype)
+
+    def _check_existing_grid(self, conn) -> None:
+        """The files must be on the same grid as the existing database"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('grid_data') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                raise ValueError(
+                    "No grid_data table to append to, run a full ingest first"
+                )
+            cur.execute("SELECT (SELECT COUNT(*) FROM lat), (SELECT COUNT(*) FROM lon)")
+            n_lat, n_lon = cur.fetchone()
+        if (n_lat, n_lon) != (len(self.latitudes), len(self.longitudes)):
+            raise ValueError(
+                f"Grid mismatch: database has {n_lat}x{n_lon} lat/lon, "
+                f"files have {len(self.latitudes)}x{len(self.longitudes)}"
+            )
+        return
+
+    def _append_postgres_data_tables(self, conn) -> int:
+        raise NotImplementedError
+
+    def _populate_postgres_data_stream(self, conn, files: Iterable[Path]) -> None:
+        raise NotImplementedError
+
 
 def main():
     if True:
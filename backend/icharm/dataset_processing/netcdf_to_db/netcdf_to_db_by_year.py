@@ -3,16 +3,21 @@ from icharm.dataset_processing.netcdf_to_db.infer_cadence import (
     GroupFilesByCadence,
 )
 
-import numpy
 import os
 
+from contextlib import ExitStack
 from pathlib import Path
 
 from netCDF4 import Dataset, num2date
 from tqdm import tqdm
 from typing import Any
 
-from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import NetCDFtoDbBase
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import (
+    DEFAULT_READ_BLOCK_MB,
+    NetCDFtoDbBase,
+)
+from icharm.dataset_processing.netcdf_to_db.parallel_ingest import ParallelIngest
+from icharm.dataset_processing.postgres_common import PostgresCommon
 from icharm.utils.benchmark import benchmark
 
 from dotenv import load_dotenv
@@ -30,6 +35,11 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
         level_variable_name: str | None = None,
         variable_of_interest_name: str | None = None,
         years: list[str] | None = None,
+        copy_format: str = "binary",
+        workers: int = 1,
+        partitions: int = 0,
+        point_layout: str = "none",
+        read_block_mb: int = DEFAULT_READ_BLOCK_MB,
     ) -> None:
         super().__init__(
             folder_root=folder_root,
@@ -38,6 +48,11 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
             longitude_variable_name=longitude_variable_name,
             level_variable_name=level_variable_name,
             variable_of_interest_name=variable_of_interest_name,
+            copy_format=copy_format,
+            workers=workers,
+            partitions=partitions,
+            point_layout=point_layout,
+            read_block_mb=read_block_mb,
         )
         self.years = years
 
@@ -45,6 +60,16 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
         self._find_features()
         return
 
+    def _partition_column(self) -> str:
+        """
+        Year-column datasets have few timestamps (MM-DD) and are read per
+        gridbox, so they're partitioned on gridbox_id
+        """
+        return "gridbox_id"
+
+    def _partition_key_count(self) -> int:
+        return len(self.gridbox_ids)
+
     def _set_metadata_levels_from_netcdf(self, nc: Dataset):
         """
         For this class, we're overriding the levels
@@ -107,33 +132,25 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
         self.logger.info("Creating SQL functions")
         with conn.cursor() as cur:
             ###############################
-            # get_timestamps_internal()
+            # usable_timestamp_dim
             ###############################
-            # For internal use only (the front-end shouldn't use this)
-            # This is a helper function to get valid only dates from the dataset
-            cur.execute("DROP FUNCTION IF EXISTS get_timestamps_internal();")
-            get_timestamps_internal_sql = """
-                CREATE FUNCTION get_timestamps_internal()
-                RETURNS TABLE (
-                    usable_timestamp_id INT
-                    , timestamp_id      INT
-                    , timestamp_val     TIMESTAMP
-                    , year              CHAR(4)
-                    , month_day_time    CHAR(4)
-                )
-                LANGUAGE sql
-                AS $$
+            # Every valid date of the dataset (year + month_day pair that exists
+            # in the calendar), materialized once per ingest instead of being
+            # generated on every call. value_column is the grid_data column
+            # holding the values of that year.
+            cur.execute("BEGIN;")
+            cur.execute("DROP TABLE IF EXISTS usable_timestamp_dim;")
+            create_usable_timestamp_dim_sql = """
+                CREATE TABLE usable_timestamp_dim AS
                     -- Create all of the dates from the year and month_day pairs
-                    -- Also grab all the data for gridbox = 1 (so we can then remove dates that
-                    -- do not have values later
                     WITH SubTable AS (
                         SELECT
                                 td.timestamp_id
                                 , TO_TIMESTAMP(
                                     l.name || '-' || td.timestamp_val
                                     , 'YYYY-MM-DD"T"HH24:MI:SS'
-                                ) AS timestamp_value
-                                , l.name AS year
+                                )::TIMESTAMP AS timestamp_val
+                                , l.name::CHAR(4) AS year
                                 , td.timestamp_val AS month_day_time
                             FROM level l
                             CROSS JOIN timestamp_dim td
@@ -152,13 +169,51 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                                 )
                     )
                     SELECT
-                            ROW_NUMBER() OVER (ORDER BY timestamp_value ASC) AS usable_timestamp_id
+                            (ROW_NUMBER() OVER (ORDER BY timestamp_val ASC))::INT AS usable_timestamp_id
                             , timestamp_id
-                            , timestamp_value
+                            , timestamp_val
                             , "year"
                             , month_day_time
+                            , ('value_' || TRIM("year"))::TEXT AS value_column
                         FROM SubTable
-                        ORDER BY timestamp_value ASC
+                        ORDER BY timestamp_val ASC;
+            """
+            cur.execute(create_usable_timestamp_dim_sql)
+            cur.execute(
+                "ALTER TABLE usable_timestamp_dim ADD PRIMARY KEY (usable_timestamp_id);"
+            )
+            cur.execute(
+                "CREATE INDEX usable_timestamp_dim_year_idx ON usable_timestamp_dim (year, timestamp_val);"
+            )
+            cur.execute("COMMIT;")
+            cur.execute("ANALYZE usable_timestamp_dim;")
+
+            ###############################
+            # get_timestamps_internal()
+            ###############################
+            # For internal use only (the front-end shouldn't use this)
+            # Kept for compatibility, reads the materialized usable_timestamp_dim
+            cur.execute("DROP FUNCTION IF EXISTS get_timestamps_internal();")
+            get_timestamps_internal_sql = """
+                CREATE FUNCTION get_timestamps_internal()
+                RETURNS TABLE (
+                    usable_timestamp_id INT
+                    , timestamp_id      INT
+                    , timestamp_val     TIMESTAMP
+                    , year              CHAR(4)
+                    , month_day_time    CHAR(14)
+                )
+                LANGUAGE sql
+                STABLE
+                AS $$
+                    SELECT
+                            usable_timestamp_id
+                            , timestamp_id
+                            , timestamp_val
+                            , "year"
+                            , month_day_time
+                        FROM usable_timestamp_dim
+                        ORDER BY usable_timestamp_id ASC
                 $$;
             """
             cur.execute(get_timestamps_internal_sql)
@@ -176,7 +231,9 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                 )
                 LANGUAGE sql
                 AS $$
-                    SELECT usable_timestamp_id, timestamp_val FROM get_timestamps_internal()
+                    SELECT usable_timestamp_id, timestamp_val
+                    FROM usable_timestamp_dim
+                    ORDER BY usable_timestamp_id ASC
                 $$;
             """
             cur.execute(get_dates_sql)
@@ -256,37 +313,33 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                 LANGUAGE plpgsql
                 AS $$
                 DECLARE
-                    yr TEXT;
+                    ts_id INT;
                     colname TEXT;
                 BEGIN
-                    SELECT d.year INTO yr
-                    FROM get_timestamps_internal() d
-                    WHERE d.usable_timestamp_id = in_timestamp_id
-                    LIMIT 1;
-
                     -- This is how we get the correct column name
                     -- and avoid doing the slow "to_jsonb()" method
-                    colname := 'value_' || yr;
+                    SELECT d.timestamp_id, d.value_column INTO ts_id, colname
+                    FROM usable_timestamp_dim d
+                    WHERE d.usable_timestamp_id = in_timestamp_id;
+
+                    IF colname IS NULL THEN
+                        RETURN;
+                    END IF;
 
                     RETURN QUERY EXECUTE format($q$
-                        WITH s AS (
-                            SELECT timestamp_id
-                            FROM get_timestamps_internal() d
-                            WHERE d.usable_timestamp_id = $1
-                        )
                         SELECT
                             gd.gridbox_id
                             , lat.lat::double precision AS lat
                             , lon.lon::double precision AS lon
                             , gd.%I::double precision AS value
-                        FROM s
-                        JOIN grid_data gd ON s.timestamp_id = gd.timestamp_id
+                        FROM grid_data gd
                         JOIN gridbox gb ON gd.gridbox_id = gb.gridbox_id
                         JOIN lat ON lat.lat_id = gb.lat_id
                         JOIN lon ON lon.lon_id = gb.lon_id
+                        WHERE gd.timestamp_id = $1
                         ORDER BY gd.gridbox_id
                     $q$, colname)
-                    USING in_timestamp_id;
+                    USING ts_id;
                 END;
                 $$;
             """
@@ -305,7 +358,19 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                     , in_level_id INTEGER  -- Throw away value (we don't need it)
                 );
             """)
-            sql_get_timeseries_sql = """
+            # One statement for the whole series: the single grid_data row per
+            # timestamp_dim entry is fanned out into one row per year column
+            # with a LATERAL VALUES list, instead of a dynamic query per year.
+            # The list is rebuilt whenever the functions are (ingest / append).
+            cur.execute(
+                "SELECT DISTINCT year, value_column FROM usable_timestamp_dim ORDER BY year;"
+            )
+            year_columns = cur.fetchall()
+            year_values_sql = "\n                        , ".join(
+                f"('{year}'::CHAR(4), {{source}}.{column})"
+                for year, column in year_columns
+            )
+            sql_get_timeseries_sql = f"""
                 CREATE OR REPLACE FUNCTION get_timeseries(
                     in_gridbox_id INTEGER
                     , in_level_id INTEGER  -- unused
@@ -316,40 +381,68 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                     , level_id         INT
                     , value            DOUBLE PRECISION
                 )
-                LANGUAGE plpgsql
+                LANGUAGE sql
+                STABLE
                 AS $$
-                DECLARE
-                    yr TEXT;
-                    colname TEXT;
-                    lvl_id INT;
-                BEGIN
-                    FOR yr, lvl_id IN
-                        SELECT DISTINCT
-                            "year"
+                    SELECT
+                            d.usable_timestamp_id AS timestamp_id
+                            , d.timestamp_val
                             , 1 AS level_id
-                        FROM get_timestamps_internal() d
-                        ORDER BY "year"
-                    LOOP
-                        colname := 'value_' || yr;
-
-                        RETURN QUERY EXECUTE format($q$
-                            SELECT
+                            , v.value::double precision AS value
+                        FROM grid_data gd
+                        CROSS JOIN LATERAL (VALUES
+                            {year_values_sql.format(source="gd")}
+                        ) AS v(year, value)
+                        JOIN usable_timestamp_dim d
+                          ON d.timestamp_id = gd.timestamp_id
+                         AND d.year = v.year
+                        WHERE gd.gridbox_id = in_gridbox_id
+                        ORDER BY d.timestamp_val
+                $$;
+            """
+            if self.point_layout == "series":
+                # Read the whole series from the single grid_series row, all the
+                # year arrays are unnested side by side
+                series_columns_sql = ", ".join(f"gs.{c}" for _, c in year_columns)
+                series_aliases_sql = ", ".join(c for _, c in year_columns)
+                sql_get_timeseries_sql = f"""
+                    CREATE OR REPLACE FUNCTION get_timeseries(
+                        in_gridbox_id INTEGER
+                        , in_level_id INTEGER  -- unused
+                    )
+                    RETURNS TABLE (
+                        timestamp_id       INT
+                        , timestamp_value  TIMESTAMP
+                        , level_id         INT
+                        , value            DOUBLE PRECISION
+                    )
+                    LANGUAGE sql
+                    STABLE
+                    AS $$
+                        SELECT
                                 d.usable_timestamp_id AS timestamp_id
                                 , d.timestamp_val
-                                , %s::int AS level_id
-                                , gd.%I::double precision AS value
-                            FROM get_timestamps_internal() d
-                            JOIN grid_data gd
-                              ON d.timestamp_id = gd.timestamp_id
-                            WHERE gd.gridbox_id = $1
-                              AND d.year = %L
+                                , 1 AS level_id
+                                , v.value::double precision AS value
+                            FROM grid_series gs
+                            CROSS JOIN LATERAL UNNEST({series_columns_sql})
+                                WITH ORDINALITY AS s({series_aliases_sql}, n)
+                            JOIN (
+                                SELECT
+                                    timestamp_id
+                                    , ROW_NUMBER() OVER (ORDER BY timestamp_id) AS n
+                                FROM timestamp_dim
+                            ) t ON t.n = s.n
+                            CROSS JOIN LATERAL (VALUES
+                                {year_values_sql.format(source="s")}
+                            ) AS v(year, value)
+                            JOIN usable_timestamp_dim d
+                              ON d.timestamp_id = t.timestamp_id
+                             AND d.year = v.year
+                            WHERE gs.gridbox_id = in_gridbox_id
                             ORDER BY d.timestamp_val
-                        $q$, lvl_id, colname, yr)
-                        USING in_gridbox_id;
-                    END LOOP;
-                END;
-                $$;
-            """
+                    $$;
+                """
             cur.execute(sql_get_timeseries_sql)
             conn.commit()
         return
@@ -364,48 +457,43 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
             # Go through all the files and get all the distinct month+day+extras
             self.logger.info("Scanning all files to determine all months + days")
             files = sorted(self.folder_path.rglob("*.nc"))
-            all_timestamps = set()
-            for file_idx, file in enumerate(tqdm(files)):
-                # filename_path = str(file)
-                with Dataset(file, "r") as nc:
-                    # Get all dates in the current file (there can be more than 1)
-                    time_variable = nc.variables[self.time_variable_name]
-                    times_dt = num2date(
-                        times=time_variable[:],
-                        units=time_variable.units,
-                        calendar=getattr(time_variable, "calendar", "standard"),
-                    )
-                    for idx, time_dt in enumerate(times_dt):
-                        iso_formatted_time = time_dt.isoformat()
-                        # Remove the year
-                        iso_formatted_time = iso_formatted_time[5:]
-                        all_timestamps.add(iso_formatted_time)
+            # Remove the year
+            all_timestamps = {
+                iso_formatted_time[5:]
+                for file_timestamps in self._timestamps_per_file(files)
+                for iso_formatted_time in file_timestamps
+            }
 
             self.logger.info(f"Unique dates discovered: {len(all_timestamps)}")
             all_dates = {t: idx for idx, t in enumerate(sorted(all_timestamps))}
 
             timestamp_rows = [(idx, timestamp) for timestamp, idx in all_dates.items()]
-            cur.executemany(
-                """
-                INSERT INTO timestamp_dim (timestamp_id, timestamp_val)
-                VALUES (%s, %s) ON CONFLICT (timestamp_id) DO NOTHING
-                """,
-                timestamp_rows,
+            # A resumed run loads the same rows again
+            cur.execute("DELETE FROM timestamp_dim;")
+            PostgresCommon.copy_rows(
+                cur, "timestamp_dim", ["timestamp_id", "timestamp_val"], timestamp_rows
             )
 
             # Infer cadence
             self.logger.info("Inferring file cadence")
             cadence = infer_cadence(files)
+            if self.workers > 1 and cadence.cadence != "year_month_day":
+                self.logger.warning(
+                    "--workers is only used for year_month_day files, "
+                    f"loading {cadence.cadence} files sequentially"
+                )
 
+            # Only year_month_day files are checkpointed per MMDD, the other
+            # cadences are loaded (and committed) as a single group
             if cadence.cadence == "single_file":
                 self.logger.info("Single file cadence discovered")
-                self.process_single_file(cur, all_dates)
+                self._run_group(cur, "single_file", "process_single_file", all_dates)
             elif cadence.cadence == "year":
                 self.logger.info("Yearly cadence discovered")
-                self.process_year(cur, all_dates)
+                self._run_group(cur, "year", "process_year", all_dates)
             elif cadence.cadence == "year_month":
                 self.logger.info("Year + Monthly cadence discovered")
-                self.process_year_month(cur, all_dates)
+                self._run_group(cur, "year_month", "process_year_month", all_dates)
             elif cadence.cadence == "year_month_day":
                 self.logger.info("Year + Month + Daily cadence discovered")
                 self.process_year_month_day(cur, all_dates)
@@ -413,135 +501,299 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
                 raise ValueError(f"Unknown cadence: {cadence.cadence}")
         return
 
-    def process_single_file(self, cur, all_dates):
+    @benchmark
+    def _append_postgres_data_tables(self, conn) -> int:
+        """
+        Load new (year, MMDD) files into the existing tables. New years become
+        new value_YYYY columns and new MMDDs new timestamp_dim rows. Existing
+        MMDDs only get their new value_YYYY columns updated, new ones are
+        inserted whole, one transaction per MMDD. The rest of grid_data is
+        left alone.
+        """
+        files = sorted(self.folder_path.rglob("*.nc"))
+        cadence = infer_cadence(files)
+        if cadence.cadence != "year_month_day":
+            raise ValueError(
+                f"Appending needs year_month_day files, found {cadence.cadence} files"
+            )
+        file_groupings = GroupFilesByCadence.group_files_by_month_day_with_year(files)
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT name FROM level")
+            existing_years = {row[0].strip() for row in cur.fetchall()}
+            cur.execute("SELECT timestamp_val, timestamp_id FROM timestamp_dim")
+            all_dates = {val: idx for val, idx in cur.fetchall()}
+            # "MM-DDTHH:MM:SS" -> "MMDD" like the file names
+            month_day_to_val = {val[:2] + val[3:5]: val for val in all_dates}
+
+            # Which MMDDs have a year that isn't loaded yet, only the
+            # timestamps of the new files are checked
+            candidates: dict[str, list[int]] = {}
+            for month_day_str, files_by_year in file_groupings.items():
+                time_val = month_day_to_val.get(month_day_str)
+                if time_val is None:
+                    continue
+                for year in files_by_year:
+                    if year in existing_years and year in self.years:
+                        candidates.setdefault(year, []).append(all_dates[time_val])
+            loaded_years = self._loaded_years(cur, candidates)
+
+            # MMDD -> the years to write for it
+            affected_month_days: dict[str, list[str]] = {}
+            affected_years = set()
+            for month_day_str, files_by_year in file_groupings.items():
+                time_val = month_day_to_val.get(month_day_str)
+                for year in sorted(files_by_year):
+                    if year not in self.years:
+                        continue
+                    if (
+                        year not in existing_years
+                        or time_val is None
+                        or year not in loaded_years.get(all_dates[time_val], ())
+                    ):
+                        affected_month_days.setdefault(month_day_str, []).append(year)
+                        affected_years.add(year)
+
+            self.logger.info(
+                f"{len(affected_month_days)} MMDDs with new years: {sorted(affected_years)}"
+            )
+            if not affected_month_days:
+                return 0
+
+            # New years are new value columns (and levels)
+            years = sorted(existing_years | set(self.years))
+            for year in years:
+                if year not in existing_years:
+                    self.logger.info(f"Adding year column value_{year}")
+                    cur.execute(f"ALTER TABLE grid_data ADD COLUMN value_{year} REAL;")
+                    cur.execute(
+                        "INSERT INTO level (level_id, name) VALUES (%s, %s)",
+                        (int(year), year),
+                    )
+            self.years = years
+            self.levels = {year: year for year in years}
+
+            # New MMDDs are new timestamps
+            next_time_id = max(all_dates.values(), default=-1) + 1
+            new_month_days = sorted(
+                m for m in affected_month_days if m not in month_day_to_val
+            )
+            month_day_files = [
+                next(iter(file_groupings[month_day_str].values()))
+                for month_day_str in new_month_days
+            ]
+            timestamp_rows = []
+            for file_timestamps in self._timestamps_per_file(month_day_files):
+                time_val = file_timestamps[0][5:]
+                timestamp_rows.append((next_time_id, time_val))
+                all_dates[time_val] = next_time_id
+                next_time_id += 1
+            PostgresCommon.copy_rows(
+                cur, "timestamp_dim", ["timestamp_id", "timestamp_val"], timestamp_rows
+            )
+
+        # New MMDDs have no rows to update, all their years are inserted
+        tasks = [
+            (
+                month_day_str,
+                file_groupings[month_day_str],
+                all_dates,
+                None if month_day_str in new_month_days else years_to_write,
+            )
+            for month_day_str, years_to_write in sorted(affected_month_days.items())
+        ]
+        if self.workers > 1:
+            ParallelIngest.run(
+                processor=self,
+                method_name="_reload_month_day",
+                tasks=tasks,
+                connection_kwargs=self.connection_kwargs,
+                workers=self.workers,
+                desc="Reloading MMDD",
+            )
+        else:
+            with conn.cursor() as cur:
+                cur.execute("SET synchronous_commit TO OFF;")
+                for task in tqdm(tasks, desc="Reloading MMDD"):
+                    self._reload_month_day(cur, *task)
+
+        if self.point_layout == "series":
+            # New timestamps shift every array, otherwise only the new years change
+            refresh_years = years if new_month_days else sorted(affected_years)
+            self._update_grid_series(conn, [f"value_{y}" for y in refresh_years])
+        return len(affected_month_days)
+
+    @staticmethod
+    def _loaded_years(
+        cur, timestamp_ids_by_year: dict[str, list[int]]
+    ) -> dict[int, set[str]]:
+        """
+        The years with values for each of the given timestamp_ids. One query
+        per year, every timestamp is an EXISTS on the timestamp_id index that
+        stops at its first non NULL value
+        """
+        loaded_years: dict[int, set[str]] = {}
+        for year, timestamp_ids in sorted(timestamp_ids_by_year.items()):
+            cur.execute(
+                f"""
+                SELECT t.timestamp_id
+                FROM unnest(%s::INTEGER[]) AS t(timestamp_id)
+                WHERE EXISTS (
+                    SELECT 1 FROM grid_data
+                    WHERE grid_data.timestamp_id = t.timestamp_id
+                      AND value_{year} IS NOT NULL
+                )
+                """,
+                (timestamp_ids,),
+            )
+            for (timestamp_id,) in cur.fetchall():
+                loaded_years.setdefault(timestamp_id, set()).add(year)
+        return loaded_years
+
+    def _reload_month_day(
+        self,
+        cur,
+        month_day_str: str,
+        files_by_year: dict[str, Path],
+        all_dates: dict[str, int],
+        years: list[str] | None = None,
+    ) -> int:
+        """
+        Write one MMDD in one transaction. With years, only their value
+        columns of the existing rows are updated (from a temp table loaded
+        like grid_data), otherwise the MMDD's rows are replaced for all years
+        """
+        time_vals = [v for v in all_dates if v[:2] + v[3:5] == month_day_str]
+        time_ids = [all_dates[v] for v in time_vals]
+        cur.execute("BEGIN;")
+        try:
+            n_timestamps = 0
+            if years is not None:
+                n_timestamps = self._update_month_day(
+                    cur, month_day_str, files_by_year, all_dates, years
+                )
+            if not n_timestamps:
+                # A new MMDD (or one without rows yet)
+                cur.execute(
+                    "DELETE FROM grid_data WHERE timestamp_id = ANY(%s)", (time_ids,)
+                )
+                n_timestamps = self._process_month_day(
+                    cur, month_day_str, files_by_year, all_dates
+                )
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+        cur.execute("COMMIT;")
+        return n_timestamps
+
+    def _update_month_day(
+        self,
+        cur,
+        month_day_str: str,
+        files_by_year: dict[str, Path],
+        all_dates: dict[str, int],
+        years: list[str],
+    ) -> int:
+        """
+        UPDATE the value columns of years for one MMDD's existing rows,
+        returns 0 (nothing written) if the MMDD has no rows
+        """
+        value_cols = [f"value_{year}" for year in years]
+        columns_sql = ", ".join(f"{col} REAL" for col in value_cols)
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE grid_data_update (
+                gridbox_id INTEGER NOT NULL,
+                timestamp_id INTEGER NOT NULL,
+                {columns_sql}
+            ) ON COMMIT DROP;
+            """
+        )
+        if not self._process_month_day(
+            cur,
+            month_day_str,
+            files_by_year,
+            all_dates,
+            years=years,
+            table="grid_data_update",
+        ):
+            return 0
+
+        set_sql = ", ".join(f"{col} = u.{col}" for col in value_cols)
+        cur.execute(
+            f"""
+            UPDATE grid_data SET {set_sql}
+            FROM grid_data_update u
+            WHERE grid_data.gridbox_id = u.gridbox_id
+              AND grid_data.timestamp_id = u.timestamp_id
+            """
+        )
+        return 1 if cur.rowcount else 0
+
+    def process_single_file(self, cur, all_dates) -> int:
         single_files = sorted(self.folder_path.rglob("*.nc"))
 
         self.logger.info("Processing single NetCDF File:")
         single_file = single_files[0]
-        fill_value = None
 
         with Dataset(single_file, "r") as nc:
-            # Identify all the month-day-etc that match each year
-            # Get the specific date we want to process
-            time_variable = nc.variables[self.time_variable_name]
-            times_dt = num2date(
-                times=time_variable[:],
-                units=time_variable.units,
-                calendar=getattr(time_variable, "calendar", "standard"),
-            )
+            variable = nc[self.variable_of_interest_name]
+            # (year, "MM-DDTHH:MM:SS") -> time index, decoded once for all dates
+            time_indexes = {
+                (time_val[:4], time_val[5:]): time_idx
+                for time_idx, time_val in enumerate(
+                    self._decode_times(nc.variables[self.time_variable_name])
+                )
+            }
 
             for db_time_value, db_time_index in tqdm(all_dates.items()):
-                data_slices = []
-                # Identify all the year related to this time value in the dataset
+                # One column per year, NaN where the year doesn't have this date
+                sources = []
                 for year in self.levels:
-                    for time_idx, time_dt in enumerate(times_dt):
-                        iso_formatted_time = time_dt.isoformat()
-                        # Grab the year and time
-                        year_from_iso_formatted_time = iso_formatted_time[:4]
-                        iso_formatted_time = iso_formatted_time[5:]
-                        if (
-                            year_from_iso_formatted_time == year
-                            and iso_formatted_time == db_time_value
-                        ):
-                            found_timestamp = True
-                            break
-
-                    if found_timestamp:
-                        # Get the specific variables at given date
-                        data = nc[self.variable_of_interest_name][time_idx]
-
-                        full_dims = ["year"] + list(
-                            nc[self.variable_of_interest_name].dimensions
-                        )
-                        spatial_dims = [
-                            d for d in full_dims if d != self.time_variable_name
-                        ]
-
-                        if hasattr(data, "_FillValue"):
-                            fill_value = float(data._FillValue)
-                        elif hasattr(data, "missing_value"):
-                            fill_value = float(data.missing_value)
-                    else:
-                        data = numpy.full(
-                            (len(self.latitudes), len(self.longitudes)), numpy.nan
-                        )
-                    data_slices.append(data)
-
-                # Stack into (n_years_for_this_md, n_lat, n_lon)
-                data_year_lat_lon = numpy.stack(data_slices, axis=0)
-
-                self._process_multi_level_gridbox_data(
-                    data=data_year_lat_lon,
-                    dim_names=spatial_dims,
-                    fill_value=fill_value,
-                    time_id=db_time_index,
-                    cur=cur,
-                )
-        return
+                    time_idx = time_indexes.get((year, db_time_value))
+                    sources.append(None if time_idx is None else (variable, time_idx))
+                self._copy_gridbox_blocks(sources, time_id=db_time_index, cur=cur)
+        return len(all_dates)
 
-    def process_year(self, cur, all_dates):
+    def process_year(self, cur, all_dates) -> int:
         yearly_files = sorted(self.folder_path.rglob("*.nc"))
         total_files = len(yearly_files)
 
         self.logger.info(f"Processing NetCDF Files with Year files: {total_files}")
 
-        for db_time_value, db_time_index in tqdm(all_dates.items()):
-            data_slices = []
-            for file_idx, yearly_file in enumerate(yearly_files):
-                fill_value = None
-                with Dataset(yearly_file, "r") as nc:
-                    # Get all dates in the current file (there can be more than 1)
-                    time_variable = nc.variables[self.time_variable_name]
-
-                    # Get the specific date we want to process
-                    times_dt = num2date(
-                        times=time_variable[:],
-                        units=time_variable.units,
-                        calendar=getattr(time_variable, "calendar", "standard"),
+        with ExitStack() as stack:
+            # Every file stays open, its "MM-DDTHH:MM:SS" -> time index decoded once
+            files = []
+            for yearly_file in yearly_files:
+                nc = stack.enter_context(Dataset(yearly_file, "r"))
+                time_indexes = {
+                    time_val[5:]: time_idx
+                    for time_idx, time_val in enumerate(
+                        self._decode_times(nc.variables[self.time_variable_name])
                     )
-                    found_timestamp = False
-                    for time_idx, time_dt in enumerate(times_dt):
-                        iso_formatted_time = time_dt.isoformat()
-                        # Remove the year
-                        iso_formatted_time = iso_formatted_time[5:]
-                        if iso_formatted_time == db_time_value:
-                            found_timestamp = True
-                            break
-
-                    if found_timestamp:
-                        # Get the specific variables at given date
-                        data = nc[self.variable_of_interest_name][time_idx]
-
-                        full_dims = ["year"] + list(
-                            nc[self.variable_of_interest_name].dimensions
-                        )
-                        spatial_dims = [
-                            d for d in full_dims if d != self.time_variable_name
-                        ]
-
-                        if hasattr(data, "_FillValue"):
-                            fill_value = float(data._FillValue)
-                        elif hasattr(data, "missing_value"):
-                            fill_value = float(data.missing_value)
-                    else:
-                        data = numpy.full(
-                            (len(self.latitudes), len(self.longitudes)), numpy.nan
-                        )
-                    data_slices.append(data)
-
-            # Stack into (n_years_for_this_md, n_lat, n_lon)
-            data_year_lat_lon = numpy.stack(data_slices, axis=0)
-
-            self._process_multi_level_gridbox_data(
-                data=data_year_lat_lon,
-                dim_names=spatial_dims,
-                fill_value=fill_value,
-                time_id=db_time_index,
-                cur=cur,
-            )
-        return
+                }
+                files.append((nc[self.variable_of_interest_name], time_indexes))
+
+            for db_time_value, db_time_index in tqdm(all_dates.items()):
+                # One column per file, NaN where the year doesn't have this date
+                sources = []
+                for variable, time_indexes in files:
+                    time_idx = time_indexes.get(db_time_value)
+                    sources.append(None if time_idx is None else (variable, time_idx))
+                self._copy_gridbox_blocks(sources, time_id=db_time_index, cur=cur)
+        return len(all_dates)
+
+    @staticmethod
+    def _decode_times(time_variable) -> list[str]:
+        """ISO formatted times of a time variable"""
+        times_dt = num2date(
+            times=time_variable[:],
+            units=time_variable.units,
+            calendar=getattr(time_variable, "calendar", "standard"),
+        )
+        return [time_dt.isoformat() for time_dt in times_dt]
 
-    def process_year_month(self, cur, all_dates):
+    def process_year_month(self, cur, all_dates) -> int:
         raise NotImplementedError("Haven't implemented this yet")
 
     def process_year_month_day(self, cur, all_dates):
@@ -551,89 +803,102 @@ class NetCDFtoDbYearlyFiles(NetCDFtoDbBase):
 
         self.logger.info("Processing NetCDF Files with Year, Month, Day files")
 
-        with tqdm(
-            sorted(file_groupings.keys()), desc="Processing MMDD"
-        ) as progress_bar:
-            for month_day_str in progress_bar:
-                progress_bar.set_postfix(mmdd=month_day_str)
-
-                data_slices = []
-                for file_idx, year in enumerate(self.years):
-                    # Grab the file for this year + month_day combination
-                    file = file_groupings[month_day_str].get(year)
-
-                    # Handle no file exists (ie: Feb 29)
-                    if not file:
-                        self.logger.info(f"Skipping {year}{month_day_str} (YYYYMMDD)")
-                        data = numpy.full(
-                            (len(self.latitudes), len(self.longitudes)), numpy.nan
-                        )
-                        data_slices.append(data)
-                    else:
-                        with Dataset(file, "r") as nc:
-                            # Get all dates in the current file (there can be more than 1)
-                            time_variable = nc.variables[self.time_variable_name]
-
-                            times_dt = num2date(
-                                times=time_variable[:],
-                                units=time_variable.units,
-                                calendar=getattr(time_variable, "calendar", "standard"),
-                            )
-                            # it's possible there are multiple dates per file. If there are
-                            # get the idx so we know which index to grab from the file.
-
-                            variable = nc[self.variable_of_interest_name]
-
-                            full_dims = ["year"] + list(variable.dimensions)
-                            spatial_dims = [
-                                d for d in full_dims if d != self.time_variable_name
-                            ]
-
-                            fill_value = None
-                            if hasattr(variable, "_FillValue"):
-                                fill_value = float(variable._FillValue)
-                            elif hasattr(variable, "missing_value"):
-                                fill_value = float(variable.missing_value)
-
-                            if len(times_dt) > 1:
-                                raise Exception(
-                                    "Cannot process a year_month_day file with multiple time stamps yet!!!"
-                                )
+        # Every MMDD is written to its own timestamp_id, so they are independent
+        # (and committed / checkpointed on their own)
+        tasks = [
+            (
+                month_day_str,
+                "_process_month_day",
+                month_day_str,
+                file_groupings[month_day_str],
+                all_dates,
+            )
+            for month_day_str in sorted(file_groupings.keys())
+        ]
+        if self.workers > 1:
+            ParallelIngest.run(
+                processor=self,
+                method_name="_run_group",
+                tasks=tasks,
+                connection_kwargs=self.connection_kwargs,
+                workers=self.workers,
+                desc="Processing MMDD",
+            )
+            return
 
-                            for idx, time_dt in enumerate(times_dt):
-                                iso_formatted_time = time_dt.isoformat()
-                                # Remove the year
-                                iso_formatted_time = iso_formatted_time[5:]
+        with tqdm(tasks, desc="Processing MMDD") as progress_bar:
+            for task in progress_bar:
+                progress_bar.set_postfix(mmdd=task[0])
+                self._run_group(cur, *task)
+        return
+
+    def _process_month_day(
+        self,
+        cur,
+        month_day_str: str,
+        files_by_year: dict[str, Path],
+        all_dates: dict[str, int],
+        years: list[str] | None = None,
+        table: str = "grid_data",
+    ) -> int:
+        """
+        Stack the grids of every year (or only of years) for one MMDD and load
+        them as one timestamp of table. Returns the number of timestamps loaded
+        """
+        value_cols = None
+        if years is None:
+            years = self.years
+        else:
+            value_cols = [f"value_{year}" for year in years]
+        # One source (or None for a year without a file) per year column, all
+        # the files stay open so they can be read a latitude band at a time
+        sources: list[tuple[Any, int] | None] = []
+        db_time_index = None
+        with ExitStack() as stack:
+            for year in years:
+                # Grab the file for this year + month_day combination
+                file = files_by_year.get(year)
+
+                # Handle no file exists (ie: Feb 29)
+                if not file:
+                    self.logger.info(f"Skipping {year}{month_day_str} (YYYYMMDD)")
+                    sources.append(None)
+                    continue
 
-                                db_time_index = all_dates[iso_formatted_time]
+                nc = stack.enter_context(Dataset(file, "r"))
+                # Get all dates in the current file (there can be more than 1)
+                time_variable = nc.variables[self.time_variable_name]
 
-                                # The time variable could be in many places, slice the data in the correct one
-                                time_idx_loc = self.all_variable_locations[
-                                    self.time_variable_name
-                                ]
-                                indexer = tuple(
-                                    (idx if axis == time_idx_loc else slice(None))
-                                    for axis in range(variable.ndim)
-                                )
-                                data = variable[indexer]
+                times_dt = num2date(
+                    times=time_variable[:],
+                    units=time_variable.units,
+                    calendar=getattr(time_variable, "calendar", "standard"),
+                )
+                if len(times_dt) > 1:
+                    raise Exception(
+                        "Cannot process a year_month_day file with multiple time stamps yet!!!"
+                    )
 
-                                data_slices.append(data)
+                for idx, time_dt in enumerate(times_dt):
+                    iso_formatted_time = time_dt.isoformat()
+                    # Remove the year
+                    iso_formatted_time = iso_formatted_time[5:]
 
-                # Some dates (ie: Feb 30th) don't exist in the dataset
-                if len(data_slices) == 0:
-                    continue
+                    db_time_index = all_dates[iso_formatted_time]
+                    sources.append((nc[self.variable_of_interest_name], idx))
 
-                # Stack into (n_years_for_this_md, n_lat, n_lon)
-                data_year_lat_lon = numpy.stack(data_slices, axis=0)
+            # Some dates (ie: Feb 30th) don't exist in the dataset
+            if db_time_index is None:
+                return 0
 
-                self._process_multi_level_gridbox_data(
-                    data=data_year_lat_lon,
-                    dim_names=spatial_dims,
-                    fill_value=fill_value,
-                    time_id=db_time_index,
-                    cur=cur,
-                )
-        return
+            self._copy_gridbox_blocks(
+                sources,
+                time_id=db_time_index,
+                cur=cur,
+                value_cols=value_cols,
+                table=table,
+            )
+        return 1
 
 
 def main():
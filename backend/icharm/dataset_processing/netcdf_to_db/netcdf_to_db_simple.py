@@ -1,15 +1,22 @@
+import itertools
 import os
-import re
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from pathlib import Path
 
 import numpy
-from netCDF4 import Dataset, num2date
+from netCDF4 import Dataset
 from tqdm import tqdm
-from typing import Any
-
-from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import NetCDFtoDbBase
+from typing import Any, Iterable
+
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import (
+    DEFAULT_READ_BLOCK_MB,
+    NetCDFtoDbBase,
+    _file_timestamps,
+    decode_times,
+)
+from icharm.dataset_processing.netcdf_to_db.parallel_ingest import ParallelIngest
+from icharm.dataset_processing.postgres_common import PostgresCommon
 from icharm.utils.benchmark import benchmark
 
 TIME_VAR_CANDIDATES = ["time"]
@@ -18,52 +25,13 @@ LON_VAR_CANDIDATES = ["lon", "longitude"]
 LEVEL_VAR_CANDIDATES = ["level"]
 
 
-def _decode_time_months_since(times: numpy.ndarray, units: str) -> list[datetime]:
-    """
-    Decode time values when units are 'months since <reference_date>'.
-    netCDF4.num2date does not support 'months since' with the standard calendar.
-    """
-    # Parse "months since 2005-01-01 00:00:00" or similar
-    match = re.match(
-        r"months\s+since\s+(\d{4})-(\d{2})-(\d{2})(?:\s+(\d{2}):(\d{2}):(\d{2}))?",
-        units,
-        re.IGNORECASE,
-    )
-    if not match:
-        raise ValueError(f"Cannot parse 'months since' reference from units: {units}")
-    y, m, d = int(match.group(1)), int(match.group(2)), int(match.group(3))
-    hh = int(match.group(4) or 0)
-    mm = int(match.group(5) or 0)
-    ss = int(match.group(6) or 0)
-    ref = datetime(y, m, d, hh, mm, ss)
-
-    result = []
-    for val in numpy.atleast_1d(times):
-        v = float(val)
-        months_int = int(v)
-        frac = v - months_int
-        dt = ref
-        # Add whole months
-        for _ in range(months_int):
-            if dt.month == 12:
-                dt = dt.replace(month=1, year=dt.year + 1)
-            else:
-                dt = dt.replace(month=dt.month + 1)
-        # Fractional month: approximate as fraction of 30 days
-        if frac != 0:
-            dt = dt + timedelta(days=frac * 30)
-        result.append(dt)
-    return result
-
-
 class NetCDFtoDbSimple(NetCDFtoDbBase):
-    longitudes: dict[int, float] = {}
-    latitudes: dict[int, float] = {}
+    longitudes: numpy.ndarray = numpy.empty(0)
+    latitudes: numpy.ndarray = numpy.empty(0)
     timestamps: dict[str, Any] = {}
     levels: dict[Any, Any] = {}
     times_to_filename: dict[datetime, tuple[str, int]] = {}
-    gridboxes: dict[int, tuple[int, int]] = {}
-    gridbox_ids: list[int] = []
+    gridbox_ids: numpy.ndarray = numpy.empty(0, dtype=numpy.int32)
     all_variable_locations: dict[str, int] = {}
 
     def __init__(
@@ -74,6 +42,11 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
         longitude_variable_name: str | None = None,
         level_variable_name: str | None = None,
         variable_of_interest_name: str | None = None,
+        copy_format: str = "binary",
+        workers: int = 1,
+        partitions: int = 0,
+        point_layout: str = "none",
+        read_block_mb: int = DEFAULT_READ_BLOCK_MB,
     ) -> None:
         super().__init__(
             folder_root=folder_root,
@@ -82,6 +55,11 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
             longitude_variable_name=longitude_variable_name,
             level_variable_name=level_variable_name,
             variable_of_interest_name=variable_of_interest_name,
+            copy_format=copy_format,
+            workers=workers,
+            partitions=partitions,
+            point_layout=point_layout,
+            read_block_mb=read_block_mb,
         )
 
         # Find all the important required feature names
@@ -91,77 +69,257 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
     @benchmark
     def _populate_postgres_data_tables(self, conn):
         files = sorted(self.folder_path.rglob("*.nc"))
+        self._load_files(conn, files, first_time_idx=0)
+        return
+
+    @benchmark
+    def _append_postgres_data_tables(self, conn) -> int:
+        """Load the time steps that aren't in timestamp_dim yet"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT timestamp_val FROM timestamp_dim")
+            existing = {row[0].isoformat() for row in cur.fetchall()}
+            cur.execute("SELECT COALESCE(MAX(timestamp_id) + 1, 0) FROM timestamp_dim")
+            first_time_idx = cur.fetchone()[0]
+            # Rows without a timestamp_dim entry are left by an interrupted run
+            # (before files were appended atomically), they'd collide with the
+            # ids handed out below
+            cur.execute(
+                "DELETE FROM grid_data WHERE timestamp_id >= %s;", (first_time_idx,)
+            )
+            if cur.rowcount:
+                self.logger.warning(
+                    f"Removed {cur.rowcount} grid_data rows of an interrupted append"
+                )
 
+        # Only files with new time steps
+        files = sorted(self.folder_path.rglob("*.nc"))
+        new_files = [
+            f
+            for f, t in zip(files, self._new_timestamps_per_file(files, existing))
+            if t
+        ]
+        self.logger.info(f"{len(new_files)} of {len(files)} files have new timestamps")
+        time_end = first_time_idx
+        if new_files:
+            time_end = self._load_files(conn, new_files, first_time_idx, existing)
+
+        if self.point_layout == "series":
+            # Also picks up the files an interrupted append committed
+            series_from = self._grid_series_end(conn)
+            if series_from is not None:
+                self._update_grid_series(conn, self._value_columns(), series_from)
+        return time_end - first_time_idx
+
+    def _grid_series_end(self, conn) -> int | None:
+        """First timestamp_id missing from the grid_series arrays, None if none is"""
+        column = self._value_columns()[0]
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT COALESCE(array_length({column}, 1), 0) FROM grid_series LIMIT 1"
+            )
+            row = cur.fetchone()
+            n_loaded = row[0] if row is not None else 0
+            cur.execute(
+                """
+                SELECT timestamp_id FROM timestamp_dim
+                ORDER BY timestamp_id OFFSET %s LIMIT 1
+                """,
+                (n_loaded,),
+            )
+            row = cur.fetchone()
+        return row[0] if row is not None else None
+
+    def _load_files(
+        self,
+        conn,
+        files: list[Path],
+        first_time_idx: int,
+        skip_timestamps: set[str] | None = None,
+    ) -> int:
+        """
+        Load the files with consecutive timestamp_ids from `first_time_idx`,
+        skipping time steps in `skip_timestamps`. Returns the next free id.
+
+        When appending (`skip_timestamps` given) every file is committed with
+        its timestamp_dim rows, an interrupted append leaves whole files behind
+        and the next one carries on after them.
+        """
+        timestamps = self._new_timestamps_per_file(files, skip_timestamps or set())
+        time_steps = [len(t) for t in timestamps]
+        time_end = first_time_idx + sum(time_steps)
+        with conn.cursor() as cur:
+            self._extend_grid_data_partitions(cur, time_end)
+
+        # Every file gets the timestamp_id of its first time step up front, so
+        # the files can be loaded in any order (or skipped when resuming)
+        appending = skip_timestamps is not None
+        tasks = []
+        time_idx = first_time_idx
+        for file, file_timestamps in zip(files, timestamps):
+            group_key = file.relative_to(self.folder_path).as_posix()
+            if appending:
+                task = (
+                    group_key,
+                    "_append_file",
+                    file,
+                    time_idx,
+                    file_timestamps,
+                    skip_timestamps,
+                )
+            else:
+                task = (group_key, "_process_file", file, time_idx, False)
+            tasks.append(task)
+            time_idx += len(file_timestamps)
+
+        if self.workers > 1:
+            ParallelIngest.run(
+                processor=self,
+                method_name="_run_group",
+                tasks=tasks,
+                connection_kwargs=self.connection_kwargs,
+                workers=self.workers,
+                desc="Processing files",
+            )
+        else:
+            with conn.cursor() as cur:
+                # For speed increase
+                cur.execute("SET synchronous_commit TO OFF;")
+
+                for task in tqdm(tasks):
+                    self._run_group(cur, *task)
+
+        if not appending:
+            self._copy_timestamps(conn, timestamps, first_time_idx)
+        return time_end
+
+    def _append_file(
+        self,
+        cur,
+        file: Path,
+        first_time_idx: int,
+        timestamps: list[str],
+        skip_timestamps: set[str],
+    ) -> int:
+        """
+        Load the `timestamps` of a file (the ones not in `skip_timestamps`) and
+        their timestamp_dim rows in one transaction. Returns the number of
+        time steps loaded
+        """
+        cur.execute("BEGIN;")
+        try:
+            n_steps = self._process_file(
+                cur,
+                file,
+                first_time_idx,
+                show_progress=False,
+                skip_timestamps=skip_timestamps,
+            )
+            PostgresCommon.copy_rows(
+                cur,
+                "timestamp_dim",
+                ["timestamp_id", "timestamp_val"],
+                enumerate(timestamps, first_time_idx),
+            )
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+        cur.execute("COMMIT;")
+        return n_steps
+
+    def _populate_postgres_data_stream(self, conn, files: Iterable[Path]) -> None:
+        """
+        Load the files in the order they arrive, each one gets the timestamp_ids
+        following the previous one's
+        """
         time_idx = 0
+        timestamps = []
         with conn.cursor() as cur:
             # For speed increase
             cur.execute("SET synchronous_commit TO OFF;")
 
-            for file_idx, file in enumerate(tqdm(files)):
-                # filename_path = str(file)
-                with Dataset(file, "r") as nc:
-                    # Get all dates in the current file (there can be more than 1)
-                    time_variable = nc.variables[self.time_variable_name]
-                    units = time_variable.units or ""
-                    if "months since" in units.lower():
-                        # num2date does not support "months since" with standard calendar
-                        times_dt = _decode_time_months_since(time_variable[:], units)
-                    else:
-                        times_dt = num2date(
-                            times=time_variable[:],
-                            units=time_variable.units,
-                            calendar=getattr(time_variable, "calendar", "standard"),
-                        )
-                    # it's possible there are multiple dates per file. If there are
-                    # get the idx so we know which index to grab from the file.
-
-                    variable = nc[self.variable_of_interest_name]
-
-                    full_dims = variable.dimensions
-                    spatial_dims = [
-                        d for d in full_dims if d != self.time_variable_name
-                    ]
-
-                    fill_value = None
-                    if hasattr(variable, "_FillValue"):
-                        fill_value = float(variable._FillValue)
-                    elif hasattr(variable, "missing_value"):
-                        fill_value = float(variable.missing_value)
-
-                    for idx, time_dt in enumerate(tqdm(times_dt)):
-                        iso_formatted_time = time_dt.isoformat()
-
-                        # Insert the datetime into the datetime_dim table
-                        timestamp_rows = [(time_idx, iso_formatted_time)]
-                        cur.executemany(
-                            """
-                            INSERT INTO timestamp_dim (timestamp_id, timestamp_val)
-                            VALUES (%s, %s) ON CONFLICT (timestamp_id) DO NOTHING
-                            """,
-                            timestamp_rows,
-                        )
+            for file in files:
+                file_timestamps = _file_timestamps(file, self.time_variable_name)
+                self._process_file(cur, file, time_idx, show_progress=False)
+                timestamps.append(file_timestamps)
+                time_idx += len(file_timestamps)
 
-                        # The time variable could be in many places, slice the data in the correct one
-                        time_idx_loc = self.all_variable_locations[
-                            self.time_variable_name
-                        ]
-                        indexer = tuple(
-                            (idx if axis == time_idx_loc else slice(None))
-                            for axis in range(variable.ndim)
-                        )
-                        data = variable[indexer]
-
-                        self._process_multi_level_gridbox_data(
-                            data=data,
-                            dim_names=spatial_dims,
-                            fill_value=fill_value,
-                            time_id=time_idx,
-                            cur=cur,
-                        )
+        self._copy_timestamps(conn, timestamps, first_time_idx=0)
+        return
 
-                        time_idx += 1
+    def _new_timestamps_per_file(
+        self, files: list[Path], existing: set[str]
+    ) -> list[list[str]]:
+        """ISO timestamps of every file that aren't in `existing`"""
+        return [
+            [t for t in file_timestamps if t not in existing]
+            for file_timestamps in self._timestamps_per_file(files)
+        ]
+
+    def _copy_timestamps(
+        self, conn, timestamps: list[list[str]], first_time_idx: int
+    ) -> None:
+        """
+        timestamp_dim rows of all the loaded files in one COPY. It runs once
+        the grid_data groups are committed, the delete makes it safe to repeat
+        when a resumed run gets here again
+        """
+        rows = enumerate(itertools.chain.from_iterable(timestamps), first_time_idx)
+        with conn.cursor() as cur:
+            cur.execute("BEGIN;")
+            cur.execute(
+                "DELETE FROM timestamp_dim WHERE timestamp_id >= %s;",
+                (first_time_idx,),
+            )
+            PostgresCommon.copy_rows(
+                cur, "timestamp_dim", ["timestamp_id", "timestamp_val"], rows
+            )
+            cur.execute("COMMIT;")
         return
 
+    def _process_file(
+        self,
+        cur,
+        file: Path,
+        first_time_idx: int,
+        show_progress: bool = True,
+        skip_timestamps: set[str] | None = None,
+    ) -> int:
+        """
+        Load every time step of a file (except the ones in `skip_timestamps`),
+        the first one as `first_time_idx`. Returns the number of time steps loaded
+        """
+        time_idx = first_time_idx
+        # filename_path = str(file)
+        with Dataset(file, "r") as nc:
+            # Get all dates in the current file (there can be more than 1)
+            times_dt = decode_times(nc.variables[self.time_variable_name])
+            # it's possible there are multiple dates per file. If there are
+            # get the idx so we know which index to grab from the file.
+
+            variable = nc[self.variable_of_interest_name]
+
+            for idx, time_dt in enumerate(tqdm(times_dt, disable=not show_progress)):
+                iso_formatted_time = time_dt.isoformat()
+                if skip_timestamps and iso_formatted_time in skip_timestamps:
+                    continue
+
+                # Streamed in latitude bands, the time variable can be on any axis
+                self._copy_gridbox_blocks([(variable, idx)], time_id=time_idx, cur=cur)
+
+                time_idx += 1
+        return time_idx - first_time_idx
+
+    def _level_value_sql(self, alias: str, cast: bool = True) -> str:
+        """Value of `alias`'s value_<in_level_id> column, NULL for other levels"""
+        whens = "\n".join(
+            f"WHEN {column.removeprefix('value_')} THEN {alias}.{column}"
+            for column in self._value_columns()
+        )
+        case_sql = f"(CASE in_level_id\n{whens}\nEND)"
+        if cast:
+            return f"{case_sql}::double precision"
+        return case_sql
+
     def _create_sql_functions(self, conn):
         with conn.cursor() as cur:
             ###############################
@@ -263,7 +421,11 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
                     , in_level_id INTEGER
                 );
             """)
-            get_gridbox_data_sql = """
+            # The level's column is picked with a CASE generated from the value
+            # columns instead of serializing every row with to_jsonb(), so the
+            # functions stay plain (inlinable) SQL. Unknown levels give NULL
+            level_value_sql = self._level_value_sql("gd")
+            get_gridbox_data_sql = f"""
                 CREATE FUNCTION get_gridbox_data(
                     in_timestamp_id    INTEGER
                     , in_level_id INTEGER
@@ -280,9 +442,7 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
                         gd.gridbox_id
                         , lat.lat
                         , lon.lon
-                        -- TODO: Change this to the same trick we did in "by_year" to not use tq_jsonb.
-                        --       It should speed up processing.
-                        , (to_jsonb(gd) ->> ('value_' || in_level_id))::double precision AS value
+                        , {level_value_sql} AS value
                     FROM grid_data gd
                     JOIN gridbox gb ON
                         gd.gridbox_id = gb.gridbox_id
@@ -307,29 +467,69 @@ class NetCDFtoDbSimple(NetCDFtoDbBase):
                     , in_level_id INTEGER
                 );
             """)
-            sql_get_timeseries_sql = """
+            # Same columns as the by-year get_timeseries()
+            sql_get_timeseries_sql = f"""
                 CREATE FUNCTION get_timeseries(
                     in_gridbox_id INTEGER
                     , in_level_id INTEGER
                 )
                 RETURNS TABLE (
-                    timestamp_val  TIMESTAMP
-                    , value        DOUBLE PRECISION
+                    timestamp_id       INT
+                    , timestamp_value  TIMESTAMP
+                    , level_id         INT
+                    , value            DOUBLE PRECISION
                 )
                 LANGUAGE sql
+                STABLE
                 AS $$
                     SELECT
-                        timestamp_val
-                        -- TODO: Change this to the same trick we did in "by_year" to not use tq_jsonb.
-                        --       It should speed up processing.
-                        -- Convert the row to a json to grab the column name dynamically
-                        , (to_jsonb(gd) ->> ('value_' || in_level_id))::double precision AS value
+                        d.timestamp_id
+                        , d.timestamp_val
+                        , in_level_id
+                        , {level_value_sql} AS value
                     FROM timestamp_dim AS d
                     JOIN grid_data gd ON
                         d.timestamp_id = gd.timestamp_id
                     WHERE gd.gridbox_id = in_gridbox_id
+                    ORDER BY d.timestamp_id
                 $$;
             """
+            if self.point_layout == "series":
+                # Read the whole series from the single grid_series row
+                sql_get_timeseries_sql = f"""
+                    CREATE FUNCTION get_timeseries(
+                        in_gridbox_id INTEGER
+                        , in_level_id INTEGER
+                    )
+                    RETURNS TABLE (
+                        timestamp_id       INT
+                        , timestamp_value  TIMESTAMP
+                        , level_id         INT
+                        , value            DOUBLE PRECISION
+                    )
+                    LANGUAGE sql
+                    STABLE
+                    AS $$
+                        SELECT
+                            d.timestamp_id
+                            , d.timestamp_val
+                            , in_level_id
+                            , s.value::double precision AS value
+                        FROM grid_series gs
+                        CROSS JOIN LATERAL UNNEST(
+                            {self._level_value_sql("gs", cast=False)}
+                        ) WITH ORDINALITY AS s(value, n)
+                        JOIN (
+                            SELECT
+                                timestamp_id
+                                , timestamp_val
+                                , ROW_NUMBER() OVER (ORDER BY timestamp_id) AS n
+                            FROM timestamp_dim
+                        ) d ON d.n = s.n
+                        WHERE gs.gridbox_id = in_gridbox_id
+                        ORDER BY s.n
+                    $$;
+                """
             cur.execute(sql_get_timeseries_sql)
             conn.commit()
         return
@@ -0,0 +1,76 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Sequence
+
+from tqdm import tqdm
+
+from icharm.dataset_processing.postgres_common import PostgresCommon
+
+logger = logging.getLogger(__name__)
+
+# Set in every worker process by _init_worker
+_worker_processor: Any = None
+_worker_conn: Any = None
+
+
+def _init_worker(processor, connection_kwargs: dict[str, Any]):
+    """Every worker gets its own copy of the processor and its own connection"""
+    global _worker_processor, _worker_conn
+    _worker_processor = processor
+    _worker_conn = PostgresCommon.create_connection(**connection_kwargs)
+    with _worker_conn.cursor() as cur:
+        # For speed increase
+        cur.execute("SET synchronous_commit TO OFF;")
+    return
+
+
+def _run_task(method_name: str, task: tuple) -> int:
+    """Run `processor.<method_name>(cur, *task)`, returns the timestamps written"""
+    method: Callable = getattr(_worker_processor, method_name)
+    with _worker_conn.cursor() as cur:
+        return method(cur, *task)
+
+
+class ParallelIngest:
+    """
+    Shards ingest tasks (a file, a month-day group, ...) across a process pool.
+    Decoding NetCDF and encoding rows are CPU bound, so each worker opens its
+    own connection and COPYs into the UNLOGGED grid_data table on its own.
+    """
+
+    @staticmethod
+    def run(
+        processor,
+        method_name: str,
+        tasks: Sequence[tuple],
+        connection_kwargs: dict[str, Any],
+        workers: int,
+        desc: str = "Processing",
+    ) -> int:
+        """
+        Calls `processor.<method_name>(cur, *task)` for every task, the method
+        returns how many timestamps it wrote. Progress of all the workers is
+        aggregated into one progress bar.
+        """
+        logger.info(f"Processing {len(tasks)} tasks with {workers} workers")
+        n_timestamps = 0
+        with (
+            ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(processor, connection_kwargs),
+            ) as executor,
+            tqdm(total=len(tasks), desc=desc) as progress_bar,
+        ):
+            pending = {executor.submit(_run_task, method_name, t) for t in tasks}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        for other in pending:
+                            other.cancel()
+                        raise future.exception()
+                    n_timestamps += future.result()
+                    progress_bar.update(1)
+                progress_bar.set_postfix(timestamps=n_timestamps)
+        return n_timestamps
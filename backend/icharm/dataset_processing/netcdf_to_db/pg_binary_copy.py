@@ -0,0 +1,137 @@
+import struct
+from typing import Iterator, Sequence
+
+import numpy
+
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+# Postgres column type -> big-endian wire format
+PG_TYPES = {
+    "int2": numpy.dtype(">i2"),
+    "int4": numpy.dtype(">i4"),
+    "int8": numpy.dtype(">i8"),
+    "float4": numpy.dtype(">f4"),
+    "float8": numpy.dtype(">f8"),
+}
+
+# Rows encoded per chunk while streaming
+DEFAULT_CHUNK_ROWS = 262_144
+
+
+class PgBinaryCopy:
+    """
+    Encode NumPy columns into the `COPY ... FROM STDIN WITH (FORMAT binary)`
+    wire format. Every row is a field count followed by (length, value) pairs,
+    NaN floats are written as NULL (length -1, no value).
+    """
+
+    @staticmethod
+    def _row_dtype(pg_types: Sequence[str]) -> numpy.dtype:
+        fields: list[tuple[str, numpy.dtype | str]] = [("n_fields", ">i2")]
+        for i, pg_type in enumerate(pg_types):
+            fields.append((f"len_{i}", ">i4"))
+            fields.append((f"value_{i}", PG_TYPES[pg_type]))
+        return numpy.dtype(fields)
+
+    @staticmethod
+    def encode_rows(
+        columns: Sequence[numpy.ndarray | int], pg_types: Sequence[str]
+    ) -> bytes:
+        """
+        Encode rows (no header / trailer). Scalars are broadcast to the length
+        of the array columns.
+        """
+        if len(columns) != len(pg_types):
+            raise ValueError("Need exactly one Postgres type per column")
+
+        n_rows = max(numpy.size(c) for c in columns)
+        row_dtype = PgBinaryCopy._row_dtype(pg_types)
+        rows = numpy.empty(n_rows, dtype=row_dtype)
+        rows["n_fields"] = len(columns)
+
+        # Bytes to drop for NULL values, only needed when there are NaNs
+        drop = None
+        for i, (column, pg_type) in enumerate(zip(columns, pg_types)):
+            rows[f"value_{i}"] = column
+            size = PG_TYPES[pg_type].itemsize
+            rows[f"len_{i}"] = size
+            if pg_type.startswith("float"):
+                nulls = numpy.isnan(numpy.broadcast_to(column, (n_rows,)))
+                if nulls.any():
+                    rows[f"len_{i}"][nulls] = -1
+                    if drop is None:
+                        drop = numpy.zeros((n_rows, row_dtype.itemsize), dtype=bool)
+                    offset = row_dtype.fields[f"value_{i}"][1]
+                    drop[nulls, slice(offset, offset + size)] = True
+
+        raw = rows.view(numpy.uint8).reshape(n_rows, row_dtype.itemsize)
+        if drop is None:
+            return raw.tobytes()
+        return raw[~drop].tobytes()
+
+    @staticmethod
+    def iter_chunks(
+        columns: Sequence[numpy.ndarray | int],
+        pg_types: Sequence[str],
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ) -> Iterator[bytes]:
+        """Header, the rows in chunks of `chunk_rows`, then the trailer"""
+        n_rows = max(numpy.size(c) for c in columns)
+        yield PGCOPY_HEADER
+        for start in range(0, n_rows, chunk_rows):
+            chunk = [
+                c[slice(start, start + chunk_rows)] if numpy.ndim(c) else c
+                for c in columns
+            ]
+            yield PgBinaryCopy.encode_rows(chunk, pg_types)
+        yield PGCOPY_TRAILER
+
+    @staticmethod
+    def copy(
+        cur,
+        table: str,
+        column_names: Sequence[str],
+        columns: Sequence[numpy.ndarray | int],
+        pg_types: Sequence[str],
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ) -> None:
+        """Stream the columns into `table` with a binary COPY"""
+        stream = BinaryCopyStream(
+            PgBinaryCopy.iter_chunks(columns, pg_types, chunk_rows)
+        )
+        cur.copy_expert(
+            f"COPY {table} ({', '.join(column_names)}) FROM STDIN WITH (FORMAT binary)",
+            stream,
+            size=1 << 20,
+        )
+        return
+
+
+class BinaryCopyStream:
+    """
+    File-like object over an iterator of encoded chunks, so copy_expert pulls
+    chunks as it sends them instead of the whole payload being built up front.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            data = bytes(self._buffer) + b"".join(self._chunks)
+            self._buffer = memoryview(b"")
+            return data
+
+        while len(self._buffer) == 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._buffer = memoryview(chunk)
+
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return bytes(data)
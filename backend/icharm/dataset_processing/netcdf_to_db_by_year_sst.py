@@ -11,6 +11,7 @@ from netCDF4 import Dataset, num2date
 from tqdm import tqdm
 from typing import Any
 
+from icharm.dataset_processing.netcdf_catalogue import NetCDFCatalogue
 from icharm.dataset_processing.postgres_common import PostgresCommon
 from icharm.utils.benchmark import benchmark
 
@@ -43,6 +44,7 @@ class NetCDFtoDB:
         level_variable_name: str | None = None,
         variable_of_interest_name: str | None = None,
         years: list[str] | None = None,
+        file_catalogue_path: str | Path | None = None,
     ) -> None:
         if isinstance(folder_root, str):
             folder_path = Path(folder_root)
@@ -57,9 +59,14 @@ class NetCDFtoDB:
         self.level_variable_name = level_variable_name
         self.variable_of_interest_name = variable_of_interest_name
         self.years = years
+        self.file_catalogue_path = (
+            Path(file_catalogue_path) if file_catalogue_path is not None else None
+        )
+        files = sorted(self.folder_path.rglob("*.nc"))
 
         # Find all the important required feature names
-        self._find_features()
+        self._find_features(files)
+        self.month_day_files = self._load_month_day_files(files)
 
         return
 
@@ -174,9 +181,24 @@ class NetCDFtoDB:
             self.all_variable_locations = all_variable_locations
         return
 
-    def _find_features(self):
+    def _load_month_day_files(self, files: list[Path]) -> dict[str, dict[str, Path]]:
+        """
+        Files of every MMDD by year, from the NetCDFCatalogue of the folder
+        (at `file_catalogue_path` when given): only files that are new or
+        changed since the last run are decoded
+        """
+        catalogue = NetCDFCatalogue(
+            self.folder_path,
+            self.time_variable_name,
+            self.latitude_variable_name,
+            self.longitude_variable_name,
+            catalogue_path=self.file_catalogue_path,
+        )
+        catalogue.update(files)
+        return catalogue.files_by_month_day()
+
+    def _find_features(self, files: list[Path]):
         # Data should be organized under the folder
-        files = sorted(self.folder_path.rglob("*.nc"))
         if not files:
             raise SystemExit(f"No .nc files found under {self.folder_path}")
 
@@ -409,11 +431,13 @@ class NetCDFtoDB:
             cur.execute("SET synchronous_commit TO OFF;")
 
             time_idx = 0
+            timestamp_rows = []
             total_days = len(months) * len(days)
             for month, day in tqdm(itertools.product(months, days), total=total_days):
                 month_day_str = f"{month}{day}"
 
-                yearly_files = sorted(self.folder_path.rglob(f"*{month_day_str}.nc"))
+                files_by_year = self.month_day_files.get(month_day_str, {})
+                yearly_files = [files_by_year[year] for year in sorted(files_by_year)]
 
                 data_slices = []
                 for file_idx, file in enumerate(yearly_files):
@@ -456,18 +480,6 @@ class NetCDFtoDB:
                             fill_value = float(variable.missing_value)
 
                         for idx, time_dt in enumerate(times_dt):
-                            dt = f"{month}{day}"
-
-                            # Insert the datetime into the datetime_dim table
-                            timestamp_rows = [(time_idx, dt)]
-                            cur.executemany(
-                                """
-                                INSERT INTO timestamp_dim (timestamp_id, timestamp_val)
-                                VALUES (%s, %s) ON CONFLICT (timestamp_id) DO NOTHING
-                                """,
-                                timestamp_rows,
-                            )
-
                             # The time variable could be in many places, slice the data in the correct one
                             time_idx_loc = self.all_variable_locations[
                                 self.time_variable_name
@@ -504,7 +516,13 @@ class NetCDFtoDB:
                     cur=cur,
                 )
 
+                # timestamp_dim is loaded in one COPY after the loop
+                timestamp_rows.append((time_idx, month_day_str))
                 time_idx += 1
+
+            PostgresCommon.copy_rows(
+                cur, "timestamp_dim", ["timestamp_id", "timestamp_val"], timestamp_rows
+            )
         return
 
     def _process_multi_level_gridbox_data(
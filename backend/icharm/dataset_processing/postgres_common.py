@@ -1,3 +1,6 @@
+import io
+
+import pandas
 import psycopg2
 
 
@@ -50,3 +53,82 @@ class PostgresCommon:
             conn.close()
 
         return
+
+    @staticmethod
+    def drop_database(
+        database_name: str,
+        user: str,
+        password: str,
+        host="localhost",
+        port=5432,
+    ) -> None:
+        """Drop a database if it exists, disconnecting its clients"""
+        conn = PostgresCommon.create_connection(
+            user=user, password=password, host=host, port=port
+        )
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP DATABASE IF EXISTS {database_name} WITH (FORCE);")
+        finally:
+            conn.close()
+        return
+
+    @staticmethod
+    def replace_database(
+        source_name: str,
+        target_name: str,
+        user: str,
+        password: str,
+        host="localhost",
+        port=5432,
+    ) -> None:
+        """
+        Rename `source_name` to `target_name` in one transaction, the previous
+        `target_name` is dropped afterwards. Clients of both are disconnected,
+        a database in use can't be renamed
+        """
+        old_name = f"{target_name}_old"
+        conn = PostgresCommon.create_connection(
+            user=user, password=password, host=host, port=port
+        )
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP DATABASE IF EXISTS {old_name} WITH (FORCE);")
+                cur.execute(
+                    """
+                    SELECT pg_terminate_backend(pid)
+                    FROM pg_stat_activity
+                    WHERE datname IN (%s, %s) AND pid <> pg_backend_pid();
+                    """,
+                    (source_name, target_name),
+                )
+                cur.execute(
+                    "SELECT 1 FROM pg_database WHERE datname = %s;", (target_name,)
+                )
+                target_exists = cur.fetchone() is not None
+
+                cur.execute("BEGIN;")
+                if target_exists:
+                    cur.execute(f"ALTER DATABASE {target_name} RENAME TO {old_name};")
+                cur.execute(f"ALTER DATABASE {source_name} RENAME TO {target_name};")
+                cur.execute("COMMIT;")
+
+                if target_exists:
+                    cur.execute(f"DROP DATABASE {old_name} WITH (FORCE);")
+        finally:
+            conn.close()
+        return
+
+    @staticmethod
+    def copy_rows(cur, table_name: str, column_names: list[str], rows) -> None:
+        """Load `rows` (tuples in `column_names` order) into a table with one COPY"""
+        with io.StringIO() as csv_buffer:
+            df_rows = pandas.DataFrame(list(rows), columns=column_names)
+            df_rows.to_csv(csv_buffer, index=False)
+            csv_buffer.seek(0)
+            columns_str = ", ".join(column_names)
+            cur.copy_expert(
+                f"COPY {table_name} ({columns_str}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                csv_buffer,
+            )
+        return
@@ -0,0 +1,356 @@
+# !/usr/bin/env python3
+"""
+Chunk layouts and compression of the Zarr stores converted from NetCDF, and
+a benchmark of point / frame reads on each layout
+"""
+
+import argparse
+import math
+import shutil
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy
+import xarray as xr
+from zarr.codecs import BloscCodec, ZstdCodec
+
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_base import (
+    LAT_VAR_CANDIDATES,
+    LON_VAR_CANDIDATES,
+    TIME_VAR_CANDIDATES,
+)
+
+# Chunk layouts:
+# - balanced: a block of time steps of a lat/lon tile, sized so a point series
+#   and a map read about as many chunks, for a store serving both
+# - frames: one time step per chunk, the whole (or a tile of the) map, for maps
+# - series: every time step per chunk, a small lat/lon tile, for point time series
+LAYOUTS = ("balanced", "frames", "series")
+
+# Layouts written by a profile, the first one is the store itself and the
+# others sibling stores named <store>.<layout>.zarr
+PROFILES = {
+    "balanced": ("balanced",),
+    "frames": ("frames",),
+    "series": ("series",),
+    "dual": ("frames", "series"),
+}
+# The service reads both maps and point series from the store itself
+DEFAULT_PROFILE = "balanced"
+
+COMPRESSORS = ("blosc-zstd", "blosc-lz4", "zstd", "none")
+SHUFFLES = ("shuffle", "bitshuffle", "noshuffle")
+
+# Upper bound of a (compressed before) Zarr chunk
+DEFAULT_CHUNK_MB = 4
+
+# Threads reading / compressing / writing the chunks of a conversion
+DEFAULT_WORKERS = 4
+
+# Upper bound of the dask blocks the conversion works through, each one is a
+# whole number of Zarr chunks
+DEFAULT_DASK_CHUNK_MB = 256
+
+
+@dataclass(frozen=True)
+class ZarrProfile:
+    name: str = DEFAULT_PROFILE
+    compressor: str = "blosc-zstd"
+    level: int = 3
+    shuffle: str = "shuffle"  # Only used by the blosc compressors
+    chunk_mb: float = DEFAULT_CHUNK_MB
+
+    def __post_init__(self) -> None:
+        if self.name not in PROFILES:
+            raise ValueError(f"Zarr profile must be one of {list(PROFILES)}")
+        if self.compressor not in COMPRESSORS:
+            raise ValueError(f"compressor must be one of {COMPRESSORS}")
+        if self.shuffle not in SHUFFLES:
+            raise ValueError(f"shuffle must be one of {SHUFFLES}")
+        if self.chunk_mb <= 0:
+            raise ValueError("chunk_mb must be positive")
+        return
+
+    @property
+    def layouts(self) -> tuple[str, ...]:
+        return PROFILES[self.name]
+
+
+class ZarrConverter:
+    """
+    Writes a dataset to Zarr in the layouts of a profile, with dask so the
+    chunks are read, compressed and written by `workers` threads
+    """
+
+    def __init__(
+        self,
+        profile: ZarrProfile | None = None,
+        workers: int = DEFAULT_WORKERS,
+        dask_chunk_mb: float = DEFAULT_DASK_CHUNK_MB,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.profile = profile if profile is not None else ZarrProfile()
+        self.workers = workers
+        self.dask_chunk_mb = dask_chunk_mb
+        return
+
+    @staticmethod
+    def store_paths(path: str | Path, profile: ZarrProfile) -> dict[str, Path]:
+        """Store of every layout of the profile, the first layout is `path`"""
+        path = Path(path)
+        first, *others = profile.layouts
+        paths = {first: path}
+        for layout in others:
+            paths[layout] = path.with_name(f"{path.stem}.{layout}{path.suffix}")
+        return paths
+
+    def write(
+        self, ds: xr.Dataset, path: str | Path, layouts: tuple[str, ...] | None = None
+    ) -> dict[str, Path]:
+        """
+        Write `ds` (with its chunk encodings already dropped) to the stores of
+        the profile (or only of `layouts`), consolidated. On failure none of
+        the stores written is left behind
+        """
+        paths = self.store_paths(path, self.profile)
+        if layouts is not None:
+            paths = {
+                layout: store_path
+                for layout, store_path in paths.items()
+                if layout in layouts
+            }
+        try:
+            for layout, store_path in paths.items():
+                self._write_layout(ds, store_path, layout)
+        except Exception:
+            for store_path in paths.values():
+                if store_path.exists():
+                    shutil.rmtree(store_path)
+            raise
+        return paths
+
+    def _write_layout(self, ds: xr.Dataset, path: Path, layout: str) -> None:
+        encoding = {}
+        chunked = ds.copy()
+        for variable in chunked.variables.values():
+            # Chunking of the source file
+            variable.encoding = {
+                key: value
+                for key, value in variable.encoding.items()
+                if key not in ("chunks", "chunksizes", "preferred_chunks")
+            }
+        for name in ds.data_vars:
+            variable = chunked[name]
+            encoding[name] = {"compressors": self._compressors()}
+            chunks = self.chunk_shape(variable, layout, self.profile.chunk_mb)
+            if chunks is None:
+                continue
+            encoding[name]["chunks"] = chunks
+            dask_chunks = self._dask_chunks(variable, chunks, layout)
+            chunked[name] = variable.chunk(dict(zip(variable.dims, dask_chunks)))
+
+        delayed = chunked.to_zarr(
+            path, mode="w", consolidated=True, encoding=encoding, compute=False
+        )
+        delayed.compute(scheduler="threads", num_workers=self.workers)
+        return
+
+    def _compressors(self) -> tuple:
+        if self.profile.compressor == "none":
+            return ()
+        if self.profile.compressor == "zstd":
+            return (ZstdCodec(level=self.profile.level),)
+        cname = self.profile.compressor.removeprefix("blosc-")
+        return (
+            BloscCodec(
+                cname=cname, clevel=self.profile.level, shuffle=self.profile.shuffle
+            ),
+        )
+
+    ##############################
+    # Chunk shapes
+    ##############################
+    @staticmethod
+    def _axes(variable: xr.DataArray) -> tuple[int | None, list[int]]:
+        """Index of the time dimension and of the lat / lon dimensions"""
+        time_axis = None
+        spatial_axes = []
+        for axis, dim in enumerate(variable.dims):
+            dim_lower = dim.lower()
+            if dim_lower in TIME_VAR_CANDIDATES:
+                time_axis = axis
+            elif dim_lower in LAT_VAR_CANDIDATES or dim_lower in LON_VAR_CANDIDATES:
+                spatial_axes.append(axis)
+        return time_axis, spatial_axes
+
+    @staticmethod
+    def chunk_shape(
+        variable: xr.DataArray, layout: str, chunk_mb: float
+    ) -> tuple[int, ...] | None:
+        """
+        Zarr chunks of a (time, [level,] lat, lon) variable, None for the
+        others (bounds, masks...) which keep the default chunking. Other
+        dimensions (levels) get one index per chunk
+        """
+        time_axis, spatial_axes = ZarrConverter._axes(variable)
+        if time_axis is None or len(spatial_axes) != 2:
+            return None
+
+        shape = variable.shape
+        itemsize = variable.dtype.itemsize
+        target_bytes = chunk_mb * 2**20
+        chunks = [1] * len(shape)
+        lat_axis, lon_axis = spatial_axes
+        n_lat, n_lon = shape[lat_axis], shape[lon_axis]
+
+        if layout == "frames":
+            # The whole map, split into k x k tiles when it's too big
+            frame_bytes = n_lat * n_lon * itemsize
+            k = max(1, math.ceil(math.sqrt(frame_bytes / target_bytes)))
+            chunks[lat_axis] = math.ceil(n_lat / k)
+            chunks[lon_axis] = math.ceil(n_lon / k)
+        elif layout == "balanced":
+            # n_time / t chunks per point series = n_lat * n_lon / s^2 chunks
+            # per map, with t * s^2 values per chunk
+            n_time = shape[time_axis]
+            chunk_values = max(1, int(target_bytes // itemsize))
+            side = (chunk_values * n_lat * n_lon / n_time) ** 0.25
+            chunks[lat_axis] = min(n_lat, max(1, int(side)))
+            chunks[lon_axis] = min(n_lon, max(1, int(side)))
+            tile = chunks[lat_axis] * chunks[lon_axis]
+            chunks[time_axis] = min(n_time, max(1, chunk_values // tile))
+        elif layout == "series":
+            # Every time step of a square-ish tile of points
+            series_bytes = shape[time_axis] * itemsize
+            chunks[time_axis] = max(1, min(shape[time_axis], target_bytes // itemsize))
+            n_points = max(1, int(target_bytes // series_bytes))
+            chunks[lat_axis] = min(n_lat, max(1, math.isqrt(n_points)))
+            chunks[lon_axis] = min(n_lon, max(1, n_points // chunks[lat_axis]))
+        else:
+            raise ValueError(f"layout must be one of {LAYOUTS}")
+        return tuple(int(c) for c in chunks)
+
+    def _dask_chunks(
+        self, variable: xr.DataArray, chunks: tuple[int, ...], layout: str
+    ) -> tuple[int, ...]:
+        """
+        `chunks` grown by whole multiples up to dask_chunk_mb, along time for
+        frames and along lat / lon for the others (the source is read in big
+        contiguous blocks instead of once per Zarr chunk)
+        """
+        time_axis, spatial_axes = self._axes(variable)
+        grow_axes = [time_axis] if layout == "frames" else spatial_axes
+        dask_chunks = list(chunks)
+        target_bytes = self.dask_chunk_mb * 2**20
+        for axis in grow_axes:
+            block_bytes = math.prod(dask_chunks) * variable.dtype.itemsize
+            factor = max(1, int(target_bytes // block_bytes))
+            dask_chunks[axis] = min(variable.shape[axis], dask_chunks[axis] * factor)
+        return tuple(dask_chunks)
+
+    ##############################
+    # Benchmark
+    ##############################
+    @staticmethod
+    def benchmark(
+        paths: dict[str, Path], variable_name: str, reads: int = 20, seed: int = 0
+    ) -> dict[str, dict[str, float]]:
+        """
+        Median latency (ms) of reading the full time series of a random point
+        and a random full map, on each store (other dimensions at index 0)
+        """
+        results = {}
+        for layout, path in paths.items():
+            rng = numpy.random.default_rng(seed)
+            with xr.open_zarr(path, consolidated=True, decode_times=False) as ds:
+                variable = ds[variable_name]
+                time_axis, (lat_axis, lon_axis) = ZarrConverter._axes(variable)
+                time_dim = variable.dims[time_axis]
+                lat_dim, lon_dim = variable.dims[lat_axis], variable.dims[lon_axis]
+                others = {
+                    dim: 0
+                    for dim in variable.dims
+                    if dim not in (time_dim, lat_dim, lon_dim)
+                }
+                point_seconds, frame_seconds = [], []
+                for _ in range(reads):
+                    point = {
+                        lat_dim: int(rng.integers(variable.sizes[lat_dim])),
+                        lon_dim: int(rng.integers(variable.sizes[lon_dim])),
+                    }
+                    start = time.perf_counter()
+                    numpy.asarray(variable.isel(**others, **point))
+                    point_seconds.append(time.perf_counter() - start)
+
+                    frame = {time_dim: int(rng.integers(variable.sizes[time_dim]))}
+                    start = time.perf_counter()
+                    numpy.asarray(variable.isel(**others, **frame))
+                    frame_seconds.append(time.perf_counter() - start)
+
+            results[layout] = {
+                "point_ms": statistics.median(point_seconds) * 1000,
+                "frame_ms": statistics.median(frame_seconds) * 1000,
+            }
+        return results
+
+
+def _store_mb(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2**20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a NetCDF file to every Zarr layout and time point / frame reads"
+    )
+    parser.add_argument("netcdf_file")
+    parser.add_argument("-i", "--variable_of_interest_name", required=True)
+    parser.add_argument("--compressor", choices=COMPRESSORS, default="blosc-zstd")
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--shuffle", choices=SHUFFLES, default="shuffle")
+    parser.add_argument("--chunk_mb", type=float, default=DEFAULT_CHUNK_MB)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--reads", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    profile = ZarrProfile(
+        name=DEFAULT_PROFILE,
+        compressor=args.compressor,
+        level=args.level,
+        shuffle=args.shuffle,
+        chunk_mb=args.chunk_mb,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The source chunking, as the conversion did before the profiles
+        source_path = Path(tmp_dir) / "source.zarr"
+        with xr.open_dataset(args.netcdf_file, decode_times=False) as ds:
+            for variable in ds.variables.values():
+                variable.encoding.pop("preferred_chunks", None)
+            start = time.perf_counter()
+            ds.to_zarr(source_path, mode="w", consolidated=True)
+            write_seconds = {"source": time.perf_counter() - start}
+
+            converter = ZarrConverter(profile, workers=args.workers)
+            for layout in LAYOUTS:
+                start = time.perf_counter()
+                converter._write_layout(ds, Path(tmp_dir) / f"{layout}.zarr", layout)
+                write_seconds[layout] = time.perf_counter() - start
+
+        paths = {layout: Path(tmp_dir) / f"{layout}.zarr" for layout in write_seconds}
+        results = ZarrConverter.benchmark(
+            paths, args.variable_of_interest_name, reads=args.reads
+        )
+        print(f"{'layout':<8} {'write s':>8} {'MB':>8} {'point ms':>9} {'frame ms':>9}")
+        for layout, path in paths.items():
+            print(
+                f"{layout:<8} {write_seconds[layout]:>8.2f} {_store_mb(path):>8.1f} "
+                f"{results[layout]['point_ms']:>9.2f} {results[layout]['frame_ms']:>9.2f}"
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# !/usr/bin/env python3
+"""
+Micro-benchmark of the stdlib CustomJSONResponse (recursive clean_for_json +
+json.dumps) against the orjson based NaNSafeJSONResponse on a
+/timeseries/extract sized response.
+"""
+
+import argparse
+import json
+
+import numpy
+import pandas
+
+from icharm.services.data.app.json_response import (
+    CustomJSONResponse,
+    NaNSafeJSONResponse,
+)
+from icharm.utils.benchmark import benchmark
+
+
+def build_timeseries_content(points: int, nan_fraction: float = 0.05) -> dict:
+    """Content shaped like TimeSeriesResponse.model_dump() with some NaN values"""
+    rng = numpy.random.default_rng(0)
+    values = rng.normal(size=(points, 2))
+    values[rng.random(values.shape) < nan_fraction] = numpy.nan
+    dates = pandas.date_range("1900-01-01", periods=points, freq="D")
+
+    data = [
+        {
+            "date": date.strftime("%Y-%m-%d"),
+            "values": {"dataset-a": float(a), "dataset-b": float(b)},
+            "timestamp": int(date.timestamp()),
+        }
+        for date, (a, b) in zip(dates, values)
+    ]
+    return {
+        "data": data,
+        "metadata": None,
+        "statistics": {"dataset-a": {"min": numpy.nanmin(values[:, 0])}},
+        "chartConfig": None,
+        "processingInfo": {"totalPoints": points, "series": values[:, 0]},
+    }
+
+
+@benchmark
+def render_custom(content: dict) -> bytes:
+    return CustomJSONResponse(content=None).render(content)
+
+
+@benchmark
+def render_nan_safe(content: dict) -> bytes:
+    return NaNSafeJSONResponse(content=None).render(content)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    content = build_timeseries_content(args.points)
+    custom = render_custom(content)
+    nan_safe = render_nan_safe(content)
+
+    assert json.loads(custom) == json.loads(nan_safe), "Responses differ"
+    print(f"Response size: {len(nan_safe) / 1024**2:.2f} MB")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# !/usr/bin/env python3
+"""
+Offline job that precomputes the gridbox_data overview pyramid (2x, 4x, 8x
+NaN-aware block means) for a dataset into OVERVIEWS_PATH.
+
+Works for every storage type `DatabaseQueries.get_gridbox_data` supports
+(grid_data in Postgres, local Zarr/NetCDF and cloud datasets).
+"""
+
+import argparse
+import asyncio
+import logging
+
+from tqdm import tqdm
+
+from icharm.services.data.app.database_queries import DatabaseQueries
+from icharm.services.data.app.models import DatasetRequest, GridboxDataRequest
+from icharm.services.data.app.raster_overviews import RasterOverviews
+from icharm.utils.logger import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+async def build_overviews(
+    dataset_id: str,
+    level_ids: list[int] | None = None,
+    overwrite: bool = False,
+) -> int:
+    dataset_request = DatasetRequest(datasetId=dataset_id)
+    timestamps = await DatabaseQueries.get_timestamps(dataset_request)
+    if level_ids is None:
+        levels = await DatabaseQueries.get_levels(dataset_request)
+        level_ids = levels["level_id"]
+
+    # Overviews of older data are rebuilt, they're no longer served
+    version = DatabaseQueries.get_dataset_version(dataset_id)
+    written = 0
+    for level_id in level_ids:
+        logger.info(f"Building overviews for dataset {dataset_id} level {level_id}")
+        for timestamp_id in tqdm(timestamps["timestamp_id"]):
+            if not overwrite and RasterOverviews.is_current(
+                dataset_id, level_id, timestamp_id, version
+            ):
+                continue
+
+            lat_values, lon_values, grid = await DatabaseQueries.get_gridbox_grid(
+                GridboxDataRequest(
+                    datasetId=dataset_id,
+                    timestampId=timestamp_id,
+                    levelId=level_id,
+                )
+            )
+            RasterOverviews.save(
+                dataset_id,
+                level_id,
+                timestamp_id,
+                lat_values,
+                lon_values,
+                grid,
+                version,
+            )
+            written += 1
+
+    logger.info(f"Wrote {written} overview files")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dataset_id", required=True, help="Dataset UUID")
+    parser.add_argument(
+        "--level_id",
+        type=int,
+        action="append",
+        default=None,
+        help="Level id to build (repeatable, default: all levels)",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Rebuild overviews that already exist",
+    )
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    asyncio.run(
+        build_overviews(
+            dataset_id=args.dataset_id,
+            level_ids=args.level_id,
+            overwrite=args.overwrite,
+        )
+    )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import asyncio
+import hashlib
 import os
 from pathlib import Path
 from datetime import datetime
@@ -19,10 +21,14 @@ from icharm.services.data.app.models import (
     Metadata,
     GridboxDataRequest,
     TimeseriesDataRequest,
+    TileRequest,
 )
 from icharm.services.data.app.dataset_local import DatasetLocal
 from icharm.services.data.app.dataset_cloud import DatasetCloud
 from icharm.services.data.app.data_processing import DataProcessing
+from icharm.services.data.app.raster_overviews import RasterOverviews
+from icharm.services.data.app.raster_encoding import RasterEncoding
+from icharm.services.data.app.raster_tiles import RasterTiles, tile_cache
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +55,7 @@ class DatabaseQueries:
     _local_cloud_time_cache: dict[str, list[datetime]] = {}
     _local_cloud_level_cache: dict[str, list[float | str]] = {}
     _local_cloud_grid_cache: dict[str, dict[str, Any]] = {}
+    _ingest_version_cache: dict[str, tuple[str, float]] = {}
 
     ##############################
     # Helper methods
@@ -349,6 +356,203 @@ class DatabaseQueries:
 
     @staticmethod
     async def get_gridbox_data(request: GridboxDataRequest) -> dict[str, Any]:
+        if request.max_cells is not None or request.resolution is not None:
+            return await DatabaseQueries.get_gridbox_overview(request)
+        return await DatabaseQueries._get_native_gridbox_data(request)
+
+    @staticmethod
+    async def get_gridbox_data_encoded(
+        request: GridboxDataRequest,
+    ) -> tuple[bytes, dict[str, str]]:
+        """
+        Gridbox data values in a binary encoding (see RasterEncoding). The value
+        of gridbox `g` is at index `g - X-Gridbox-First`, gridboxes without data
+        are NaN / X-Nodata. Overviews have no gridbox ids (nor X-Gridbox-First),
+        their cells are row-major over X-Rows x X-Cols. Quantized encodings use the dataset's valueMin /
+        valueMax when set, otherwise the min/max of the frame.
+        """
+        data = await DatabaseQueries.get_gridbox_data(request)
+        metadata = DatabaseQueries.get_metadata(request)
+
+        values = numpy.asarray(
+            [numpy.nan if v is None else v for v in data["value"]], dtype=float
+        )
+        if "gridbox_id" in data:
+            ids = numpy.asarray(data["gridbox_id"], dtype=numpy.int64)
+            first = int(ids.min()) if ids.size else 0
+            dense = numpy.full(int(ids.max()) - first + 1 if ids.size else 0, numpy.nan)
+            dense[ids - first] = values
+        else:
+            first = None
+            dense = values
+
+        body, headers = RasterEncoding.encode(
+            dense,
+            request.encoding,
+            value_min=metadata.value_min,
+            value_max=metadata.value_max,
+        )
+        if first is not None:
+            headers["X-Gridbox-First"] = str(first)
+        headers["X-Count"] = str(dense.size)
+        for key in ("resolution", "rows", "cols"):
+            if key in data:
+                headers[f"X-{key.title()}"] = str(data[key])
+        return body, headers
+
+    @staticmethod
+    async def get_gridbox_grid(
+        request: GridboxDataRequest,
+    ) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Native gridbox data as (lat_values, lon_values, grid[lat, lon])"""
+        data = await DatabaseQueries._get_native_gridbox_data(request)
+        return RasterOverviews.grid_from_points(data["lat"], data["lon"], data["value"])
+
+    @staticmethod
+    async def get_gridbox_overview(request: GridboxDataRequest) -> dict[str, Any]:
+        """
+        Serve a coarsened overview of the gridbox data. Precomputed overviews
+        (see build_overviews.py) are used when available, otherwise the overview
+        is computed from the native grid.
+        """
+        version = await asyncio.to_thread(
+            DatabaseQueries.get_dataset_version, request.dataset_id
+        )
+        payload = RasterOverviews.load(
+            dataset_id=request.dataset_id,
+            level_id=request.level_id,
+            timestamp_id=request.timestamp_id,
+            version=version,
+            max_cells=request.max_cells,
+            resolution=request.resolution,
+        )
+        if payload is not None:
+            return payload
+
+        data = await DatabaseQueries._get_native_gridbox_data(request)
+        lat_values, lon_values, grid = RasterOverviews.grid_from_points(
+            data["lat"], data["lon"], data["value"]
+        )
+        rows, cols = grid.shape
+        factor = RasterOverviews.select_factor(
+            rows, cols, max_cells=request.max_cells, resolution=request.resolution
+        )
+        if factor == 1:
+            return {**data, "resolution": 1, "rows": rows, "cols": cols}
+
+        return RasterOverviews.to_payload(
+            RasterOverviews.coarsen_axis(lat_values, factor),
+            RasterOverviews.coarsen_axis(lon_values, factor),
+            RasterOverviews.block_mean(grid, factor),
+            factor,
+        )
+
+    @staticmethod
+    async def get_gridbox_tile(
+        request: TileRequest, if_none_match: Optional[str] = None
+    ) -> tuple[Optional[bytes], dict[str, str]]:
+        """
+        Encoded value tile cut from the grid, see RasterTiles for the tiling
+        scheme. Returns the body and the headers describing it. The body is
+        None when if_none_match already matches the tile's ETag, which is
+        known before the tile is rendered.
+        """
+        # Validate the tile address before touching the caches or the data
+        west, south, east, north = RasterTiles.tile_bounds(
+            request.z, request.x, request.y
+        )
+
+        # New data changes the version, which retires the tiles cut before it
+        version, value_min, value_max = await asyncio.to_thread(
+            DatabaseQueries._tile_dataset_state, request.dataset_id
+        )
+        key = (
+            request.dataset_id,
+            version,
+            request.timestamp_id,
+            request.level_id,
+            request.encoding,
+            request.z,
+            request.x,
+            request.y,
+        )
+        etag = RasterTiles.etag(*key, value_min, value_max)
+        if RasterTiles.etag_matches(if_none_match, etag):
+            return None, {"ETag": etag}
+
+        cached = tile_cache.get(key)
+        if cached is not None:
+            body, headers = cached
+            return body, {**headers, "ETag": etag}
+
+        frame_key = (request.dataset_id, request.level_id, request.timestamp_id)
+        cached_frame_key = frame_key + (version,)
+        native = tile_cache.get_frame(cached_frame_key + (1,))
+        if native is None:
+            native = await DatabaseQueries.get_gridbox_grid(
+                GridboxDataRequest(
+                    datasetId=request.dataset_id,
+                    timestampId=request.timestamp_id,
+                    levelId=request.level_id,
+                )
+            )
+            tile_cache.set_frame(cached_frame_key + (1,), native)
+
+        # Zoomed out tiles are cut from the matching overview
+        factor = RasterTiles.select_factor(native[0], request.z)
+        frame = native
+        if factor > 1:
+            frame = tile_cache.get_frame(cached_frame_key + (factor,))
+            if frame is None:
+                frame = RasterOverviews.load_grid(*frame_key, factor, version)
+            if frame is None:
+                lat_values, lon_values, grid = native
+                frame = (
+                    RasterOverviews.coarsen_axis(lat_values, factor),
+                    RasterOverviews.coarsen_axis(lon_values, factor),
+                    RasterOverviews.block_mean(grid, factor),
+                )
+            tile_cache.set_frame(cached_frame_key + (factor,), frame)
+
+        # Every tile of a frame is quantized with the same range, so neighbouring
+        # tiles decode to matching values
+        if request.encoding != "float32":
+            value_min, value_max = RasterEncoding.value_range(
+                native[2], value_min, value_max
+            )
+        tile = RasterTiles.cut(*frame, request.z, request.x, request.y)
+        body, headers = RasterEncoding.encode(
+            tile, request.encoding, value_min=value_min, value_max=value_max
+        )
+        headers.update(
+            {
+                "X-Tile-Bounds": f"{west},{south},{east},{north}",
+                "X-Resolution": str(factor),
+                "ETag": etag,
+            }
+        )
+        tile_cache.set(key, body, headers)
+        return body, headers
+
+    @staticmethod
+    def _tile_dataset_state(
+        dataset_id: str,
+    ) -> tuple[str, Optional[float], Optional[float]]:
+        """
+        Version of a dataset's data (from its endDate and ingest version) and
+        its valueMin / valueMax (None when unset). Runs database queries.
+        """
+        meta_row = DatabaseQueries._metadata_row_for_id(dataset_id)
+        version = DatabaseQueries.get_data_version(meta_row)
+
+        value_range = []
+        for column in ("valueMin", "valueMax"):
+            value = meta_row.get(column)
+            value_range.append(None if pandas.isna(value) else float(value))
+        return version, *value_range
+
+    @staticmethod
+    async def _get_native_gridbox_data(request: GridboxDataRequest) -> dict[str, Any]:
         metadata = DatabaseQueries.get_metadata(request)
         stored = (metadata.stored or metadata.storage_type or "").lower()
         if stored == "postgres" or "postgres" in stored:
@@ -601,6 +805,111 @@ class DatabaseQueries:
                 detail=f"Failed to fetch metadata from database: {str(e)}",
             )
 
+    @staticmethod
+    def _is_postgres_extraction(meta_row: pandas.Series) -> bool:
+        """Same check ExtractTimeseries uses to pick the PostgreSQL extractor"""
+        storage_type = str(meta_row.get("storageType", "")).lower()
+        return storage_type == "local_postgres_netcdf"
+
+    @staticmethod
+    def get_ingest_version(meta_row: pandas.Series, max_age: float = 60.0) -> str:
+        """
+        Token that changes when new data is ingested into a PostgreSQL dataset
+        (re-checked at most every `max_age` seconds). Other datasets rely on
+        their metadata endDate.
+        """
+        if not DatabaseQueries._is_postgres_extraction(meta_row):
+            return ""
+
+        database_name = str(meta_row.get("inputFile", ""))
+        cached = DatabaseQueries._ingest_version_cache.get(database_name)
+        now = datetime.now().timestamp()
+        if cached is not None and now - cached[1] < max_age:
+            return cached[0]
+
+        db_engine = DatabaseQueries.get_engine(database_name)
+        try:
+            with db_engine.connect() as conn:
+                # The grid_data comment is stamped by every (incremental) ingest
+                count, max_id, stamp = conn.execute(
+                    text("""
+                        SELECT
+                            COUNT(*),
+                            MAX(timestamp_id),
+                            obj_description(to_regclass('grid_data'), 'pg_class')
+                        FROM timestamp_dim
+                    """)
+                ).fetchone()
+        finally:
+            db_engine.dispose()
+
+        version = f"{count}:{max_id}:{stamp or ''}"
+        DatabaseQueries._ingest_version_cache[database_name] = (version, now)
+        return version
+
+    @staticmethod
+    def get_data_version(meta_row: pandas.Series) -> str:
+        """
+        Short token identifying the data of a dataset, from its endDate and
+        ingest version. Derived data (tiles, overviews) is keyed on it
+        """
+        version_source = (
+            f"{meta_row.get('endDate')}|{DatabaseQueries.get_ingest_version(meta_row)}"
+        )
+        return hashlib.sha1(version_source.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def get_dataset_version(dataset_id: str) -> str:
+        """get_data_version of a dataset id, runs database queries"""
+        meta_row = DatabaseQueries._metadata_row_for_id(dataset_id)
+        return DatabaseQueries.get_data_version(meta_row)
+
+    @staticmethod
+    def clear_grid_caches():
+        DatabaseQueries._ingest_version_cache.clear()
+
+    @staticmethod
+    def _point_series_query(conn, value_columns: list[str]):
+        """
+        Query for (timestamp_val, *value_columns) of one gridbox in timestamp
+        order. Reads the packed grid_series row when the dataset was ingested
+        with it (one row instead of one grid_data row per timestamp).
+        """
+        has_grid_series = conn.execute(
+            text("SELECT to_regclass('grid_series') IS NOT NULL")
+        ).scalar()
+
+        if has_grid_series:
+            arrays_sql = ", ".join(f"s.{col}" for col in value_columns)
+            unnested_sql = ", ".join(f"u.{col}" for col in value_columns)
+            return text(f"""
+                SELECT
+                    t.timestamp_val,
+                    {unnested_sql}
+                FROM grid_series s
+                CROSS JOIN LATERAL UNNEST({arrays_sql})
+                    WITH ORDINALITY AS u({", ".join(value_columns)}, n)
+                JOIN (
+                    SELECT
+                        timestamp_val,
+                        ROW_NUMBER() OVER (ORDER BY timestamp_id) AS n
+                    FROM timestamp_dim
+                ) t ON t.n = u.n
+                WHERE s.gridbox_id = :gridbox_id
+                ORDER BY u.n
+            """)
+
+        columns_sql = ", ".join(f"g.{col}" for col in value_columns)
+        return text(f"""
+            SELECT
+                t.timestamp_val,
+                {columns_sql}
+            FROM grid_data g
+            JOIN timestamp_dim t ON g.timestamp_id = t.timestamp_id
+            WHERE g.gridbox_id = :gridbox_id
+            ORDER BY t.timestamp_id
+        """)
+
     @staticmethod
     def extract_timeseries_from_postgres(
         start_date: datetime,
@@ -726,17 +1035,9 @@ class DatabaseQueries:
                 # Build query based on whether we have year-based columns or not
                 if is_year_based:
                     # Extract time series for this gridbox with year-based columns
-                    year_columns_sql = ", ".join([f"g.{col}" for col in value_columns])
-
-                    data_query = text(f"""
-                        SELECT
-                            t.timestamp_val,
-                            {year_columns_sql}
-                        FROM grid_data g
-                        JOIN timestamp_dim t ON g.timestamp_id = t.timestamp_id
-                        WHERE g.gridbox_id = :gridbox_id
-                        ORDER BY t.timestamp_id
-                    """)
+                    data_query = DatabaseQueries._point_series_query(
+                        conn, value_columns
+                    )
 
                     results = conn.execute(
                         data_query, {"gridbox_id": gridbox_id}
@@ -810,15 +1111,7 @@ class DatabaseQueries:
                     # Timestamps are stored as full ISO datetimes, not MMDD
                     # Default to first level (surface/index 0) for now
                     value_col = value_columns[0]
-                    data_query = text(f"""
-                        SELECT
-                            t.timestamp_val,
-                            g.{value_col}
-                        FROM grid_data g
-                        JOIN timestamp_dim t ON g.timestamp_id = t.timestamp_id
-                        WHERE g.gridbox_id = :gridbox_id
-                        ORDER BY t.timestamp_id
-                    """)
+                    data_query = DatabaseQueries._point_series_query(conn, [value_col])
 
                     results = conn.execute(
                         data_query, {"gridbox_id": gridbox_id}
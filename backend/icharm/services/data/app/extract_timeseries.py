@@ -17,6 +17,10 @@ import asyncio
 
 
 from icharm.services.data.app.data_processing import DataProcessing
+from icharm.services.data.app.response_cache import (
+    COORDINATE_DECIMALS,
+    fingerprint,
+)
 from icharm.services.data.app.models import (
     DatasetMetadata,
     TimeSeriesResponse,
@@ -80,6 +84,54 @@ class ExtractTimeseries:
             logger.error(f"Error parsing focus coordinates: {e}")
             return []
 
+    @staticmethod
+    def cache_key(request: TimeSeriesRequest) -> Optional[str]:
+        """
+        Fingerprint of a request for the response cache, None when the request
+        shouldn't be cached.
+
+        Dataset ids are sorted. Focus coordinates are kept exactly as parsed,
+        in order, because the point series are named and described with them.
+        The dataset endDate and ingest version are part of the key, so new
+        data invalidates cached responses. Runs database queries, call it off
+        the event loop.
+        """
+        dataset_ids = sorted(set(request.datasetIds))
+        metadata_df = DatabaseQueries.get_metadata_by_ids(dataset_ids)
+        if len(metadata_df) == 0:
+            return None
+
+        focus_coords = ExtractTimeseries.parse_focus_coordinates(
+            request.focusCoordinates
+        )
+
+        datasets = []
+        try:
+            for _, meta_row in metadata_df.sort_values("id").iterrows():
+                datasets.append(
+                    {
+                        "id": str(meta_row["id"]),
+                        "endDate": str(meta_row.get("endDate")),
+                        "version": DatabaseQueries.get_ingest_version(meta_row),
+                    }
+                )
+        except Exception as e:
+            logger.warning(f"Not caching timeseries request: {e}")
+            return None
+
+        parts = request.model_dump(
+            mode="json", exclude={"datasetIds", "focusCoordinates"}
+        )
+        if parts.get("spatialBounds"):
+            parts["spatialBounds"] = {
+                k: round(v, COORDINATE_DECIMALS)
+                for k, v in parts["spatialBounds"].items()
+            }
+        parts["datasets"] = datasets
+        # Order matters, it names the point series
+        parts["coordinates"] = [[c["lat"], c["lon"]] for c in focus_coords]
+        return fingerprint(parts)
+
     @staticmethod
     async def extract_timeseries_old(request: TimeSeriesRequest) -> TimeSeriesResponse:
         """
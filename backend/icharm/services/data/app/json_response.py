@@ -0,0 +1,98 @@
+import json
+from typing import Any
+
+import numpy
+import orjson
+import pandas
+from fastapi.responses import JSONResponse
+
+# ============================================================================
+# NaN-SAFE JSON RESPONSES
+# ============================================================================
+
+# orjson writes NaN/Inf floats as null on its own. OPT_SERIALIZE_NUMPY is left
+# off on purpose: it misreads big-endian arrays (as read from NetCDF files), so
+# arrays go through _nan_safe_array instead.
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _nan_safe_array(array: numpy.ndarray) -> Any:
+    """NaN/Inf are replaced by None in one vectorized pass"""
+    if array.dtype.kind in "fc":
+        return numpy.where(numpy.isfinite(array), array, None).tolist()
+    # Elements orjson doesn't know come back through _orjson_default
+    return array.tolist()
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback for the types orjson doesn't serialize itself"""
+    if isinstance(obj, numpy.ndarray):
+        return _nan_safe_array(obj)
+    if isinstance(obj, (pandas.Series, pandas.Index)):
+        return _nan_safe_array(obj.to_numpy())
+    if obj is pandas.NaT or obj is pandas.NA:
+        return None
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    if isinstance(obj, pandas.Timestamp):
+        return obj.isoformat()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON with NaN/Inf written as null"""
+    return orjson.dumps(content, default=_orjson_default, option=ORJSON_OPTIONS)
+
+
+class NaNSafeJSONResponse(JSONResponse):
+    """orjson based JSON response that writes NaN and Inf values as null"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ============================================================================
+# STDLIB JSON RESPONSE
+# ============================================================================
+
+
+def clean_for_json(obj):
+    """Recursively clean data structures to be JSON-compliant"""
+    if isinstance(obj, dict):
+        return {k: clean_for_json(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [clean_for_json(item) for item in obj]
+    elif isinstance(obj, float):
+        if numpy.isnan(obj) or numpy.isinf(obj):
+            return None
+        return obj
+    elif isinstance(obj, numpy.integer):
+        return int(obj)
+    elif isinstance(obj, numpy.floating):
+        if numpy.isnan(obj) or numpy.isinf(obj):
+            return None
+        return float(obj)
+    elif isinstance(obj, numpy.ndarray):
+        return clean_for_json(obj.tolist())
+    elif pandas.isna(obj):
+        return None
+    return obj
+
+
+class CustomJSONResponse(JSONResponse):
+    """
+    Custom JSON response that handles NaN and Inf values. Superseded by
+    NaNSafeJSONResponse, kept as the reference for benchmark_json_response.py
+    """
+
+    def render(self, content: Any) -> bytes:
+        cleaned_content = clean_for_json(content)
+        return json.dumps(
+            cleaned_content,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
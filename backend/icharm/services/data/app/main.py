@@ -4,16 +4,16 @@ Supports both local and cloud-based datasets with advanced processing capabiliti
 NOW WITH RASTER VISUALIZATION SUPPORT
 """
 
+import asyncio
+import time
+
 import orjson
 from fastapi import FastAPI, APIRouter, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response, RedirectResponse
-from typing import Optional, Any, Literal
+from fastapi.responses import Response, RedirectResponse
+from typing import Optional, Literal
 from datetime import datetime
-import pandas as pd
-import numpy as np
 import os
-import json
 import re
 from concurrent.futures import ThreadPoolExecutor
 import warnings
@@ -24,6 +24,8 @@ from icharm.services.data.app.database_queries import DatabaseQueries
 from icharm.services.data.app.dataset_cache import dataset_cache
 from icharm.services.data.app.env_helpers import EnvHelpers
 from icharm.services.data.app.extract_timeseries import ExtractTimeseries
+from icharm.services.data.app import json_response
+from icharm.services.data.app.json_response import NaNSafeJSONResponse
 from icharm.services.data.app.models import (
     TimeSeriesResponse,
     TimeSeriesRequest,
@@ -31,7 +33,11 @@ from icharm.services.data.app.models import (
     DatasetRequest,
     GridboxDataRequest,
     TimeseriesDataRequest,
+    TileRequest,
 )
+from icharm.services.data.app.raster_encoding import RasterEncoding
+from icharm.services.data.app.raster_tiles import TILE_MAX_AGE, tile_cache
+from icharm.services.data.app.response_cache import timeseries_cache
 
 # Import raster visualization module
 from icharm.utils.logger import setup_logging
@@ -40,48 +46,6 @@ warnings.filterwarnings("ignore")
 
 logger = logging.getLogger(__name__)
 
-# ============================================================================
-# CUSTOM JSON ENCODER FOR NaN/Inf VALUES
-# ============================================================================
-
-
-def clean_for_json(obj):
-    """Recursively clean data structures to be JSON-compliant"""
-    if isinstance(obj, dict):
-        return {k: clean_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_for_json(item) for item in obj]
-    elif isinstance(obj, float):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return obj
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return clean_for_json(obj.tolist())
-    elif pd.isna(obj):
-        return None
-    return obj
-
-
-class CustomJSONResponse(JSONResponse):
-    """Custom JSON response that handles NaN and Inf values"""
-
-    def render(self, content: Any) -> bytes:
-        cleaned_content = clean_for_json(content)
-        return json.dumps(
-            cleaned_content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-        ).encode("utf-8")
-
-
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -117,7 +81,7 @@ app = FastAPI(
     title="Enhanced Climate Time Series API",
     description="Advanced API for extracting and processing climate time series data",
     version="2.0.0",
-    # default_response_class=CustomJSONResponse,
+    # default_response_class=NaNSafeJSONResponse,
 )
 
 # Configure CORS
@@ -131,6 +95,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browsers read how binary raster payloads are encoded
+    expose_headers=["*"],
 )
 
 router = APIRouter(prefix="/api/v2")
@@ -139,7 +105,7 @@ router = APIRouter(prefix="/api/v2")
 @router.post(
     "/timeseries/extract",
     response_model=TimeSeriesResponse,
-    response_class=CustomJSONResponse,
+    response_class=NaNSafeJSONResponse,
 )
 async def extract_timeseries(request: TimeSeriesRequest):
     """
@@ -154,10 +120,35 @@ async def extract_timeseries(request: TimeSeriesRequest):
     - If multiple coordinates provided, averages the values
     - Ignores spatialBounds and aggregation parameters
     """
-    return await ExtractTimeseries.extract_timeseries(request)
+    start = time.perf_counter()
+    cache_key = await asyncio.to_thread(ExtractTimeseries.cache_key, request)
+    if cache_key is not None:
+        cached = timeseries_cache.get(cache_key)
+        if cached is not None:
+            # Only the timing belongs to the request that filled the cache
+            response = orjson.loads(cached)
+            response["processingInfo"]["processingTime"] = (
+                f"{time.perf_counter() - start:.2f}s"
+            )
+            response["processingInfo"]["cached"] = True
+            return Response(
+                content=orjson.dumps(response),
+                media_type="application/json",
+                headers={"X-Cache": "HIT"},
+            )
+
+    response = await ExtractTimeseries.extract_timeseries(request)
+    # The response is built from validated models, skip FastAPI's re-validation
+    # and jsonable_encoder pass
+    payload = json_response.dumps(response.model_dump())
+    if cache_key is not None:
+        timeseries_cache.set(cache_key, payload)
+    return Response(
+        content=payload, media_type="application/json", headers={"X-Cache": "MISS"}
+    )
 
 
-@router.post("/raster/visualize", response_class=CustomJSONResponse)
+@router.post("/raster/visualize", response_class=NaNSafeJSONResponse)
 async def visualize_raster(request: RasterRequest):
     """
     Generate raster visualization for 3D globe display
@@ -169,7 +160,7 @@ async def visualize_raster(request: RasterRequest):
     )
 
 
-@router.post("/raster/grid", response_class=CustomJSONResponse)
+@router.post("/raster/grid", response_class=NaNSafeJSONResponse)
 async def raster_grid(request: RasterRequest):
     """Generate raw raster grid for client-side mesh rendering."""
     raise HTTPException(
@@ -178,7 +169,7 @@ async def raster_grid(request: RasterRequest):
     )
 
 
-@router.get(path="/datasets", response_class=CustomJSONResponse)
+@router.get(path="/datasets", response_class=NaNSafeJSONResponse)
 async def get_datasets(
     stored: Optional[Literal["local", "cloud", "all"]] = "all",
     source: Optional[str] = None,
@@ -194,7 +185,7 @@ async def get_datasets(
 
 
 @router.get(
-    path="/timeseries/datasets", response_class=CustomJSONResponse, deprecated=True
+    path="/timeseries/datasets", response_class=NaNSafeJSONResponse, deprecated=True
 )
 async def list_available_datasets(
     request: Request,
@@ -243,20 +234,90 @@ async def get_gridboxes(datasetId: str = Query(..., description="Dataset UUID"))
 
 @router.get(path="/gridbox_data")
 async def get_gridbox_data(
+    request: Request,
     datasetId: str = Query(..., description="Dataset UUID"),
     timestampId: int = Query(..., description="Timestamp id"),
     levelId: int = Query(..., description="Level id"),
+    maxCells: Optional[int] = Query(
+        None, ge=1, description="Serve the finest overview within this many cells"
+    ),
+    resolution: Optional[int] = Query(
+        None, description="Overview coarsening factor (1, 2, 4 or 8)"
+    ),
+    encoding: Literal["json", "float32", "uint16", "uint8"] = Query(
+        "json",
+        description="json, or binary values only (float32, quantized uint16/uint8)",
+    ),
 ):
-    """Get all available gridboxes for dataset"""
-    data = await DatabaseQueries.get_gridbox_data(
-        GridboxDataRequest(
+    """
+    Get all available gridboxes for dataset. Overviews (maxCells / resolution
+    coarser than the native grid) have no gridbox_id, their cells are listed
+    row-major over `rows` x `cols`
+    """
+    gridbox_request = GridboxDataRequest(
+        datasetId=datasetId,
+        timestampId=timestampId,
+        levelId=levelId,
+        maxCells=maxCells,
+        resolution=resolution,
+        encoding=encoding,
+    )
+    if encoding == "json":
+        data = await DatabaseQueries.get_gridbox_data(gridbox_request)
+        payload = orjson.dumps(data)
+        headers = {}
+        media_type = "application/json"
+    else:
+        payload, headers = await DatabaseQueries.get_gridbox_data_encoded(
+            gridbox_request
+        )
+        media_type = "application/octet-stream"
+
+    payload, content_encoding = RasterEncoding.compress(
+        payload, request.headers.get("accept-encoding")
+    )
+    headers["Vary"] = "Accept-Encoding"
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=payload, media_type=media_type, headers=headers)
+
+
+@router.get(path="/tiles/{datasetId}/{timestampId}/{levelId}/{z}/{x}/{y}")
+async def get_tile(
+    request: Request,
+    datasetId: str,
+    timestampId: int,
+    levelId: int,
+    z: int,
+    x: int,
+    y: int,
+    encoding: Literal["float32", "uint16"] = Query(
+        "float32", description="Binary encoding of the tile values"
+    ),
+):
+    """
+    Value tile (TILE_SIZE x TILE_SIZE, north row first) cut from the grid.
+    Zoom 0 has two tiles covering the western and eastern hemispheres.
+    A matching If-None-Match gets a 304 without the tile being rendered.
+    """
+    body, headers = await DatabaseQueries.get_gridbox_tile(
+        TileRequest(
             datasetId=datasetId,
             timestampId=timestampId,
             levelId=levelId,
-        )
+            z=z,
+            x=x,
+            y=y,
+            encoding=encoding,
+        ),
+        if_none_match=request.headers.get("if-none-match"),
+    )
+    headers = {**headers, "Cache-Control": f"public, max-age={TILE_MAX_AGE}"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=body, media_type="application/octet-stream", headers=headers
     )
-    payload = orjson.dumps(data)
-    return Response(content=payload, media_type="application/json")
 
 
 @router.get(path="/timeseries_data")
@@ -284,6 +345,8 @@ async def health_check():
         "status": "healthy",
         "service": "climate-timeseries-api-v2",
         "cache_size": len(dataset_cache.cache),
+        "tile_cache": tile_cache.stats(),
+        "timeseries_cache": timeseries_cache.stats(),
         "timestamp": datetime.now().isoformat(),
         "features": {
             "timeseries": True,
@@ -296,8 +359,11 @@ async def health_check():
 
 @router.post("/cache/clear")
 async def clear_cache():
-    """Clear the dataset cache"""
+    """Clear the dataset, tile (memory and disk) and timeseries caches"""
     dataset_cache.clear()
+    await asyncio.to_thread(tile_cache.clear)
+    timeseries_cache.clear()
+    DatabaseQueries.clear_grid_caches()
     return {"message": "Cache cleared successfully"}
 
 
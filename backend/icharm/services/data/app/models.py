@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -72,6 +72,27 @@ class GridboxDataRequest(BaseModel):
     dataset_id: str = Field(..., alias="datasetId", description="Dataset UUID")
     timestamp_id: int = Field(..., alias="timestampId", description="Timestamp id")
     level_id: int = Field(..., alias="levelId", description="Level id")
+    max_cells: Optional[int] = Field(
+        None, alias="maxCells", ge=1, description="Serve an overview within this size"
+    )
+    resolution: Optional[int] = Field(
+        None, alias="resolution", description="Overview coarsening factor (1, 2, 4, 8)"
+    )
+    encoding: Literal["json", "float32", "uint16", "uint8"] = Field(
+        "json", description="Response encoding, binary encodings only carry values"
+    )
+
+
+class TileRequest(BaseModel):
+    dataset_id: str = Field(..., alias="datasetId", description="Dataset UUID")
+    timestamp_id: int = Field(..., alias="timestampId", description="Timestamp id")
+    level_id: int = Field(..., alias="levelId", description="Level id")
+    z: int = Field(..., ge=0, description="Zoom level")
+    x: int = Field(..., ge=0, description="Tile column")
+    y: int = Field(..., ge=0, description="Tile row (0 is the northernmost row)")
+    encoding: Literal["float32", "uint16"] = Field(
+        "float32", description="Binary encoding of the tile values"
+    )
 
 
 class TimeseriesDataRequest(BaseModel):
@@ -108,6 +129,16 @@ class Metadata(BaseModel):
     orig_location: str | None = Field(None, alias="origLocation")
     start_date: str | None = Field(None, alias="startDate")
     end_date: str | None = Field(None, alias="endDate")
+    value_min: float | None = Field(None, alias="valueMin")
+    value_max: float | None = Field(None, alias="valueMax")
+
+    @validator("value_min", "value_max", pre=True)
+    def parse_value_range(cls, v):
+        # Colour range columns are optional and free-form in the metadata table
+        try:
+            return float(v) if v not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
 
 
 class RasterRequest(BaseModel):
@@ -0,0 +1,172 @@
+import gzip
+from typing import Optional
+
+import numpy
+
+import logging
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional, gzip is always there
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Binary encodings supported for raster payloads
+ENCODINGS = ("float32", "uint16", "uint8")
+
+# Largest quantized value is reserved for missing values
+NODATA_UINT16 = numpy.iinfo(numpy.uint16).max
+NODATA_UINT8 = numpy.iinfo(numpy.uint8).max
+
+QUANTIZED_DTYPES = {
+    "uint16": (numpy.dtype("<u2"), NODATA_UINT16),
+    "uint8": (numpy.dtype("u1"), NODATA_UINT8),
+}
+
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+
+class RasterEncoding:
+    """
+    Binary encodings for raster values. Values are written row-major and
+    little-endian so browsers can wrap them in a typed array directly.
+
+    - float32: values as Float32, missing values stay NaN
+    - uint16 / uint8: values quantized to `value * scale + offset`, missing
+      values are `X-Nodata`
+    """
+
+    @staticmethod
+    def value_range(
+        values: numpy.ndarray,
+        value_min: Optional[float] = None,
+        value_max: Optional[float] = None,
+    ) -> tuple[float, float]:
+        """Range used for quantization, falls back to the min/max of the values"""
+        if value_min is None or value_max is None:
+            finite = values[numpy.isfinite(values)]
+            if finite.size == 0:
+                return 0.0, 0.0
+            if value_min is None:
+                value_min = float(finite.min())
+            if value_max is None:
+                value_max = float(finite.max())
+        return float(value_min), float(value_max)
+
+    @staticmethod
+    def quantize(
+        values: numpy.ndarray,
+        dtype: numpy.dtype,
+        nodata: int,
+        value_min: Optional[float] = None,
+        value_max: Optional[float] = None,
+    ) -> tuple[numpy.ndarray, float, float]:
+        """
+        Quantize values into [0, nodata) of an unsigned integer dtype. Returns
+        the quantized array with its scale and offset.
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        offset, upper = RasterEncoding.value_range(values, value_min, value_max)
+        steps = nodata - 1
+        scale = (upper - offset) / steps if upper > offset else 1.0
+
+        finite = numpy.isfinite(values)
+        scaled = numpy.zeros(values.shape, dtype=numpy.float64)
+        numpy.subtract(values, offset, out=scaled, where=finite)
+        numpy.divide(scaled, scale, out=scaled, where=finite)
+        numpy.rint(scaled, out=scaled)
+        numpy.clip(scaled, 0, steps, out=scaled)
+
+        quantized = scaled.astype(dtype)
+        quantized[~finite] = nodata
+        return quantized, scale, offset
+
+    @staticmethod
+    def encode(
+        values: numpy.ndarray,
+        encoding: str = "float32",
+        value_min: Optional[float] = None,
+        value_max: Optional[float] = None,
+    ) -> tuple[bytes, dict[str, str]]:
+        """
+        Encode a grid of values. Returns the body and the headers describing
+        how to decode it.
+        """
+        values = numpy.asarray(values)
+        headers = {"X-Encoding": encoding}
+        if values.ndim == 2:
+            headers["X-Rows"] = str(values.shape[0])
+            headers["X-Cols"] = str(values.shape[1])
+
+        if encoding == "float32":
+            body = values.astype("<f4").tobytes()
+            headers["X-Dtype"] = "float32"
+        elif encoding in QUANTIZED_DTYPES:
+            dtype, nodata = QUANTIZED_DTYPES[encoding]
+            quantized, scale, offset = RasterEncoding.quantize(
+                values, dtype, nodata, value_min, value_max
+            )
+            body = quantized.tobytes()
+            headers.update(
+                {
+                    "X-Dtype": encoding,
+                    "X-Scale": repr(scale),
+                    "X-Offset": repr(offset),
+                    "X-Nodata": str(nodata),
+                }
+            )
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+        return body, headers
+
+    @staticmethod
+    def decode(body: bytes, headers: dict[str, str]) -> numpy.ndarray:
+        """Inverse of `encode`, mostly useful for tests and clients in Python"""
+        dtype = headers["X-Dtype"]
+        if dtype == "float32":
+            values = numpy.frombuffer(body, dtype="<f4").astype(numpy.float64)
+        else:
+            raw = numpy.frombuffer(body, dtype=f"<{numpy.dtype(dtype).str[1:]}")
+            values = raw * float(headers["X-Scale"]) + float(headers["X-Offset"])
+            values[raw == int(headers["X-Nodata"])] = numpy.nan
+
+        if "X-Rows" in headers:
+            values = values.reshape(int(headers["X-Rows"]), int(headers["X-Cols"]))
+        return values
+
+    @staticmethod
+    def compress(
+        body: bytes, accept_encoding: Optional[str]
+    ) -> tuple[bytes, Optional[str]]:
+        """
+        Compress a body with the best Content-Encoding the client accepts
+        (zstd when the zstandard package is installed, else gzip). Returns the
+        body and the Content-Encoding, None when left uncompressed.
+        """
+        if not accept_encoding or len(body) < COMPRESS_MIN_BYTES:
+            return body, None
+
+        accepted = set()
+        for part in accept_encoding.lower().split(","):
+            name, _, params = part.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(name.strip())
+
+        if zstandard is not None and "zstd" in accepted:
+            compressed, content_encoding = (
+                zstandard.ZstdCompressor(level=3).compress(body),
+                "zstd",
+            )
+        elif "gzip" in accepted or "*" in accepted:
+            compressed, content_encoding = gzip.compress(body, compresslevel=6), "gzip"
+        else:
+            return body, None
+
+        # Noisy quantized values don't always compress
+        if len(compressed) >= len(body):
+            return body, None
+        return compressed, content_encoding
@@ -0,0 +1,307 @@
+import os
+import math
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy
+from fastapi import HTTPException
+
+import logging
+
+from icharm.services.data.app.env_helpers import EnvHelpers
+
+logger = logging.getLogger(__name__)
+
+# Coarsening factors we keep overviews for (1 == native grid)
+OVERVIEW_FACTORS = (1, 2, 4, 8)
+
+OVERVIEWS_PATH = EnvHelpers.resolve_env_path(
+    os.getenv("OVERVIEWS_PATH"), "datasets/overviews"
+)
+
+
+class RasterOverviews:
+    """
+    Multi-resolution pyramid for gridbox data.
+
+    Overviews are NaN-aware block means of the native (lat, lon) grid. They are
+    precomputed by `build_overviews.py` into `OVERVIEWS_PATH` and fall back to
+    being computed on the fly from the native grid when missing.
+    """
+
+    ##############################
+    # Grid helpers
+    ##############################
+    @staticmethod
+    def _axis_indices(values: numpy.ndarray) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Return the unique axis values (in order of first appearance) and the
+        index of every element into that axis.
+        """
+        uniq, first_idx, inverse = numpy.unique(
+            values, return_index=True, return_inverse=True
+        )
+        order = numpy.argsort(first_idx)
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(order.size)
+        return uniq[order], rank[inverse.reshape(-1)]
+
+    @staticmethod
+    def grid_from_points(
+        lat: Any, lon: Any, value: Any
+    ) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """
+        Rebuild the (lat, lon) grid from the flat gridbox_data columns.
+        Cells without a row stay NaN.
+        """
+        lat_arr = numpy.asarray(lat, dtype=float)
+        lon_arr = numpy.asarray(lon, dtype=float)
+        value_arr = numpy.asarray(
+            [numpy.nan if v is None else v for v in value], dtype=float
+        )
+
+        lat_values, lat_idx = RasterOverviews._axis_indices(lat_arr)
+        lon_values, lon_idx = RasterOverviews._axis_indices(lon_arr)
+
+        grid = numpy.full((lat_values.size, lon_values.size), numpy.nan)
+        grid[lat_idx, lon_idx] = value_arr
+        return lat_values, lon_values, grid
+
+    @staticmethod
+    def _pad_to_multiple(array: numpy.ndarray, factor: int) -> numpy.ndarray:
+        pad = [(0, (-size) % factor) for size in array.shape]
+        if not any(after for _, after in pad):
+            return array
+        return numpy.pad(array, pad, mode="constant", constant_values=numpy.nan)
+
+    @staticmethod
+    def block_mean(grid: numpy.ndarray, factor: int) -> numpy.ndarray:
+        """
+        NaN-aware block mean of a 2D grid. Blocks at the edges can be partial,
+        a block without any finite value stays NaN.
+        """
+        if factor == 1:
+            return numpy.asarray(grid, dtype=float)
+
+        padded = RasterOverviews._pad_to_multiple(
+            numpy.asarray(grid, dtype=float), factor
+        )
+        blocks = padded.reshape(
+            padded.shape[0] // factor, factor, padded.shape[1] // factor, factor
+        )
+        finite = numpy.isfinite(blocks)
+        totals = numpy.where(finite, blocks, 0.0).sum(axis=(1, 3))
+        counts = finite.sum(axis=(1, 3))
+
+        result = numpy.full(totals.shape, numpy.nan)
+        numpy.divide(totals, counts, out=result, where=counts > 0)
+        return result
+
+    @staticmethod
+    def coarsen_axis(values: numpy.ndarray, factor: int) -> numpy.ndarray:
+        """Cell centres of the coarsened axis (mean of every block)."""
+        if factor == 1:
+            return numpy.asarray(values, dtype=float)
+        padded = RasterOverviews._pad_to_multiple(
+            numpy.asarray(values, dtype=float), factor
+        )
+        blocks = padded.reshape(-1, factor)
+        counts = numpy.isfinite(blocks).sum(axis=1)
+        return numpy.nansum(blocks, axis=1) / counts
+
+    @staticmethod
+    def select_factor(
+        rows: int,
+        cols: int,
+        max_cells: Optional[int] = None,
+        resolution: Optional[int] = None,
+    ) -> int:
+        """
+        Pick the overview level to serve.
+        - resolution: explicit coarsening factor (takes precedence)
+        - max_cells: the smallest factor whose grid fits within the cell budget
+        """
+        if resolution is not None:
+            if resolution not in OVERVIEW_FACTORS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"resolution must be one of {list(OVERVIEW_FACTORS)}",
+                )
+            return resolution
+
+        if max_cells is None:
+            return 1
+
+        for factor in OVERVIEW_FACTORS:
+            if math.ceil(rows / factor) * math.ceil(cols / factor) <= max_cells:
+                return factor
+        return OVERVIEW_FACTORS[-1]
+
+    @staticmethod
+    def build(
+        lat_values: numpy.ndarray, lon_values: numpy.ndarray, grid: numpy.ndarray
+    ) -> dict[int, tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+        """Build every overview level (besides the native one) for a grid."""
+        overviews = {}
+        for factor in OVERVIEW_FACTORS[1:]:
+            overviews[factor] = (
+                RasterOverviews.coarsen_axis(lat_values, factor),
+                RasterOverviews.coarsen_axis(lon_values, factor),
+                RasterOverviews.block_mean(grid, factor),
+            )
+        return overviews
+
+    @staticmethod
+    def to_payload(
+        lat_values: numpy.ndarray,
+        lon_values: numpy.ndarray,
+        grid: numpy.ndarray,
+        factor: int,
+    ) -> dict[str, Any]:
+        """
+        Same layout as `get_gridbox_data` plus the chosen resolution, without
+        gridbox_id: overview cells aren't gridboxes, they're listed row-major
+        (`rows` x `cols`, north/south as in the native grid).
+        """
+        rows, cols = grid.shape
+        values = grid.reshape(-1)
+        return {
+            "lat": numpy.repeat(lat_values, cols).tolist(),
+            "lon": numpy.tile(lon_values, rows).tolist(),
+            "value": numpy.where(numpy.isfinite(values), values, None).tolist(),
+            "resolution": factor,
+            "rows": rows,
+            "cols": cols,
+        }
+
+    ##############################
+    # On disk store
+    ##############################
+    @staticmethod
+    def overview_path(dataset_id: str, level_id: int, timestamp_id: int) -> Path:
+        return OVERVIEWS_PATH / dataset_id / f"level_{level_id}" / f"{timestamp_id}.npz"
+
+    @staticmethod
+    def save(
+        dataset_id: str,
+        level_id: int,
+        timestamp_id: int,
+        lat_values: numpy.ndarray,
+        lon_values: numpy.ndarray,
+        grid: numpy.ndarray,
+        version: str,
+    ) -> Path:
+        """
+        Write every overview level of a frame. `version` identifies the data
+        they were built from (DatabaseQueries.get_data_version), overviews of
+        another version aren't served.
+        """
+        path = RasterOverviews.overview_path(dataset_id, level_id, timestamp_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        arrays: dict[str, numpy.ndarray] = {
+            "shape": numpy.asarray(grid.shape),
+            "version": numpy.asarray(version),
+        }
+        for factor, (lat, lon, values) in RasterOverviews.build(
+            lat_values, lon_values, grid
+        ).items():
+            arrays[f"lat_{factor}"] = lat
+            arrays[f"lon_{factor}"] = lon
+            arrays[f"value_{factor}"] = values.astype(numpy.float32)
+
+        # Write to a temp file first so readers never see a partial file
+        tmp_path = path.with_suffix(".tmp.npz")
+        numpy.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def _read(
+        dataset_id: str,
+        level_id: int,
+        timestamp_id: int,
+        version: str,
+        select: Callable[[int, int], int],
+    ) -> Optional[tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, int]]:
+        """
+        (lat, lon, grid, factor) of the overview level `select(rows, cols)`
+        picks, in a single read of the file. None when the file doesn't exist,
+        was built from another version of the data or the native grid (factor
+        1) is picked.
+        """
+        path = RasterOverviews.overview_path(dataset_id, level_id, timestamp_id)
+        if not path.exists():
+            return None
+
+        try:
+            with numpy.load(path) as npz:
+                if "version" not in npz or str(npz["version"]) != version:
+                    logger.info(f"Overview {path} is out of date, not serving it")
+                    return None
+                rows, cols = (int(v) for v in npz["shape"])
+                factor = select(rows, cols)
+                if factor == 1:
+                    return None
+                return (
+                    npz[f"lat_{factor}"],
+                    npz[f"lon_{factor}"],
+                    npz[f"value_{factor}"].astype(float),
+                    factor,
+                )
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not read overview {path}: {e}")
+            return None
+
+    @staticmethod
+    def is_current(
+        dataset_id: str, level_id: int, timestamp_id: int, version: str
+    ) -> bool:
+        """Whether the overviews of a frame exist and match `version`"""
+        path = RasterOverviews.overview_path(dataset_id, level_id, timestamp_id)
+        try:
+            with numpy.load(path) as npz:
+                return "version" in npz and str(npz["version"]) == version
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def load_grid(
+        dataset_id: str, level_id: int, timestamp_id: int, factor: int, version: str
+    ) -> Optional[tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+        """
+        Return (lat, lon, grid) of a precomputed overview level, or None when
+        it doesn't exist (or is out of date).
+        """
+        overview = RasterOverviews._read(
+            dataset_id, level_id, timestamp_id, version, lambda rows, cols: factor
+        )
+        if overview is None:
+            return None
+        return overview[:3]
+
+    @staticmethod
+    def load(
+        dataset_id: str,
+        level_id: int,
+        timestamp_id: int,
+        version: str,
+        max_cells: Optional[int] = None,
+        resolution: Optional[int] = None,
+    ) -> Optional[dict[str, Any]]:
+        """
+        Return the payload for a precomputed overview, or None when it doesn't
+        exist, is out of date or the native grid was requested.
+        """
+        overview = RasterOverviews._read(
+            dataset_id,
+            level_id,
+            timestamp_id,
+            version,
+            lambda rows, cols: RasterOverviews.select_factor(
+                rows, cols, max_cells=max_cells, resolution=resolution
+            ),
+        )
+        if overview is None:
+            return None
+        return RasterOverviews.to_payload(*overview)
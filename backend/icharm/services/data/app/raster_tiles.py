@@ -0,0 +1,325 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+import numpy
+from fastapi import HTTPException
+
+import logging
+
+from icharm.services.data.app.env_helpers import EnvHelpers
+from icharm.services.data.app.raster_overviews import OVERVIEW_FACTORS
+
+logger = logging.getLogger(__name__)
+
+# Pixels along each side of a tile
+TILE_SIZE = int(os.getenv("TILE_SIZE", "256"))
+
+# Deepest zoom level we cut tiles for
+MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "10"))
+
+# In-memory tile cache budget
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Number of decoded frames (whole grids) kept around for cutting tiles
+TILE_FRAME_CACHE_SIZE = int(os.getenv("TILE_FRAME_CACHE_SIZE", "8"))
+
+# Set TILE_CACHE_PATH to an empty string to disable the on-disk tile cache
+TILE_CACHE_PATH: Optional[Path] = (
+    EnvHelpers.resolve_env_path(os.getenv("TILE_CACHE_PATH"), "datasets/tiles")
+    if os.getenv("TILE_CACHE_PATH", "datasets/tiles")
+    else None
+)
+
+# Cache-Control max-age for tiles, tiles of a timestamp don't change unless
+# the dataset is re-ingested
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "86400"))
+
+# Part of every tile ETag, bump it when the tile encoding changes so clients
+# don't keep tiles of the old encoding
+TILE_FORMAT_VERSION = 1
+
+# One entity tag of an If-None-Match list: "*" or an optionally weak quoted tag
+ENTITY_TAG_PATTERN = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+# ============================================================================
+# TILING
+# ============================================================================
+
+
+class RasterTiles:
+    """
+    Value tiles cut from a (lat, lon) grid.
+
+    Tiles use the geodetic (EPSG:4326) scheme: zoom 0 is two tiles covering
+    the western and eastern hemispheres, every zoom level doubles the number
+    of tiles along each axis. Row y=0 is the northernmost row.
+    """
+
+    @staticmethod
+    def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+        """(west, south, east, north) of a tile in degrees"""
+        if not 0 <= z <= MAX_ZOOM:
+            raise HTTPException(
+                status_code=400, detail=f"z must be between 0 and {MAX_ZOOM}"
+            )
+        tiles_y = 2**z
+        tiles_x = 2 * tiles_y
+        if not (0 <= x < tiles_x and 0 <= y < tiles_y):
+            raise HTTPException(
+                status_code=400, detail=f"Tile {z}/{x}/{y} is out of range"
+            )
+
+        span = 180.0 / tiles_y
+        west = -180.0 + x * span
+        north = 90.0 - y * span
+        return west, north - span, west + span, north
+
+    @staticmethod
+    def axis_spacing(values: numpy.ndarray) -> float:
+        if values.size < 2:
+            return 0.0
+        return float(numpy.median(numpy.abs(numpy.diff(numpy.sort(values)))))
+
+    @staticmethod
+    def select_factor(lat_values: numpy.ndarray, z: int) -> int:
+        """
+        Coarsest overview whose cells are still no larger than a tile pixel at
+        this zoom level.
+        """
+        native = RasterTiles.axis_spacing(lat_values)
+        pixel = 180.0 / (2**z * TILE_SIZE)
+        factor = 1
+        for candidate in OVERVIEW_FACTORS:
+            if native > 0 and candidate * native <= pixel:
+                factor = candidate
+        return factor
+
+    @staticmethod
+    def _nearest(
+        axis: numpy.ndarray, targets: numpy.ndarray
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Index of the nearest axis value for every target and whether that
+        value is within half a cell of the target.
+        """
+        order = numpy.argsort(axis)
+        sorted_axis = axis[order]
+        pos = numpy.clip(numpy.searchsorted(sorted_axis, targets), 1, axis.size - 1)
+        left = sorted_axis[pos - 1]
+        right = sorted_axis[pos]
+        pos = numpy.where(targets - left <= right - targets, pos - 1, pos)
+
+        half_cell = RasterTiles.axis_spacing(axis) / 2.0
+        inside = numpy.abs(sorted_axis[pos] - targets) <= half_cell * 1.0001
+        return order[pos], inside
+
+    @staticmethod
+    def cut(
+        lat_values: numpy.ndarray,
+        lon_values: numpy.ndarray,
+        grid: numpy.ndarray,
+        z: int,
+        x: int,
+        y: int,
+    ) -> numpy.ndarray:
+        """
+        Sample a TILE_SIZE x TILE_SIZE tile (nearest neighbour at the pixel
+        centres, north row first). Pixels outside the grid are NaN.
+        """
+        west, south, _east, north = RasterTiles.tile_bounds(z, x, y)
+        step = (north - south) / TILE_SIZE
+        pixel_lat = north - (numpy.arange(TILE_SIZE) + 0.5) * step
+        pixel_lon = west + (numpy.arange(TILE_SIZE) + 0.5) * step
+
+        tile = numpy.full((TILE_SIZE, TILE_SIZE), numpy.nan, dtype=numpy.float32)
+        if lat_values.size < 2 or lon_values.size < 2:
+            return tile
+
+        # Match the longitude convention of the grid (-180..180 or 0..360)
+        if lon_values.min() >= 0:
+            pixel_lon = numpy.mod(pixel_lon, 360.0)
+
+        lat_idx, lat_inside = RasterTiles._nearest(lat_values, pixel_lat)
+        lon_idx, lon_inside = RasterTiles._nearest(lon_values, pixel_lon)
+        if not lat_inside.any() or not lon_inside.any():
+            return tile
+
+        rows = numpy.flatnonzero(lat_inside)
+        cols = numpy.flatnonzero(lon_inside)
+        tile[numpy.ix_(rows, cols)] = grid[numpy.ix_(lat_idx[rows], lon_idx[cols])]
+        return tile
+
+    @staticmethod
+    def etag(*key: Any) -> str:
+        """
+        ETag of a tile from everything it's rendered from (dataset version,
+        address, encoding, value range), so it's known before rendering
+        """
+        text = "|".join(str(part) for part in (TILE_FORMAT_VERSION,) + key)
+        return '"' + hashlib.sha1(text.encode()).hexdigest() + '"'
+
+    @staticmethod
+    def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+        """
+        Whether an If-None-Match header matches etag: "*" or any tag of its
+        comma separated list, compared weakly (W/ prefixes are ignored)
+        """
+        if not if_none_match:
+            return False
+        for tag in ENTITY_TAG_PATTERN.findall(if_none_match):
+            if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+                return True
+        return False
+
+
+# ============================================================================
+# CACHING
+# ============================================================================
+
+
+class TileCache:
+    """
+    LRU cache for encoded tiles bounded by a byte budget, backed by an
+    optional on-disk cache that survives restarts. Also keeps the last few
+    frames tiles are cut from, since a client pans over many tiles of the
+    same frame.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = TILE_CACHE_MAX_BYTES,
+        path: Optional[Path] = TILE_CACHE_PATH,
+        frame_cache_size: int = TILE_FRAME_CACHE_SIZE,
+    ):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.frame_cache_size = frame_cache_size
+        self.tiles: OrderedDict[tuple, tuple[bytes, dict[str, str]]] = OrderedDict()
+        self.frames: OrderedDict[tuple, Any] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def _disk_path(self, key: tuple) -> Optional[Path]:
+        if self.path is None:
+            return None
+        *prefix, z, x, y = (str(part) for part in key)
+        return self.path.joinpath(*prefix, z, x, f"{y}.bin")
+
+    def get(self, key: tuple) -> Optional[tuple[bytes, dict[str, str]]]:
+        with self._lock:
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return self.tiles[key]
+
+        tile = self._read_disk(key)
+        with self._lock:
+            if tile is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, tile)
+        return tile
+
+    def set(self, key: tuple, body: bytes, headers: dict[str, str]):
+        tile = (body, headers)
+        self._remember(key, tile)
+        self._write_disk(key, tile)
+
+    def _remember(self, key: tuple, tile: tuple[bytes, dict[str, str]]):
+        size = len(tile[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.tiles:
+                self.size_bytes -= len(self.tiles.pop(key)[0])
+            self.tiles[key] = tile
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (old_body, _) = self.tiles.popitem(last=False)
+                self.size_bytes -= len(old_body)
+
+    def _read_disk(self, key: tuple) -> Optional[tuple[bytes, dict[str, str]]]:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            headers = json.loads(path.with_suffix(".json").read_text())
+            return path.read_bytes(), headers
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read cached tile {path}: {e}")
+            return None
+
+    def _write_disk(self, key: tuple, tile: tuple[bytes, dict[str, str]]):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        body, headers = tile
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Headers first, the tile only counts as cached once the body exists
+            for target, content in (
+                (path.with_suffix(".json"), json.dumps(headers).encode()),
+                (path, body),
+            ):
+                tmp_path = target.with_name(target.name + ".tmp")
+                tmp_path.write_bytes(content)
+                os.replace(tmp_path, target)
+        except OSError as e:
+            logger.warning(f"Could not write cached tile {path}: {e}")
+
+    def get_frame(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                return self.frames[key]
+        return None
+
+    def set_frame(self, key: tuple, frame: Any):
+        with self._lock:
+            self.frames[key] = frame
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.frame_cache_size:
+                self.frames.popitem(last=False)
+
+    def clear(self):
+        """Clear the in-memory caches and the tiles on disk"""
+        with self._lock:
+            self.tiles.clear()
+            self.frames.clear()
+            self.size_bytes = 0
+        if self.path is None or not self.path.exists():
+            return
+        for child in self.path.iterdir():
+            try:
+                if child.is_dir():
+                    shutil.rmtree(child)
+                else:
+                    child.unlink()
+            except OSError as e:
+                logger.warning(f"Could not remove cached tiles {child}: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "tiles": len(self.tiles),
+            "bytes": self.size_bytes,
+            "frames": len(self.frames),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / requests if requests else None,
+        }
+
+
+# Global cache instance
+tile_cache = TileCache()
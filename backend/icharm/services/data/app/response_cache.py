@@ -0,0 +1,166 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+import orjson
+
+import logging
+
+from icharm.services.data.app.env_helpers import EnvHelpers
+
+logger = logging.getLogger(__name__)
+
+# In-memory budget for cached responses
+TIMESERIES_CACHE_MAX_BYTES = int(
+    os.getenv("TIMESERIES_CACHE_MAX_BYTES", str(128 * 1024 * 1024))
+)
+
+# Seconds a cached response stays valid
+TIMESERIES_CACHE_TTL = int(os.getenv("TIMESERIES_CACHE_TTL", "3600"))
+
+# Optional on-disk cache, disabled unless TIMESERIES_CACHE_PATH is set
+TIMESERIES_CACHE_PATH: Optional[Path] = (
+    EnvHelpers.resolve_env_path(os.getenv("TIMESERIES_CACHE_PATH"), "")
+    if os.getenv("TIMESERIES_CACHE_PATH")
+    else None
+)
+
+# spatialBounds in cache keys are rounded to ~10m
+COORDINATE_DECIMALS = 4
+
+
+# ============================================================================
+# KEY NORMALIZATION
+# ============================================================================
+
+
+def fingerprint(parts: dict[str, Any]) -> str:
+    """Stable hash of the normalized request"""
+    payload = orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+# ============================================================================
+# CACHING
+# ============================================================================
+
+
+class ResponseCache:
+    """
+    Cache of serialized responses keyed by a request fingerprint. Entries are
+    kept in an LRU bounded by a byte budget, expire after a TTL and are
+    optionally mirrored to disk so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = TIMESERIES_CACHE_MAX_BYTES,
+        ttl: int = TIMESERIES_CACHE_TTL,
+        path: Optional[Path] = TIMESERIES_CACHE_PATH,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        if self.path is None:
+            return None
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                body, expires_at = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return body
+                self._evict(key)
+
+        body = self._read_disk(key, now)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        self._remember(key, body, now + self.ttl)
+        return body
+
+    def set(self, key: str, body: bytes):
+        expires_at = time.time() + self.ttl
+        self._remember(key, body, expires_at)
+        self._write_disk(key, body)
+
+    def _remember(self, key: str, body: bytes, expires_at: float):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._evict(key)
+            self.entries[key] = (body, expires_at)
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes:
+                self._evict(next(iter(self.entries)))
+
+    def _evict(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[0])
+
+    def _read_disk(self, key: str, now: float) -> Optional[bytes]:
+        path = self._disk_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            if path.stat().st_mtime + self.ttl <= now:
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_bytes()
+        except OSError as e:
+            logger.warning(f"Could not read cached response {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, body: bytes):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_bytes(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cached response {path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size_bytes = 0
+        if self.path is not None and self.path.exists():
+            for path in self.path.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / requests if requests else None,
+        }
+
+
+# Global cache instance for /timeseries/extract
+timeseries_cache = ResponseCache()
@@ -0,0 +1,134 @@
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from icharm.dataset_processing.downloaders.parallel_downloader import (
+    DownloadError,
+    ParallelDownloader,
+)
+
+FILES = {f"/data/file_{i}.nc": bytes(range(256)) * (1000 + i) for i in range(3)}
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    """Static files with Range support, the first GET of a /flaky/ URL is cut short"""
+
+    requests_seen: list[tuple[str, str | None]] = []
+    flaky_served: set[str] = set()
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("Range")))
+        body = FILES.get(self.path.replace("/flaky/", "/data/"))
+        if body is None:
+            self.send_error(404)
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header is not None:
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        payload = body[start:]
+        if self.path.startswith("/flaky/") and self.path not in self.flaky_served:
+            self.flaky_served.add(self.path)
+            payload = payload[: len(payload) // 2]
+            self.close_connection = True
+        self.wfile.write(payload)
+        return
+
+    def log_message(self, format, *args):
+        return
+
+
+class TestParallelDownloader(unittest.TestCase):
+    def setUp(self):
+        _RangeHandler.requests_seen = []
+        _RangeHandler.flaky_served = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dest = Path(self.tmp_dir.name)
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+        return
+
+    def _downloader(self, **kwargs) -> ParallelDownloader:
+        return ParallelDownloader(
+            self.dest, workers=4, per_host=2, backoff_seconds=0, quiet=True, **kwargs
+        )
+
+    def test_download_and_skip_completed(self):
+        urls = [self.base_url + path for path in FILES]
+        results = self._downloader().download(urls)
+        for path, result in zip(FILES, results):
+            assert result.path.read_bytes() == FILES[path]
+            assert not result.skipped
+
+        # Rerun: everything is in the manifest
+        _RangeHandler.requests_seen = []
+        results = self._downloader().download(urls)
+        assert all(result.skipped for result in results)
+        assert _RangeHandler.requests_seen == []
+        return
+
+    def test_resume_partial_and_retry(self):
+        # A partial file from an earlier (wget) run is resumed with a range
+        body = FILES["/data/file_0.nc"]
+        (self.dest / "file_0.nc").write_bytes(body[:1000])
+        url = f"{self.base_url}/data/file_0.nc"
+        (result,) = self._downloader().download([url])
+        assert result.path.read_bytes() == body
+        assert _RangeHandler.requests_seen == [("/data/file_0.nc", "bytes=1000-")]
+
+        # A connection cut short is retried from where it stopped
+        (result,) = self._downloader().download([f"{self.base_url}/flaky/file_1.nc"])
+        assert result.path.read_bytes() == FILES["/data/file_1.nc"]
+        first_range, retry_range = [r for _, r in _RangeHandler.requests_seen[1:]]
+        assert first_range is None
+        assert int(retry_range.removeprefix("bytes=").rstrip("-")) > 0
+        return
+
+    def test_iter_download_order_and_backpressure(self):
+        urls = [self.base_url + path for path in FILES]
+        results = self._downloader().iter_download(urls, max_pending=1)
+        first = next(results)
+        assert first.url == urls[0]
+        # Nothing downloads ahead of the consumer past max_pending
+        assert [path for path, _ in _RangeHandler.requests_seen] == ["/data/file_0.nc"]
+
+        assert [result.url for result in results] == urls[1:]
+        assert not (self.dest / "file_0.nc.part").exists()
+        return
+
+    def test_checksum_mismatch(self):
+        url = f"{self.base_url}/data/file_2.nc"
+        downloader = self._downloader(retries=1, checksums={url: "0" * 64})
+        with self.assertRaises(DownloadError):
+            downloader.download([url])
+        assert not (self.dest / "file_2.nc").exists()
+
+        sha256 = hashlib.sha256(FILES["/data/file_2.nc"]).hexdigest()
+        (result,) = self._downloader(checksums={url: sha256}).download([url])
+        assert result.sha256 == sha256
+        return
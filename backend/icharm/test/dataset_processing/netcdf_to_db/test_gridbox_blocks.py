@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy
+from netCDF4 import Dataset
+
+from icharm.dataset_processing.netcdf_to_db.netcdf_to_db_simple import (
+    NetCDFtoDbSimple,
+)
+
+
+def _write_file(path: Path) -> None:
+    with Dataset(path, "w") as nc:
+        nc.createDimension("time", 2)
+        nc.createDimension("lat", 2)
+        nc.createDimension("lon", 3)
+        time_variable = nc.createVariable("time", "f8", ("time",))
+        time_variable.units = "days since 2000-01-01"
+        time_variable[:] = [0, 1]
+        nc.createVariable("lat", "f4", ("lat",))[:] = [-45.0, 45.0]
+        nc.createVariable("lon", "f4", ("lon",))[:] = [0.0, 120.0, 240.0]
+
+        # No fill attributes, the second time step is never written so it
+        # holds netCDF4's default fill value
+        air = nc.createVariable("air", "f4", ("time", "lat", "lon"))
+        air[0] = numpy.arange(6, dtype=numpy.float32).reshape(2, 3)
+
+        # Packed, one real value unpacks to the raw fill value
+        packed = nc.createVariable(
+            "packed", "i2", ("time", "lat", "lon"), fill_value=-32767
+        )
+        packed.scale_factor = 1.0
+        packed.add_offset = -1.0
+        packed.set_auto_maskandscale(False)
+        packed[:] = numpy.array(
+            [[[-32766, 1, 2], [3, -32767, 5]], [[0, 0, 0], [0, 0, 0]]],
+            dtype=numpy.int16,
+        )
+    return
+
+
+class TestGridboxBlocks(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        _write_file(Path(self.tmp_dir.name) / "data.nc")
+        return
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        return
+
+    def _read(self, variable_name: str, time_idx: int) -> numpy.ndarray:
+        processor = NetCDFtoDbSimple(
+            self.tmp_dir.name,
+            time_variable_name="time",
+            latitude_variable_name="lat",
+            longitude_variable_name="lon",
+            variable_of_interest_name=variable_name,
+        )
+        with Dataset(Path(self.tmp_dir.name) / "data.nc", "r") as nc:
+            sources = [(nc[variable_name], time_idx)]
+            blocks = [
+                values.copy()
+                for _, values in processor._iter_gridbox_blocks(sources, 1)
+            ]
+        return numpy.concatenate(blocks)[:, 0]
+
+    def test_default_fill_value_is_masked(self):
+        numpy.testing.assert_array_equal(self._read("air", 0), numpy.arange(6))
+        assert numpy.isnan(self._read("air", 1)).all()
+        return
+
+    def test_unpacked_value_equal_to_raw_fill_is_kept(self):
+        values = self._read("packed", 0)
+        numpy.testing.assert_array_equal(
+            values, [-32767.0, 0.0, 1.0, 2.0, numpy.nan, 4.0]
+        )
+        return
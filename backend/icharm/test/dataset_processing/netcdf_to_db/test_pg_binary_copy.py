@@ -0,0 +1,41 @@
+import struct
+import unittest
+
+import numpy
+
+from icharm.dataset_processing.netcdf_to_db.pg_binary_copy import (
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    BinaryCopyStream,
+    PgBinaryCopy,
+)
+
+
+class TestPgBinaryCopy(unittest.TestCase):
+    def test_encode_rows_layout(self):
+        body = PgBinaryCopy.encode_rows(
+            [numpy.array([1, 2]), 7, numpy.array([1.5, numpy.nan])],
+            ["int4", "int4", "float4"],
+        )
+        expected = struct.pack(">hiiiiif", 3, 4, 1, 4, 7, 4, 1.5)
+        # NaN is written as NULL: length -1 and no value bytes
+        expected += struct.pack(">hiiiii", 3, 4, 2, 4, 7, -1)
+        assert body == expected
+        return
+
+    def test_stream_chunks(self):
+        values = numpy.arange(10, dtype=numpy.float32)
+        chunks = PgBinaryCopy.iter_chunks(
+            [numpy.arange(10), 0, values], ["int4", "int4", "float4"], chunk_rows=3
+        )
+        stream = BinaryCopyStream(chunks)
+        payload = b""
+        while data := stream.read(7):
+            assert len(data) <= 7
+            payload += data
+
+        assert payload.startswith(PGCOPY_HEADER)
+        assert payload.endswith(PGCOPY_TRAILER)
+        row_size = 2 + 3 * 8
+        assert len(payload) == len(PGCOPY_HEADER) + 10 * row_size + 2
+        return
@@ -0,0 +1,80 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from icharm.dataset_processing.dataset_scheduler import (
+    DatasetJob,
+    DatasetScheduler,
+    ResourceSlots,
+    SchedulerError,
+)
+
+
+def _record_job(details: dict, slots: ResourceSlots, log_path: Path) -> None:
+    """Appends "start <name>" / "end <name>" while holding the db slot"""
+    with slots.db:
+        with open(log_path, "a") as f:
+            f.write(f"start {details['name']}\n")
+        time.sleep(0.2)
+        if details.get("fail"):
+            raise RuntimeError("failed on purpose")
+        with open(log_path, "a") as f:
+            f.write(f"end {details['name']}\n")
+    return
+
+
+def _job(name: str, after: list[str] | None = None, **details) -> DatasetJob:
+    return DatasetJob(name=name, details={"name": name, **details}, after=after or [])
+
+
+class TestDatasetScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_path = Path(self.tmp_dir.name) / "log.txt"
+        return
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        return
+
+    def test_check_jobs(self):
+        with self.assertRaises(ValueError):
+            DatasetScheduler.check_jobs([_job("a", ["missing"])])
+        with self.assertRaises(ValueError):
+            DatasetScheduler.check_jobs([_job("a", ["b"]), _job("b", ["a"])])
+        with self.assertRaises(ValueError):
+            DatasetScheduler.check_jobs([_job("a"), _job("a")])
+        DatasetScheduler.check_jobs([_job("a"), _job("b", ["a"])])
+        return
+
+    def test_resolve_after(self):
+        jobs = [_job("a"), _job("b", ["Dataset A", "cloud", "a"]), _job("c", ["typo"])]
+        DatasetScheduler.resolve_after(jobs, {"Dataset A": "a"}, {"cloud"})
+        assert jobs[1].after == ["a"]
+        with self.assertRaises(ValueError):
+            DatasetScheduler.check_jobs(jobs)
+        return
+
+    def test_dependencies_slots_and_failures(self):
+        jobs = [
+            _job("b", ["a"]),
+            _job("a"),
+            _job("c"),
+            _job("broken", fail=True),
+            _job("after_broken", ["broken"]),
+        ]
+        scheduler = DatasetScheduler(network_slots=1, cpu_workers=1, db_connections=1)
+        with self.assertRaises(SchedulerError) as context:
+            scheduler.run(jobs, _record_job, self.log_path)
+        assert "['broken']" in str(context.exception)
+        assert "['after_broken']" in str(context.exception)
+
+        lines = self.log_path.read_text().splitlines()
+        # One db connection: every job ends before the next one starts
+        events = [line.split() for line in lines if line != "start broken"]
+        assert [kind for kind, _ in events] == ["start", "end"] * 3
+        names = [name for _, name in events]
+        assert names.index("b") > names.index("a")
+        assert "after_broken" not in names
+        return
@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy
+from netCDF4 import Dataset
+
+from icharm.dataset_processing.netcdf_catalogue import NetCDFCatalogue
+
+
+def _write_file(path: Path, first_day: int, n_days: int) -> None:
+    with Dataset(path, "w") as nc:
+        nc.createDimension("time", n_days)
+        nc.createDimension("lat", 2)
+        nc.createDimension("lon", 3)
+        time_variable = nc.createVariable("time", "f8", ("time",))
+        time_variable.units = "days since 2000-01-01"
+        time_variable[:] = numpy.arange(first_day, first_day + n_days)
+        nc.createVariable("lat", "f4", ("lat",))[:] = [-45.0, 45.0]
+        nc.createVariable("lon", "f4", ("lon",))[:] = [0.0, 120.0, 240.0]
+    return
+
+
+class TestNetCDFCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder_path = Path(self.tmp_dir.name)
+        _write_file(self.folder_path / "a.nc", first_day=0, n_days=3)
+        _write_file(self.folder_path / "b.nc", first_day=3, n_days=2)
+        return
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        return
+
+    def _catalogue(self) -> NetCDFCatalogue:
+        return NetCDFCatalogue(self.folder_path, "time", "lat", "lon")
+
+    def test_lookup_range(self):
+        catalogue = self._catalogue()
+        assert catalogue.update() == 2
+        assert len(catalogue.grid_hashes()) == 1
+
+        found = catalogue.lookup(datetime(2000, 1, 2), datetime(2000, 1, 4))
+        assert found == [
+            (self.folder_path / "a.nc", 1),
+            (self.folder_path / "a.nc", 2),
+            (self.folder_path / "b.nc", 0),
+        ]
+        assert catalogue.lookup(datetime(2001, 1, 1), datetime(2001, 2, 1)) == []
+        return
+
+    def test_files_by_month_day(self):
+        catalogue = self._catalogue()
+        catalogue.update()
+        month_day_files = catalogue.files_by_month_day()
+        assert sorted(month_day_files) == ["0101", "0102", "0103", "0104", "0105"]
+        assert month_day_files["0103"] == {"2000": self.folder_path / "a.nc"}
+        assert month_day_files["0104"] == {"2000": self.folder_path / "b.nc"}
+        return
+
+    def test_incremental_update(self):
+        assert self._catalogue().update() == 2
+
+        # Reopened: only the rewritten file is decoded again
+        (self.folder_path / "b.nc").unlink()
+        _write_file(self.folder_path / "b.nc", first_day=10, n_days=4)
+        catalogue = self._catalogue()
+        assert catalogue.update() == 1
+        found = catalogue.lookup(datetime(2000, 1, 1), datetime(2000, 12, 31))
+        assert [index for _, index in found] == [0, 1, 2, 0, 1, 2, 3]
+
+        (self.folder_path / "a.nc").unlink()
+        assert catalogue.update() == 0
+        assert len(catalogue.lookup(datetime(2000, 1, 1), datetime(2000, 1, 5))) == 0
+        return
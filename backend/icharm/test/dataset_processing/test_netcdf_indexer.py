@@ -0,0 +1,93 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy
+from netCDF4 import Dataset
+
+from icharm.dataset_processing.netcdf_indexer import NetCDFIndexer
+
+
+def _values(days: numpy.ndarray) -> numpy.ndarray:
+    """value = day * 100 + lat_idx * 10 + lon_idx, so every cell is recognizable"""
+    return (
+        days[:, None, None] * 100.0
+        + numpy.arange(2)[None, :, None] * 10.0
+        + numpy.arange(3)[None, None, :]
+    )
+
+
+def _write_file(
+    path: Path,
+    first_day: int,
+    n_days: int,
+    masked: tuple[int, int, int] | None = None,
+) -> None:
+    days = numpy.arange(first_day, first_day + n_days)
+    values = numpy.ma.masked_array(_values(days), mask=False)
+    if masked is not None:
+        values[masked] = numpy.ma.masked
+    with Dataset(path, "w") as nc:
+        nc.createDimension("time", n_days)
+        nc.createDimension("lat", 2)
+        nc.createDimension("lon", 3)
+        time_variable = nc.createVariable("time", "f8", ("time",))
+        time_variable.units = "days since 2000-01-01"
+        time_variable[:] = days
+        nc.createVariable("lat", "f4", ("lat",))[:] = [-45.0, 45.0]
+        nc.createVariable("lon", "f4", ("lon",))[:] = [0.0, 120.0, 240.0]
+        variable = nc.createVariable(
+            "air", "f4", ("time", "lat", "lon"), fill_value=-999.0
+        )
+        variable[:] = values
+    return
+
+
+class TestNetCDFIndexer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder_path = Path(self.tmp_dir.name)
+        # File name order is the opposite of time order
+        _write_file(self.folder_path / "a.nc", first_day=3, n_days=3, masked=(1, 1, 2))
+        _write_file(self.folder_path / "b.nc", first_day=0, n_days=3)
+        return
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        return
+
+    def _indexer(self, workers: int) -> NetCDFIndexer:
+        indexer = NetCDFIndexer(self.folder_path, workers=workers)
+        indexer.create_index()
+        return indexer
+
+    def test_get_points_data(self):
+        points = [(0, 1), (1, 2), (0, 0)]
+        lower, upper = datetime(2000, 1, 2), datetime(2000, 1, 5)
+        expected = numpy.stack(
+            [_values(numpy.arange(1, 5))[:, lat, lon] for lat, lon in points], axis=1
+        )
+        # Day 4 is a.nc index 1, masked at lat 1 / lon 2
+        expected[3, 1] = numpy.nan
+
+        for workers in (1, 2):
+            indexer = self._indexer(workers)
+            values = indexer.get_points_data(points, lower, upper)
+            assert values.shape == (4, len(points))
+            numpy.testing.assert_array_equal(values, expected)
+
+            for point_idx, (lat_idx, lon_idx) in enumerate(points):
+                single = indexer.get_grid_data(lat_idx, lon_idx, lower, upper)
+                numpy.testing.assert_array_equal(
+                    numpy.asarray(single)[:, 0], values[:, point_idx]
+                )
+        return
+
+    def test_empty_range(self):
+        indexer = self._indexer(1)
+        values = indexer.get_points_data(
+            [(0, 0)], datetime(2001, 1, 1), datetime(2001, 2, 1)
+        )
+        assert values.shape == (0, 1)
+        return
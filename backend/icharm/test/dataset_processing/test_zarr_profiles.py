@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy
+import xarray as xr
+import zarr
+
+from icharm.dataset_processing.zarr_profiles import ZarrConverter, ZarrProfile
+
+
+def _dataset() -> xr.Dataset:
+    values = numpy.arange(40 * 2 * 12 * 24, dtype="float32").reshape(40, 2, 12, 24)
+    return xr.Dataset(
+        {
+            "air": (("time", "level", "lat", "lon"), values),
+            "time_bnds": (("time", "nbnds"), numpy.zeros((40, 2))),
+        },
+        coords={
+            "time": numpy.arange(40),
+            "level": [1000.0, 500.0],
+            "lat": numpy.linspace(-55, 55, 12),
+            "lon": numpy.linspace(0, 345, 24),
+        },
+    )
+
+
+class TestZarrProfiles(unittest.TestCase):
+    def test_chunk_shape(self):
+        air = _dataset()["air"]
+        # A frame is 1152 bytes
+        assert ZarrConverter.chunk_shape(air, "frames", 1) == (1, 1, 12, 24)
+        assert ZarrConverter.chunk_shape(air, "frames", 300 / 2**20) == (
+            1,
+            1,
+            6,
+            12,
+        )
+        # A point series is 160 bytes
+        assert ZarrConverter.chunk_shape(air, "series", 1600 / 2**20) == (
+            40,
+            1,
+            3,
+            3,
+        )
+        assert ZarrConverter.chunk_shape(air, "balanced", 1600 / 2**20) == (
+            8,
+            1,
+            7,
+            7,
+        )
+        assert ZarrConverter.chunk_shape(_dataset()["time_bnds"], "series", 1) is None
+        return
+
+    def test_write_dual(self):
+        ds = _dataset()
+        profile = ZarrProfile(name="dual", compressor="zstd", chunk_mb=1600 / 2**20)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "air.zarr"
+            paths = ZarrConverter(profile, workers=2, dask_chunk_mb=0.01).write(
+                ds, path
+            )
+            assert paths == {
+                "frames": path,
+                "series": Path(tmp_dir) / "air.series.zarr",
+            }
+
+            for layout, store_path in paths.items():
+                air = zarr.open_group(store_path, mode="r")["air"]
+                assert air.chunks == ZarrConverter.chunk_shape(
+                    ds["air"], layout, profile.chunk_mb
+                )
+                assert type(air.compressors[0]).__name__ == "ZstdCodec"
+                with xr.open_zarr(store_path, consolidated=True) as written:
+                    xr.testing.assert_identical(written.load(), ds)
+
+            timings = ZarrConverter.benchmark(paths, "air", reads=2)
+            assert set(timings) == {"frames", "series"}
+
+            # Only the missing series store is rewritten
+            converter = ZarrConverter(profile, dask_chunk_mb=0.01)
+            frames_mtime = (path / "zarr.json").stat().st_mtime_ns
+            assert converter.write(ds, path, layouts=("series",)) == {
+                "series": paths["series"]
+            }
+            assert (path / "zarr.json").stat().st_mtime_ns == frames_mtime
+        return
@@ -0,0 +1,36 @@
+import gzip
+import unittest
+
+import numpy
+
+from icharm.services.data.app.raster_encoding import NODATA_UINT8, RasterEncoding
+
+
+class TestRasterEncoding(unittest.TestCase):
+    def test_uint8_uses_value_range(self):
+        values = numpy.array([-10.0, 0.0, numpy.nan, 5.0, 10.0])
+        body, headers = RasterEncoding.encode(
+            values, "uint8", value_min=-5.0, value_max=5.0
+        )
+        raw = numpy.frombuffer(body, dtype=numpy.uint8)
+        assert len(body) == values.size
+        assert raw[2] == NODATA_UINT8
+        # Values outside of the metadata range are clipped
+        assert raw[0] == 0
+        assert raw[-1] == NODATA_UINT8 - 1
+        assert float(headers["X-Offset"]) == -5.0
+
+        decoded = RasterEncoding.decode(body, headers)
+        assert abs(decoded[1]) < float(headers["X-Scale"])
+        return
+
+    def test_compress_negotiation(self):
+        body = numpy.zeros(4096, dtype=numpy.uint16).tobytes()
+        compressed, content_encoding = RasterEncoding.compress(body, "gzip, deflate")
+        assert content_encoding == "gzip"
+        assert gzip.decompress(compressed) == body
+
+        assert RasterEncoding.compress(body, None) == (body, None)
+        assert RasterEncoding.compress(body, "gzip;q=0") == (body, None)
+        assert RasterEncoding.compress(b"small", "gzip") == (b"small", None)
+        return
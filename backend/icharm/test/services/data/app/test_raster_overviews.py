@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy
+
+from icharm.services.data.app import raster_overviews
+from icharm.services.data.app.raster_overviews import RasterOverviews
+
+
+class TestRasterOverviews(unittest.TestCase):
+    def test_block_mean_ignores_nan(self):
+        grid = numpy.array(
+            [
+                [1.0, 3.0, numpy.nan],
+                [numpy.nan, 5.0, numpy.nan],
+                [2.0, 2.0, 7.0],
+            ]
+        )
+        result = RasterOverviews.block_mean(grid, 2)
+        assert result.shape == (2, 2)
+        assert result[0, 0] == 3.0
+        assert numpy.isnan(result[0, 1])
+        assert result[1, 0] == 2.0
+        assert result[1, 1] == 7.0
+        return
+
+    def test_select_factor(self):
+        assert RasterOverviews.select_factor(720, 1440) == 1
+        assert RasterOverviews.select_factor(720, 1440, max_cells=720 * 1440) == 1
+        assert RasterOverviews.select_factor(720, 1440, max_cells=100_000) == 4
+        assert RasterOverviews.select_factor(720, 1440, max_cells=10) == 8
+        assert RasterOverviews.select_factor(720, 1440, resolution=2) == 2
+        return
+
+    def test_grid_round_trip(self):
+        lat = [10.0, 10.0, 0.0, 0.0]
+        lon = [0.0, 5.0, 0.0, 5.0]
+        value = [1.0, None, 3.0, 4.0]
+        lat_values, lon_values, grid = RasterOverviews.grid_from_points(lat, lon, value)
+        assert lat_values.tolist() == [10.0, 0.0]
+        assert lon_values.tolist() == [0.0, 5.0]
+
+        payload = RasterOverviews.to_payload(lat_values, lon_values, grid, 1)
+        assert payload["lat"] == lat
+        assert payload["lon"] == lon
+        assert payload["value"] == value
+        assert "gridbox_id" not in payload
+        return
+
+    def test_saved_overviews_are_versioned(self):
+        lat_values = numpy.arange(-87.5, 90.0, 5.0)
+        lon_values = numpy.arange(2.5, 360.0, 5.0)
+        grid = numpy.add.outer(lat_values, lon_values)
+
+        original_path = raster_overviews.OVERVIEWS_PATH
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raster_overviews.OVERVIEWS_PATH = Path(tmp_dir)
+            try:
+                RasterOverviews.save("d", 1, 7, lat_values, lon_values, grid, "v1")
+                assert RasterOverviews.is_current("d", 1, 7, "v1")
+
+                payload = RasterOverviews.load("d", 1, 7, "v1", resolution=2)
+                assert (payload["rows"], payload["cols"]) == (18, 36)
+                assert payload["value"][0] == numpy.float32(grid[:2, :2].mean())
+                overview = RasterOverviews.load_grid("d", 1, 7, 4, "v1")
+                assert overview[2].shape == (9, 18)
+
+                # Data of another ingest isn't served
+                assert not RasterOverviews.is_current("d", 1, 7, "v2")
+                assert RasterOverviews.load("d", 1, 7, "v2", resolution=2) is None
+                assert RasterOverviews.load_grid("d", 1, 7, 4, "v2") is None
+                assert RasterOverviews.load("d", 1, 8, "v1", resolution=2) is None
+            finally:
+                raster_overviews.OVERVIEWS_PATH = original_path
+        return
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy
+
+from icharm.services.data.app.raster_encoding import RasterEncoding
+from icharm.services.data.app.raster_tiles import TILE_SIZE, RasterTiles, TileCache
+
+
+class TestRasterTiles(unittest.TestCase):
+    def test_tile_bounds(self):
+        assert RasterTiles.tile_bounds(0, 0, 0) == (-180.0, -90.0, 0.0, 90.0)
+        assert RasterTiles.tile_bounds(1, 3, 1) == (90.0, -90.0, 180.0, 0.0)
+        return
+
+    def test_cut_matches_grid(self):
+        lat = numpy.arange(-89.5, 90.0, 1.0)
+        lon = numpy.arange(0.5, 360.0, 1.0)
+        grid = numpy.add.outer(lat, lon * 1000.0)
+
+        tile = RasterTiles.cut(lat, lon, grid, 0, 0, 0)
+        assert tile.shape == (TILE_SIZE, TILE_SIZE)
+        # Northwest pixel of the western hemisphere is lon -179.6 -> 180.5
+        assert tile[0, 0] == numpy.float32(89.5 + 180.5 * 1000.0)
+        assert not numpy.isnan(tile).any()
+        return
+
+    def test_cut_outside_grid(self):
+        lat = numpy.arange(-59.5, 60.0, 1.0)
+        lon = numpy.arange(-179.5, 180.0, 1.0)
+        grid = numpy.ones((lat.size, lon.size))
+
+        tile = RasterTiles.cut(lat, lon, grid, 1, 0, 0)
+        assert numpy.isnan(tile[0]).all()
+        assert (tile[-1] == 1.0).all()
+        return
+
+    def test_etag_matches(self):
+        etag = RasterTiles.etag("dataset", "version", 0, 1, "float32", 0, 0, 0)
+        assert etag == RasterTiles.etag("dataset", "version", 0, 1, "float32", 0, 0, 0)
+        assert etag != RasterTiles.etag("dataset", "version2", 0, 1, "float32", 0, 0, 0)
+
+        assert RasterTiles.etag_matches(etag, etag)
+        assert RasterTiles.etag_matches("W/" + etag, etag)
+        assert RasterTiles.etag_matches(f'"other", W/{etag}', etag)
+        assert RasterTiles.etag_matches("*", etag)
+        assert not RasterTiles.etag_matches('"other"', etag)
+        assert not RasterTiles.etag_matches(None, etag)
+        return
+
+    def test_encoding_round_trip(self):
+        values = numpy.array([[0.0, 1.5], [numpy.nan, 3.0]])
+        body, headers = RasterEncoding.encode(values, "uint16")
+        assert len(body) == values.size * 2
+        decoded = RasterEncoding.decode(body, headers)
+        assert numpy.isnan(decoded[1, 0])
+        numpy.testing.assert_allclose(decoded[0], values[0], atol=1e-4)
+        return
+
+    def test_cache_budget(self):
+        cache = TileCache(max_bytes=10, path=None)
+        cache.set(("a", 0, 0, 0), b"12345", {})
+        cache.set(("b", 0, 0, 0), b"12345", {})
+        cache.get(("a", 0, 0, 0))
+        cache.set(("c", 0, 0, 0), b"12345", {})
+        assert cache.get(("a", 0, 0, 0)) is not None
+        assert cache.get(("b", 0, 0, 0)) is None
+        assert cache.size_bytes == 10
+        return
+
+    def test_cache_clear_removes_disk_tiles(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = TileCache(path=Path(tmp_dir))
+            key = ("dataset", "version", 0, 1, "float32", 0, 0, 0)
+            cache.set(key, b"12345", {"ETag": '"x"'})
+            assert TileCache(path=Path(tmp_dir)).get(key) == (b"12345", {"ETag": '"x"'})
+
+            cache.clear()
+            assert cache.get(key) is None
+            assert list(Path(tmp_dir).iterdir()) == []
+        return
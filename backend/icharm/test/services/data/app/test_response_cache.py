@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from icharm.services.data.app.response_cache import (
+    ResponseCache,
+    fingerprint,
+)
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_fingerprint_ignores_key_order(self):
+        assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+        assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+        return
+
+    def test_budget_and_ttl(self):
+        cache = ResponseCache(max_bytes=10, ttl=60, path=None)
+        cache.set("a", b"12345")
+        cache.set("b", b"12345")
+        cache.set("c", b"12345")
+        assert cache.get("a") is None
+        assert cache.get("c") == b"12345"
+        assert cache.size_bytes == 10
+
+        expired = ResponseCache(max_bytes=10, ttl=0, path=None)
+        expired.set("a", b"1")
+        assert expired.get("a") is None
+        assert expired.stats()["misses"] == 1
+        return
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ResponseCache(path=Path(tmp)).set("abcdef", b"{}")
+            cache = ResponseCache(path=Path(tmp))
+            assert cache.get("abcdef") == b"{}"
+            assert cache.stats()["hitRatio"] == 1.0
+
+            cache.clear()
+            assert cache.get("abcdef") is None
+        return